@@ -4,6 +4,9 @@ Handles logging to WandB, TensorBoard, and matplotlib visualizations.
 """
 
 import os
+import queue
+import threading
+import time
 import warnings
 from typing import Dict, List, Optional
 import matplotlib.pyplot as plt
@@ -34,7 +37,8 @@ class ExperimentLogger:
     """
     
     def __init__(self, experiment_name: str, wandb_token: Optional[str] = None,
-                 log_dir: str = "logs", project_name: str = "asr-rnn-experiments"):
+                 log_dir: str = "logs", project_name: str = "asr-rnn-experiments",
+                 offline: bool = False, flush_interval: float = 5.0):
         """
         Initialize experiment logger with WandB and TensorBoard.
         
@@ -43,8 +47,11 @@ class ExperimentLogger:
             wandb_token: WandB API token for authentication (optional, loads from .env if not provided)
             log_dir: Directory for TensorBoard logs and plots
             project_name: WandB project name
+            offline: Run WandB in offline mode (sync later with `wandb sync`)
+            flush_interval: Seconds between batched flushes of the metric sinks
         """
         self.experiment_name = experiment_name
+        self.offline = offline
         self.log_dir = log_dir
         self.project_name = project_name
         
@@ -57,7 +64,9 @@ class ExperimentLogger:
         
         # Initialize WandB
         self.wandb_enabled = False
-        if WANDB_AVAILABLE:
+        if WANDB_AVAILABLE and offline:
+            self._init_wandb(None)
+        elif WANDB_AVAILABLE:
             self._init_wandb(wandb_token)
         else:
             print(f"[{experiment_name}] WandB not available, skipping WandB logging")
@@ -70,6 +79,14 @@ class ExperimentLogger:
         else:
             print(f"[{experiment_name}] TensorBoard not available, skipping TensorBoard logging")
         
+        # log_metrics() only enqueues; a background thread writes to WandB and
+        # TensorBoard and flushes TensorBoard every flush_interval seconds
+        self.flush_interval = flush_interval
+        self.dropped_metrics = 0
+        self._metrics_queue = queue.Queue(maxsize=10000)
+        self._metrics_thread = threading.Thread(target=self._write_metrics_loop, daemon=True)
+        self._metrics_thread.start()
+        
         # Storage for plotting
         self.train_losses = []
         self.val_losses = []
@@ -118,7 +135,8 @@ class ExperimentLogger:
                 wandb.init(
                     project=self.project_name,
                     name=self.experiment_name,
-                    reinit=True
+                    reinit=True,
+                    mode='offline' if self.offline else 'online'
                 )
                 self.wandb_enabled = True
                 print(f"[{self.experiment_name}] WandB initialized successfully")
@@ -154,14 +172,8 @@ class ExperimentLogger:
             print(f"[{self.experiment_name}] TensorBoard initialization failed: {e}")
             self.tensorboard_enabled = False
     
-    def log_metrics(self, metrics: Dict[str, float], step: int):
-        """
-        Log metrics to both WandB and TensorBoard.
-        
-        Args:
-            metrics: Dictionary of metric names to values
-            step: Current step/epoch number
-        """
+    def _write_metrics(self, metrics: Dict[str, float], step: int):
+        """Write one metrics record to WandB and TensorBoard (runs on the writer thread)."""
         # Log to WandB
         if self.wandb_enabled:
             try:
@@ -174,9 +186,47 @@ class ExperimentLogger:
             try:
                 for metric_name, metric_value in metrics.items():
                     self.tb_writer.add_scalar(metric_name, metric_value, step)
-                self.tb_writer.flush()
             except Exception as e:
                 print(f"[{self.experiment_name}] TensorBoard logging failed at step {step}: {e}")
+    
+    def _flush_metrics(self):
+        if self.tensorboard_enabled and self.tb_writer:
+            try:
+                self.tb_writer.flush()
+            except Exception as e:
+                print(f"[{self.experiment_name}] TensorBoard flush failed: {e}")
+    
+    def _write_metrics_loop(self):
+        """Writer thread: drain queued metrics, flushing every flush_interval seconds, until None is queued."""
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._metrics_queue.get(timeout=max(next_flush - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            if item:
+                self._write_metrics(*item)
+            if time.monotonic() >= next_flush:
+                self._flush_metrics()
+                next_flush = time.monotonic() + self.flush_interval
+        self._flush_metrics()
+    
+    def log_metrics(self, metrics: Dict[str, float], step: int):
+        """
+        Log metrics to both WandB and TensorBoard.
+        
+        Args:
+            metrics: Dictionary of metric names to values
+            step: Current step/epoch number
+        """
+        # Hand off to WandB and TensorBoard without waiting on their I/O; if the
+        # writer falls far behind, drop the record rather than stall training
+        try:
+            self._metrics_queue.put_nowait((dict(metrics), step))
+        except queue.Full:
+            self.dropped_metrics += 1
         
         # Store for plotting
         if 'train_loss' in metrics:
@@ -323,6 +373,11 @@ class ExperimentLogger:
     
     def close(self):
         """Close logging resources."""
+        # Drain queued metrics first; the writer and run are closed below
+        self._metrics_queue.put(None)
+        self._metrics_thread.join()
+        if self.dropped_metrics:
+            print(f"[{self.experiment_name}] Dropped {self.dropped_metrics} metric records (queue full)")
         if self.tensorboard_enabled and self.tb_writer:
             self.tb_writer.close()
         
@@ -2,6 +2,26 @@ import re
 from collections import Counter
 import unicodedata
 
+def analyze_line(line, special_chars, line_start_patterns, unicode_categories):
+    """Update the character pattern counters with a single raw line."""
+    # Analyze first few characters (potential line numbers)
+    first_word = line.split()[0] if line.strip() else ""
+    if first_word.isdigit():
+        line_start_patterns['LINE_NUMBER'] += 1
+    elif first_word.startswith('◆'):
+        line_start_patterns['BULLET'] += 1
+    elif first_word.startswith('"'):
+        line_start_patterns['QUOTE_START'] += 1
+    
+    # Find all special/non-alphabetic characters
+    for char in line:
+        # Skip basic alphanumeric and common punctuation
+        if not (char.isalnum() or char in ' .,!?;:\n'):
+            special_chars[char] += 1
+            # Get unicode category
+            cat = unicodedata.category(char)
+            unicode_categories[cat] += 1
+
 def analyze_dataset(file_path, num_lines=100000):
     """Analyze character patterns in the dataset."""
     
@@ -14,38 +34,17 @@ def analyze_dataset(file_path, num_lines=100000):
         for idx, line in enumerate(f):
             if idx >= num_lines:
                 break
-            
-            # Analyze first few characters (potential line numbers)
-            first_word = line.split()[0] if line.strip() else ""
-            if first_word.isdigit():
-                line_start_patterns['LINE_NUMBER'] += 1
-            elif first_word.startswith('◆'):
-                line_start_patterns['BULLET'] += 1
-            elif first_word.startswith('"'):
-                line_start_patterns['QUOTE_START'] += 1
-            
-            # Find all special/non-alphabetic characters
-            for char in line:
-                # Skip basic alphanumeric and common punctuation
-                if not (char.isalnum() or char in ' .,!?;:\n'):
-                    special_chars[char] += 1
-                    # Get unicode category
-                    cat = unicodedata.category(char)
-                    unicode_categories[cat] += 1
+            analyze_line(line, special_chars, line_start_patterns, unicode_categories)
     
     return special_chars, line_start_patterns, unicode_categories
 
-if __name__ == "__main__":
-    file_path = "Train/shona_100K.txt"
-    
-    print("Analyzing dataset...")
-    special_chars, line_starts, unicode_cats = analyze_dataset(file_path)
-    
+def print_report(special_chars, line_starts, unicode_cats, num_lines=100000):
+    """Print the analysis of analyze_dataset (or an equivalent pass over num_lines lines)."""
     print("\n" + "="*60)
     print("LINE START PATTERNS")
     print("="*60)
     for pattern, count in line_starts.most_common(10):
-        print(f"{pattern:20s}: {count:6d} ({count/1000:.1f}%)")
+        print(f"{pattern:20s}: {count:6d} ({count/max(num_lines, 1)*100:.1f}%)")
     
     print("\n" + "="*60)
     print("TOP 30 SPECIAL CHARACTERS")
@@ -62,7 +61,7 @@ if __name__ == "__main__":
     print("\n" + "="*60)
     print("RECOMMENDATIONS")
     print("="*60)
-    if line_starts.get('LINE_NUMBER', 0) > 50000:
+    if line_starts.get('LINE_NUMBER', 0) > num_lines / 2:
         print("✓ Remove line numbers at start of lines")
     if special_chars.get('◆', 0) > 100:
         print("✓ Handle bullet points (◆)")
@@ -70,3 +69,10 @@ if __name__ == "__main__":
         print("✓ Normalize smart quotes to regular quotes")
     if special_chars.get('—', 0) + special_chars.get('–', 0) > 1000:
         print("✓ Normalize em-dashes and en-dashes to hyphens")
+
+if __name__ == "__main__":
+    file_path = "Train/shona_100K.txt"
+    
+    print("Analyzing dataset...")
+    special_chars, line_starts, unicode_cats = analyze_dataset(file_path)
+    print_report(special_chars, line_starts, unicode_cats)
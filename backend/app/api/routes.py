@@ -1,16 +1,27 @@
 """
 API routes for the Transformer model server.
 """
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
 from app.api.schemas import (
     TranslationRequest, TranslationResponse,
+    BatchTranslationRequest, BatchTranslationResponse,
     GenerationRequest, GenerationResponse,
+    BatchGenerationRequest, BatchGenerationResponse,
     ModelListResponse, ModelDetailResponse, ModelInfo,
     HealthResponse, ErrorResponse
 )
-from typing import Dict, Any
+from app.core.executors import ExecutorSaturated, ExecutorTimeout
+from app.core.prometheus import REQUESTS, REQUEST_SECONDS
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, Any, AsyncIterator
 import soundfile as sf
+import asyncio
 import io
+import json
+import threading
+import time
 import numpy as np
 
 
@@ -21,15 +32,180 @@ registry = None
 translation_service = None
 generation_service = None
 asr_service = None
+executors = None
+warmup_state = None
 
 
-def set_services(reg, trans, gen, asr=None):
-    """Set service instances"""
-    global registry, translation_service, generation_service, asr_service
+def set_services(reg, trans, gen, asr=None, execs=None, warmup=None):
+    """Set service instances, the per-workload executors and the warmup state"""
+    global registry, translation_service, generation_service, asr_service, executors, warmup_state
     registry = reg
     translation_service = trans
     generation_service = gen
     asr_service = asr
+    executors = execs
+    warmup_state = warmup
+
+
+async def run_inference(workload: str, fn, *args, **kwargs):
+    """
+    Run blocking inference on the workload's bounded executor, so the event
+    loop stays free; a full executor is a 429 and a timeout a 503.
+    """
+    try:
+        return await executors[workload].run(fn, *args, **kwargs)
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ExecutorTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def run_submitted(workload: str, submit, *args, **kwargs):
+    """
+    Await work that queues itself (submit returns a Future, e.g. the
+    translation batch scheduler) under the workload's admission limit and
+    timeout, without a thread blocked on it; 429 when full, 503 on timeout.
+    """
+    try:
+        return await executors[workload].run_submitted(submit, *args, **kwargs)
+    except ExecutorSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except ExecutorTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@contextmanager
+def track_request(endpoint: str, model_id: str, client_model_id: bool = True):
+    """
+    Count the request by HTTP status and observe its latency (for streams,
+    the time until the first token is ready). Pass client_model_id=False for
+    a fixed label that is not a registry model (e.g. the ASR model).
+    """
+    # Model ids come from the client; keep unknown ones from adding label sets
+    if client_model_id and registry is not None and model_id not in registry.models:
+        model_id = "unknown"
+    start = time.perf_counter()
+    status = 200
+    try:
+        yield
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except Exception:
+        status = 500
+        raise
+    finally:
+        REQUESTS.labels(endpoint, model_id, status).inc()
+        REQUEST_SECONDS.labels(endpoint, model_id).observe(time.perf_counter() - start)
+
+
+_STREAM_END = object()
+
+
+async def _relay(first, events: asyncio.Queue, cancel: threading.Event) -> AsyncIterator[Dict[str, Any]]:
+    try:
+        event = first
+        while event is not _STREAM_END:
+            if isinstance(event, Exception):
+                raise event
+            yield event
+            event = await events.get()
+    finally:
+        # Client gone, stream finished or failed: stop the decode loop
+        cancel.set()
+
+
+async def stream_inference(workload: str, fn, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run a blocking event iterator (a service's stream()) on the workload's
+    executor and relay its events as an async iterator.
+    
+    The first event is awaited before returning, so a full executor, an
+    unknown model or a timeout still fail as a 429/404/503 before any
+    response is sent. Closing the returned iterator (e.g. when the client
+    disconnects) sets fn's cancel event, which stops decoding.
+    """
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    cancel = threading.Event()
+    
+    def produce():
+        for event in fn(cancel=cancel, **kwargs):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+    
+    def finished(task):
+        # Runs after every event produce() queued
+        if not task.cancelled() and task.exception() is not None:
+            events.put_nowait(task.exception())
+        events.put_nowait(_STREAM_END)
+    
+    task = asyncio.ensure_future(executors[workload].run(produce))
+    task.add_done_callback(finished)
+    try:
+        first = await events.get()
+    except BaseException:
+        cancel.set()
+        raise
+    
+    if isinstance(first, Exception):
+        cancel.set()
+        if isinstance(first, ExecutorSaturated):
+            raise HTTPException(status_code=429, detail=str(first), headers={"Retry-After": "1"})
+        if isinstance(first, ExecutorTimeout):
+            raise HTTPException(status_code=503, detail=str(first))
+        if isinstance(first, ValueError):
+            raise HTTPException(status_code=404, detail=str(first))
+        raise first
+    return _relay(first, events, cancel)
+
+
+def sse_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    """Server-sent events: one `event: token` per token, then `done` (or `error`)"""
+    async def body():
+        try:
+            async for event in events:
+                data = {key: value for key, value in event.items() if key != 'event'}
+                yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            await events.aclose()
+    
+    return StreamingResponse(
+        body(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def websocket_stream(websocket: WebSocket, request_schema, workload: str, fn):
+    """
+    Serve one streamed request over a WebSocket: receive a JSON request,
+    send each event as JSON (ending with `done` or `error`), then close.
+    """
+    await websocket.accept()
+    error = None
+    try:
+        request = request_schema(**await websocket.receive_json())
+        events = await stream_inference(workload, fn, **request.model_dump())
+        try:
+            async for event in events:
+                await websocket.send_json(event)
+        finally:
+            await events.aclose()
+    except WebSocketDisconnect:
+        return
+    except HTTPException as e:
+        error = {"event": "error", "status_code": e.status_code, "detail": e.detail}
+    except Exception as e:
+        error = {"event": "error", "detail": str(e)}
+    
+    try:
+        if error is not None:
+            await websocket.send_json(error)
+        await websocket.close()
+    except (WebSocketDisconnect, RuntimeError):
+        # The client has already gone
+        pass
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -42,6 +218,32 @@ async def health_check():
     }
 
 
+@router.get("/health/live")
+async def liveness():
+    """Liveness: the process is up and serving, even while warming up"""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    """
+    Readiness: 200 once warmup has finished, 503 (with its progress and
+    timings) before. The ASR model's load status is reported but does not
+    gate readiness; transcription requests wait for it instead.
+    """
+    warmup = warmup_state.snapshot() if warmup_state is not None else {"status": "ready"}
+    body = {"ready": warmup["status"] == "ready", "warmup": warmup}
+    if asr_service is not None:
+        body["asr"] = asr_service.snapshot()
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+
+@router.get("/executors")
+async def executor_stats():
+    """Queue depth, in-flight and rejected/timed-out counts of each inference executor"""
+    return {name: executor.stats() for name, executor in executors.items()}
+
+
 @router.get("/models", response_model=ModelListResponse)
 async def list_models():
     """List all available models"""
@@ -50,6 +252,12 @@ async def list_models():
     return {"models": models}
 
 
+@router.get("/models/memory")
+async def model_memory():
+    """Memory budget and resident bytes of each loaded model, least recently used first"""
+    return registry.memory_stats()
+
+
 @router.get("/models/{model_id}", response_model=ModelDetailResponse)
 async def get_model_info(model_id: str):
     """Get detailed information about a specific model"""
@@ -64,7 +272,8 @@ async def get_model_info(model_id: str):
 async def load_model(model_id: str):
     """Load a specific model"""
     try:
-        registry.load_model(model_id)
+        # Loading reads the checkpoint from disk; keep it off the event loop
+        await asyncio.to_thread(registry.load_model, model_id)
         return {"message": f"Model {model_id} loaded successfully"}
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -76,7 +285,7 @@ async def load_model(model_id: str):
 async def unload_model(model_id: str):
     """Unload a specific model to free memory"""
     try:
-        registry.unload_model(model_id)
+        await asyncio.to_thread(registry.unload_model, model_id)
         return {"message": f"Model {model_id} unloaded successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error unloading model: {str(e)}")
@@ -85,53 +294,151 @@ async def unload_model(model_id: str):
 @router.post("/translate", response_model=TranslationResponse)
 async def translate(request: TranslationRequest):
     """Translate text using the specified model"""
-    try:
-        result = translation_service.translate(
-            text=request.text,
-            model_id=request.model_id,
-            max_length=request.max_length
-        )
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
+    with track_request("translate", request.model_id):
+        try:
+            key = None
+            if translation_service.cache is not None:
+                # The lookup may cold-load the model and tokenizes the text, so it
+                # takes a slot on the bounded translation executor like inference
+                key, cached = await run_inference(
+                    "translation", translation_service.lookup,
+                    request.text, request.model_id, request.max_length
+                )
+                if cached is not None:
+                    return cached
+            # Batched with concurrent requests by the translation service
+            result = await run_submitted(
+                "translation", translation_service.submit,
+                text=request.text,
+                model_id=request.model_id,
+                max_length=request.max_length,
+                cache_key=key
+            )
+            return result
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
+
+
+@router.post("/translate/batch", response_model=BatchTranslationResponse)
+async def translate_batch(request: BatchTranslationRequest):
+    """Translate a list of texts; results come back in input order, with per-item errors"""
+    with track_request("translate_batch", request.model_id):
+        try:
+            result = await run_inference(
+                "translation", translation_service.translate_many,
+                texts=request.texts,
+                model_id=request.model_id,
+                max_length=request.max_length
+            )
+            return result
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
+
+
+@router.post("/translate/stream")
+async def translate_stream(request: TranslationRequest):
+    """Translate text, streaming tokens as server-sent events as they are decoded"""
+    with track_request("translate_stream", request.model_id):
+        try:
+            events = await stream_inference("translation", translation_service.stream, **request.model_dump())
+            return sse_response(events)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
+
+
+@router.websocket("/translate/ws")
+async def translate_ws(websocket: WebSocket):
+    """Translate text, streaming tokens over a WebSocket (send one TranslationRequest as JSON)"""
+    await websocket_stream(websocket, TranslationRequest, "translation", partial(translation_service.stream, endpoint="translate_ws"))
+
+
+@router.get("/translate/stats")
+async def translation_stats():
+    """Batch-size and queue-wait histograms of the translation batch schedulers"""
+    return {"models": translation_service.stats()}
+
+
+@router.get("/translate/cache")
+async def translation_cache_stats():
+    """Hit/miss counters, size and evictions of the translation result cache"""
+    return translation_service.cache_stats()
 
 
 @router.post("/generate", response_model=GenerationResponse)
 async def generate(request: GenerationRequest):
     """Generate text using the specified model"""
-    try:
-        result = generation_service.generate(
-            prompt=request.prompt,
-            model_id=request.model_id,
-            max_length=request.max_length,
-            temperature=request.temperature
-        )
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=404, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Generation error: {str(e)}")
+    with track_request("generate", request.model_id):
+        try:
+            result = await run_inference(
+                "generation", generation_service.generate,
+                prompt=request.prompt,
+                model_id=request.model_id,
+                max_length=request.max_length,
+                temperature=request.temperature
+            )
+            return result
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Generation error: {str(e)}")
 
 
-@router.post("/transcribe")
-async def transcribe_audio(audio: UploadFile = File(...)):
-    """
-    Transcribe audio to text using Whisper ASR
-    
-    Args:
-        audio: Audio file (supports various formats via soundfile)
-        
-    Returns:
-        JSON with transcription
-    """
-    if not asr_service:
-        raise HTTPException(status_code=503, detail="ASR service not available")
-    
+@router.post("/generate/batch", response_model=BatchGenerationResponse)
+async def generate_batch(request: BatchGenerationRequest):
+    """Generate from a list of prompts; results come back in input order, with per-item errors"""
+    with track_request("generate_batch", request.model_id):
+        try:
+            result = await run_inference(
+                "generation", generation_service.generate_many,
+                prompts=request.prompts,
+                model_id=request.model_id,
+                max_length=request.max_length,
+                temperature=request.temperature
+            )
+            return result
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Generation error: {str(e)}")
+
+
+@router.post("/generate/stream")
+async def generate_stream(request: GenerationRequest):
+    """Generate text, streaming tokens as server-sent events as they are sampled"""
+    with track_request("generate_stream", request.model_id):
+        try:
+            events = await stream_inference("generation", generation_service.stream, **request.model_dump())
+            return sse_response(events)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Generation error: {str(e)}")
+
+
+@router.websocket("/generate/ws")
+async def generate_ws(websocket: WebSocket):
+    """Generate text, streaming tokens over a WebSocket (send one GenerationRequest as JSON)"""
+    await websocket_stream(websocket, GenerationRequest, "generation", partial(generation_service.stream, endpoint="generate_ws"))
+
+
+def _transcribe_bytes(audio_bytes: bytes) -> Dict[str, Any]:
+    """Decode an uploaded audio file (via ffmpeg if soundfile can't read it) and transcribe it"""
     try:
         # Read audio file
-        audio_bytes = await audio.read()
         audio_data, sample_rate = sf.read(io.BytesIO(audio_bytes))
         
         # Transcribe
@@ -178,3 +485,29 @@ async def transcribe_audio(audio: UploadFile = File(...)):
             print(f"Error processing audio: {str(e)}")
             print(f"FFmpeg fallback failed: {str(ffmpeg_error)}")
             raise HTTPException(status_code=500, detail=f"Transcription error: {str(e)}. FFmpeg required for WebM audio.")
+
+
+@router.post("/transcribe")
+async def transcribe_audio(audio: UploadFile = File(...)):
+    """
+    Transcribe audio to text using Whisper ASR
+    
+    Args:
+        audio: Audio file (supports various formats via soundfile)
+    
+    Returns:
+        JSON with transcription
+    """
+    if not asr_service:
+        raise HTTPException(status_code=503, detail="ASR service not available")
+    
+    with track_request("transcribe", "whisper-asr", client_model_id=False):
+        if not asr_service.loaded:
+            # The first request after startup waits for the (possibly still running) model load
+            try:
+                await run_inference("asr", asr_service.ensure_loaded)
+            except RuntimeError as e:
+                raise HTTPException(status_code=503, detail=str(e))
+        audio_bytes = await audio.read()
+        # Decoding, ffmpeg and the model all block, so they run on the ASR executor
+        return await run_inference("asr", _transcribe_bytes, audio_bytes)
@@ -17,6 +17,28 @@ class TranslationResponse(BaseModel):
     model_used: str
     inference_time_ms: int
     source_text: str
+    cached: bool = False
+
+
+class BatchTranslationRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1, max_length=256, description="Texts to translate")
+    model_id: str = Field(default="translation-final", description="Model ID to use")
+    max_length: int = Field(default=100, description="Maximum translation length")
+
+
+class BatchTranslationItem(BaseModel):
+    index: int
+    source_text: str
+    translation: Optional[str] = None
+    error: Optional[str] = None
+    inference_time_ms: int
+    cached: bool = False
+
+
+class BatchTranslationResponse(BaseModel):
+    results: List[BatchTranslationItem]
+    model_used: str
+    total_time_ms: int
 
 
 # Generation schemas
@@ -36,12 +58,37 @@ class GenerationResponse(BaseModel):
     inference_time_ms: int
 
 
+class BatchGenerationRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1, max_length=64, description="Prompts for text generation")
+    model_id: str = Field(default="shona-100K-final", description="Model ID to use")
+    max_length: int = Field(default=100, description="Maximum length to generate")
+    temperature: float = Field(default=0.8, ge=0.1, le=2.0, description="Sampling temperature")
+
+
+class BatchGenerationItem(BaseModel):
+    index: int
+    prompt: str
+    generated_text: Optional[str] = None
+    error: Optional[str] = None
+    inference_time_ms: int
+
+
+class BatchGenerationResponse(BaseModel):
+    results: List[BatchGenerationItem]
+    model_used: str
+    temperature: float
+    max_length: int
+    total_time_ms: int
+
+
 # Model schemas
 class ModelInfo(BaseModel):
     model_id: str
     type: str
     metadata: Dict[str, Any]
     loaded: bool
+    pinned: bool = False
+    resident_bytes: Optional[int] = None
 
 
 class ModelListResponse(BaseModel):
@@ -2,11 +2,72 @@
 Model configurations for the application.
 """
 
+# Dynamic batching of /api/translate requests (see app/models/batching.py)
+TRANSLATION_BATCHING = {
+    "max_batch_size": 32,
+    "max_wait_ms": 5.0
+}
+
+# Translation result cache (see app/models/cache.py): an in-memory LRU under
+# max_bytes whose entries expire after ttl_s. Set db_path to an SQLite file to
+# also keep results on disk across restarts.
+TRANSLATION_CACHE = {
+    "enabled": True,
+    "max_bytes": 32 * 1024 * 1024,
+    "ttl_s": 7 * 24 * 3600,
+    "db_path": None
+}
+
+# Startup warmup (see app/core/warmup.py): pinned models plus "models" are
+# loaded load_workers at a time, then every lengths x batch_sizes synthetic
+# batch is run through them before /api/health/ready reports ready.
+WARMUP = {
+    "enabled": True,
+    "models": [],
+    "load_workers": 2,
+    "lengths": [8, 32, 64],
+    "batch_sizes": [1, 8],
+    "generate_tokens": 16
+}
+
+# Whisper ASR (see app/models/asr.py). Its imports and model are deferred
+# past startup: "background" loads it once warmup has finished, "first_use"
+# leaves it to the first /api/transcribe request.
+ASR = {
+    "enabled": True,
+    "load": "background"
+}
+
+# Inference executors per workload (see app/core/executors.py). Single
+# translations wait on the batch scheduler without taking a worker thread, so
+# the translation pool only runs batch requests and streams; requests beyond
+# max_workers + max_queue pending get a 429, and ones slower than timeout_s a 503.
+EXECUTORS = {
+    "translation": {"max_workers": 8, "max_queue": 256, "timeout_s": 30.0},
+    "generation": {"max_workers": 2, "max_queue": 16, "timeout_s": 60.0},
+    "asr": {"max_workers": 1, "max_queue": 4, "timeout_s": 120.0}
+}
+
+# Most memory (MB) the weights of loaded models may take; loading past it
+# evicts the least recently used model that is not "pinned". None: no limit.
+MODEL_MEMORY_BUDGET_MB = None
+
+# Weights shared by all uvicorn worker processes (see app/core/shared_weights.py).
+# Checkpoints without an export, and the Whisper model, are exported here once
+# and memory-mapped by every worker; falls back to the temp dir without /dev/shm.
+# Docker's default 64 MB /dev/shm is too small: run with a larger --shm-size.
+SHARED_WEIGHTS = {
+    "enabled": True,
+    "dir": "/dev/shm/transformer-weights"
+}
+
 MODEL_CONFIGS = [
     {
         "model_id": "translation-final",
         "type": "translation",
         "checkpoint_path": "../checkpoints/translation-final_best.pth.tar",
+        "export_path": "../checkpoints/translation-final.safetensors",
+        "pinned": True,
         "config": {
             "src_vocab_size": 1950,
             "trg_vocab_size": 2249,
@@ -32,6 +93,7 @@ MODEL_CONFIGS = [
         "model_id": "shona-100K-final",
         "type": "generation",
         "checkpoint_path": "../checkpoints/shona-100K-final_best.pth.tar",
+        "export_path": "../checkpoints/shona-100K-final.safetensors",
         "config": {
             "vocab_size": 58227,
             "d_model": 256,
@@ -55,6 +117,7 @@ MODEL_CONFIGS = [
         "model_id": "shona-gen-small",
         "type": "generation",
         "checkpoint_path": "../checkpoints/generation-final_best.pth.tar",
+        "export_path": "../checkpoints/generation-final.safetensors",
         "config": {
             "vocab_size": 1950,
             "d_model": 256,
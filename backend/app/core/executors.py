@@ -0,0 +1,131 @@
+"""
+Bounded executors that keep blocking inference off the asyncio event loop.
+
+Each workload type (translation, generation, ASR) gets its own thread pool,
+so a slow transcription cannot starve translations, and its own admission
+limit, so overload turns into fast 429s instead of an unbounded backlog.
+Threads rather than processes are used because the models live in this
+process's memory and PyTorch releases the GIL while it computes.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class ExecutorSaturated(Exception):
+    """The executor's queue is full; the caller should retry later (HTTP 429)"""
+
+
+class ExecutorTimeout(Exception):
+    """The task did not finish within the executor's timeout (HTTP 503)"""
+
+
+class BoundedExecutor:
+    """
+    Thread pool that admits at most max_workers running plus max_queue
+    waiting tasks.
+    
+    run() awaits a blocking callable on the pool. It raises ExecutorSaturated
+    immediately when the executor is full and ExecutorTimeout if the task
+    (including its time in the queue) takes longer than timeout_s; a timed
+    out task that has not started yet is dropped from the queue.
+    """
+    
+    def __init__(self, name: str, max_workers: int = 1, max_queue: int = 16, timeout_s: float = 60.0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self.pending = 0  # admitted and not yet finished
+        self.in_flight = 0  # currently running on a worker
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+    
+    def _call(self, fn: Callable, args, kwargs):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+    
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+            if not future.cancelled():
+                self.completed += 1
+    
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"{self.name} executor is at capacity ({self.pending} requests pending)")
+            self.pending += 1
+        future = self._pool.submit(self._call, fn, args, kwargs)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout_s)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise ExecutorTimeout(f"{self.name} request timed out after {self.timeout_s:.0f}s")
+    
+    async def run_submitted(self, submit: Callable[..., Future], *args, **kwargs) -> Any:
+        """
+        Admit a task that queues itself elsewhere - submit(*args, **kwargs)
+        returns a concurrent Future, e.g. from a batch scheduler - and await
+        it without tying up a pool thread. Admission and timeout work as in
+        run(); the task counts as in flight until its future is done.
+        """
+        with self._lock:
+            if self.pending >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"{self.name} executor is at capacity ({self.pending} requests pending)")
+            self.pending += 1
+            self.in_flight += 1
+        try:
+            future = submit(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.pending -= 1
+                self.in_flight -= 1
+            raise
+        
+        def finished(future):
+            with self._lock:
+                self.in_flight -= 1
+            self._release(future)
+        
+        future.add_done_callback(finished)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout_s)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise ExecutorTimeout(f"{self.name} request timed out after {self.timeout_s:.0f}s")
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': self.pending - self.in_flight,
+                'in_flight': self.in_flight,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+    
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def make_executors(config: Dict[str, Dict[str, Any]]) -> Dict[str, BoundedExecutor]:
+    """Build one BoundedExecutor per workload from {name: {max_workers, max_queue, timeout_s}}"""
+    return {name: BoundedExecutor(name, **options) for name, options in config.items()}
@@ -0,0 +1,301 @@
+"""
+Prometheus metrics for the API, rendered at GET /metrics.
+
+Counters and histograms keep one shard of values per thread: a thread only
+ever writes its own shard, so recording a value takes no lock (the metric's
+lock is only taken the first time a thread touches it), and a scrape sums
+the shards. Values that already live elsewhere - executor queue depths,
+cache counters, resident model memory - are read at scrape time through
+callback metrics instead of being copied on every request.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Request and phase latencies, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    # Exposition format spells the non-finite values +Inf, -Inf and NaN
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Shards:
+    """Per-thread arrays of floats, each written only by its own thread"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self._local = threading.local()
+        self._shards: List[List[float]] = []
+        self._lock = threading.Lock()
+    
+    def local(self) -> List[float]:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = [0.0] * self.size
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+    
+    def totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(values) for values in zip(*shards)] if shards else [0.0] * self.size
+
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+    
+    def inc(self, amount: float = 1.0):
+        self._shards.local()[0] += amount
+    
+    def value(self) -> float:
+        return self._shards.totals()[0]
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        # One count per bucket plus +Inf, then the sum
+        self._shards = _Shards(len(self.buckets) + 2)
+    
+    def observe(self, value: float):
+        shard = self._shards.local()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+    
+    @contextmanager
+    def time(self):
+        """Observe the seconds spent in the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+    
+    def value(self) -> Tuple[List[float], float]:
+        totals = self._shards.totals()
+        return totals[:-1], totals[-1]
+
+
+class _Metric:
+    kind = ''
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+    
+    def _new_child(self):
+        raise NotImplementedError
+    
+    def labels(self, *values: str):
+        """The child for one combination of label values, created on first use"""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+    
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+    
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. requests or tokens generated"""
+    kind = 'counter'
+    
+    def _new_child(self):
+        return _CounterChild()
+    
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value())}"
+
+
+class Histogram(_Metric):
+    """Distribution over fixed bucket upper bounds, exposed cumulatively"""
+    kind = 'histogram'
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = sorted(buckets)
+    
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+    
+    def _samples(self):
+        for key, child in list(self._children.items()):
+            counts, total = child.value()
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == '+Inf' else f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {_format_value(cumulative)}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}"
+
+
+class CallbackMetric(_Metric):
+    """
+    Gauge or counter whose values are read from elsewhere at scrape time:
+    collect() returns (label values, value) pairs.
+    """
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Tuple[Sequence[str], float]]], kind: str = 'gauge'):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+    
+    def _samples(self):
+        for key, value in self.collect():
+            if value is not None:
+                yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+    
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # A failing callback must not take the whole scrape down
+                blocks.append(f"# {metric.name} unavailable: {e}")
+        return '\n'.join(blocks) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'transformer_requests_total', 'API requests by endpoint, model and HTTP status',
+    ('endpoint', 'model', 'status')
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'transformer_request_duration_seconds', 'End-to-end API request latency',
+    ('endpoint', 'model')
+))
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    'transformer_inference_phase_seconds',
+    'Time per inference phase (tokenize, encode, prefill, decode, detokenize) of each batch, as seen by the host',
+    ('endpoint', 'model', 'phase')
+))
+TOKENS_GENERATED = REGISTRY.register(Counter(
+    'transformer_tokens_generated_total', 'Tokens produced by decoding (use rate() for tokens per second)',
+    ('endpoint', 'model')
+))
+TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    'transformer_decode_tokens_per_second', 'Decoding throughput of each batch',
+    ('endpoint', 'model'), buckets=(10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'transformer_batch_size', 'Inputs decoded together in one batch',
+    ('endpoint', 'model'), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+))
+BATCH_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'transformer_batch_queue_wait_seconds', 'Time a request waited in the batch scheduler before its batch started',
+    ('endpoint', 'model')
+))
+
+
+def _process_resident_bytes():
+    # Current RSS; /proc only exists on Linux, so report nothing elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return []
+    return [((), pages * os.sysconf('SC_PAGE_SIZE'))]
+
+
+def register_service_metrics(registry, translation_service, executors, warmup_state=None, metrics: MetricsRegistry = REGISTRY):
+    """
+    Expose the state the services already keep - executor queues, batch
+    scheduler queues, the translation cache and model memory - as callback
+    metrics read at scrape time.
+    """
+    def executor_values(field):
+        return lambda: [((name,), executor.stats()[field]) for name, executor in executors.items()]
+    
+    def cache_values(field):
+        def collect():
+            stats = translation_service.cache_stats()
+            return [((), stats[field])] if stats['enabled'] else []
+        return collect
+    
+    def cache_lookups():
+        stats = translation_service.cache_stats()
+        if not stats['enabled']:
+            return []
+        return [(('hit',), stats['hits']), (('disk_hit',), stats['disk_hits']), (('miss',), stats['misses'])]
+    
+    callbacks = [
+        ('transformer_executor_queued', 'Requests waiting for an inference executor', ('workload',), executor_values('queued'), 'gauge'),
+        ('transformer_executor_in_flight', 'Requests running on an inference executor', ('workload',), executor_values('in_flight'), 'gauge'),
+        ('transformer_executor_rejected_total', 'Requests rejected with 429 by a full executor', ('workload',), executor_values('rejected'), 'counter'),
+        ('transformer_executor_timed_out_total', 'Requests that timed out (503) on an executor', ('workload',), executor_values('timed_out'), 'counter'),
+        ('transformer_batcher_queued', 'Translation requests waiting to be batched', ('model',),
+         lambda: [((model_id,), stats['queued']) for model_id, stats in translation_service.stats().items()], 'gauge'),
+        ('transformer_translation_cache_lookups_total', 'Translation cache lookups by result', ('result',), cache_lookups, 'counter'),
+        ('transformer_translation_cache_hit_ratio', 'Share of translation cache lookups that hit', (), cache_values('hit_rate'), 'gauge'),
+        ('transformer_translation_cache_bytes', 'Estimated memory held by the translation cache', (), cache_values('bytes'), 'gauge'),
+        ('transformer_translation_cache_evictions_total', 'Translation cache entries evicted for space', (), cache_values('evictions'), 'counter'),
+        ('transformer_model_resident_bytes', 'Weight memory of each loaded model', ('model',),
+         lambda: [((entry['model_id'],), entry['resident_bytes']) for entry in registry.memory_stats()['models']], 'gauge'),
+        ('transformer_model_memory_budget_bytes', 'Memory budget for loaded models', (),
+         lambda: [((), registry.memory_stats()['budget_bytes'])], 'gauge'),
+        ('transformer_model_evictions_total', 'Models evicted to stay within the memory budget', (),
+         lambda: [((), registry.memory_stats()['evictions'])], 'counter'),
+        ('process_resident_memory_bytes', 'Resident memory of this worker process', (), _process_resident_bytes, 'gauge'),
+    ]
+    if warmup_state is not None:
+        callbacks.append(('transformer_ready', '1 once startup warmup has finished', (), lambda: [((), float(warmup_state.ready))], 'gauge'))
+    
+    for name, documentation, labelnames, collect, kind in callbacks:
+        metrics.register(CallbackMetric(name, documentation, labelnames, collect, kind))
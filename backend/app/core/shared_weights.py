@@ -0,0 +1,90 @@
+"""
+Model weights shared between uvicorn worker processes.
+
+Every worker imports app.main and would otherwise hold a private copy of
+every model. Instead, weights are written once, by whichever worker gets
+there first, to an export file in shared memory (/dev/shm, or the temp
+directory where that does not exist), and every worker maps that file.
+The mapping is copy-on-write and inference never writes to the weights, so
+all workers read the same physical pages.
+
+Only models that run on the CPU benefit: moving a model to a GPU copies it.
+"""
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+import sys
+
+# Add parent directory to path to import the export format
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from export_model import load_exported, save_exported
+
+
+def shared_weights_dir(directory: str) -> Path:
+    """The configured directory, or one in the temp directory if its parent does not exist (e.g. no /dev/shm)"""
+    path = Path(directory)
+    if not path.parent.exists():
+        path = Path(tempfile.gettempdir()) / path.name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def shared_weights_path(directory: str, name: str, version: str) -> Path:
+    """Export file of one version of a model's weights"""
+    digest = hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]
+    return shared_weights_dir(directory) / f"{name}-{digest}.safetensors"
+
+
+@contextmanager
+def _file_lock(path: Path):
+    # Imported here so the backend still starts where fcntl does not exist
+    # (Windows) when shared weights are disabled
+    import fcntl
+    with open(path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def ensure_shared_export(path: Path, write: Callable[[str], None]) -> Path:
+    """
+    Make sure the export at path exists, calling write(path) to create it.
+    
+    Workers starting together serialize on a lock file, so only the first
+    one writes and the rest wait for it and then map the result. Exports
+    of older versions of the same model are removed once the new one is
+    written; workers still mapping them keep their pages until they reload.
+    """
+    with _file_lock(path.with_suffix('.lock')):
+        if not path.exists():
+            write(str(path))
+            name = path.name.rsplit('-', 1)[0]
+            for stale in path.parent.glob(f"{name}-*.safetensors"):
+                if stale != path and stale.name.rsplit('-', 1)[0] == name:
+                    stale.unlink(missing_ok=True)
+                    stale.with_suffix('.lock').unlink(missing_ok=True)
+    return path
+
+
+def attach_shared_weights(module, path: Path):
+    """Replace module's parameters and buffers with views of the shared export at path"""
+    state_dict, _ = load_exported(str(path))
+    module.load_state_dict(state_dict, assign=True)
+    return module
+
+
+def share_module_weights(module, directory: str, name: str, version: str):
+    """
+    Swap an already loaded module's weights for shared ones: export its
+    state_dict once (first worker only), then attach every worker to it.
+    Each worker still loads the model normally first, but the private copy
+    is freed once the shared one is attached.
+    """
+    path = shared_weights_path(directory, name, version)
+    ensure_shared_export(path, lambda out: save_exported(module.state_dict(), out))
+    return attach_shared_weights(module, path)
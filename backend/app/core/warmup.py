@@ -0,0 +1,97 @@
+"""
+Startup warmup, so the first real request after a deploy is not the one that
+pays for checkpoint loading, vocabulary building and cold kernels.
+
+Warmup loads the pinned models (plus any listed in the config) in parallel,
+then runs synthetic batches at representative lengths through each one to
+prime the allocator and kernels. The server reports ready only afterwards.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+
+class WarmupState:
+    """Progress and timings of the warmup, shared with the readiness endpoint"""
+    
+    def __init__(self):
+        self.status = 'pending'  # pending -> running -> ready | failed
+        self.models: Dict[str, Dict[str, Any]] = {}
+        self.total_ms: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def ready(self) -> bool:
+        return self.status == 'ready'
+    
+    def record(self, model_id: str, **fields):
+        with self._lock:
+            self.models.setdefault(model_id, {}).update(fields)
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'status': self.status,
+                'total_ms': self.total_ms,
+                'models': {model_id: dict(fields) for model_id, fields in self.models.items()}
+            }
+
+
+def _synthetic_texts(length: int, batch_size: int) -> List[str]:
+    # Only the shapes matter; unknown words still produce `length` tokens
+    return [" ".join(["warmup"] * length)] * batch_size
+
+
+def _warm_model(model_id: str, registry, translation_service, generation_service, config: Dict[str, Any], state: WarmupState):
+    """Load one model and run the synthetic batches through it"""
+    start = time.perf_counter()
+    registry.get_model(model_id)
+    state.record(model_id, load_ms=int((time.perf_counter() - start) * 1000))
+    
+    start = time.perf_counter()
+    model_type = registry.models[model_id].type
+    for length in config['lengths']:
+        for batch_size in config['batch_sizes']:
+            texts = _synthetic_texts(length, batch_size)
+            if model_type == 'translation':
+                translation_service.translate_batch(texts, model_id, [length] * batch_size, endpoint='warmup')
+            elif model_type == 'generation':
+                generation_service.generate_batch(texts, model_id, max_length=config['generate_tokens'], temperature=1.0, endpoint='warmup')
+    state.record(model_id, warmup_ms=int((time.perf_counter() - start) * 1000))
+
+
+def run_warmup(registry, translation_service, generation_service, config: Dict[str, Any], state: WarmupState):
+    """
+    Warm up every pinned model and every model in config['models'].
+    
+    Args:
+        registry: ModelRegistry with the models registered
+        translation_service: TranslationService used for translation models
+        generation_service: GenerationService used for generation models
+        config: WARMUP settings (see app/config.py)
+        state: Updated as models finish; ends 'ready', or 'failed' if any
+            model could not be loaded or run
+    """
+    start = time.perf_counter()
+    state.status = 'running'
+    model_ids = [model_id for model_id, model_config in registry.models.items() if model_config.pinned]
+    model_ids += [model_id for model_id in config.get('models', []) if model_id not in model_ids]
+    
+    failed = False
+    with ThreadPoolExecutor(max_workers=max(1, config['load_workers']), thread_name_prefix="warmup") as pool:
+        futures = {
+            model_id: pool.submit(_warm_model, model_id, registry, translation_service, generation_service, config, state)
+            for model_id in model_ids
+        }
+        for model_id, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed = True
+                state.record(model_id, error=str(e))
+                print(f"Warmup of {model_id} failed: {e}")
+    
+    state.total_ms = int((time.perf_counter() - start) * 1000)
+    state.status = 'failed' if failed else 'ready'
+    print(f"Warmup {state.status} after {state.total_ms} ms ({len(model_ids)} models)")
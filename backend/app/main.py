@@ -3,15 +3,21 @@ FastAPI application main entry point.
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api import routes
 from app.api import auth
 from app.models.registry import ModelRegistry
 from app.models.translator import TranslationService
+from app.models.cache import TranslationCache
 from app.models.generator import GenerationService
 from app.models.asr import WhisperASRService
-from app.config import MODEL_CONFIGS
+from app.core.executors import make_executors
+from app.core.warmup import WarmupState, run_warmup
+from app.core.prometheus import REGISTRY as METRICS, register_service_metrics
+from app.config import ASR, MODEL_CONFIGS, MODEL_MEMORY_BUDGET_MB, SHARED_WEIGHTS, TRANSLATION_BATCHING, TRANSLATION_CACHE, EXECUTORS, WARMUP
 import uvicorn
 import logging
+import threading
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -34,29 +40,78 @@ app.add_middleware(
 )
 
 # Initialize model registry and services
-registry = ModelRegistry(device='auto')
-translation_service = TranslationService(registry)
+# With `uvicorn --workers N`, every worker runs this module; shared weights
+# keep that from multiplying model memory by N
+shared_weights_dir = SHARED_WEIGHTS["dir"] if SHARED_WEIGHTS["enabled"] else None
+registry = ModelRegistry(device='auto', memory_budget_mb=MODEL_MEMORY_BUDGET_MB, shared_weights_dir=shared_weights_dir)
+cache_options = {key: value for key, value in TRANSLATION_CACHE.items() if key != "enabled"}
+translation_cache = TranslationCache(**cache_options) if TRANSLATION_CACHE["enabled"] else None
+translation_service = TranslationService(registry, cache=translation_cache, **TRANSLATION_BATCHING)
 generation_service = GenerationService(registry)
+# Blocking inference runs on bounded per-workload thread pools
+executors = make_executors(EXECUTORS)
 
-# Initialize ASR service (optional - only if model exists)
+# Initialize ASR service (optional - only if model exists). This only finds
+# the adapters; the model itself is loaded after startup (see ASR in config)
 asr_service = None
-try:
-    asr_service = WhisperASRService(device='cpu')  # Use CPU for Mac
-    logger.info(f"ASR service initialized with model: {asr_service.base_model_name}")
-except Exception as e:
-    logger.warning(f"ASR service not available: {e}")
+if ASR["enabled"]:
+    try:
+        asr_service = WhisperASRService(device='cpu', shared_weights_dir=shared_weights_dir)  # Use CPU for Mac
+        logger.info(f"ASR service found model: {asr_service.base_model_name} (load: {ASR['load']})")
+    except Exception as e:
+        logger.warning(f"ASR service not available: {e}")
 
 # Register all models and inject services
 for config in MODEL_CONFIGS:
     registry.register_model(config)
 
-routes.set_services(registry, translation_service, generation_service, asr_service)
+# Readiness stays false until the warmup has finished
+warmup_state = WarmupState()
+
+routes.set_services(registry, translation_service, generation_service, asr_service, executors, warmup_state)
+register_service_metrics(registry, translation_service, executors, warmup_state)
 
 # Include routers
 app.include_router(routes.router, prefix="/api")
 app.include_router(auth.router, prefix="/api/auth", tags=["authentication"])
 
 
+def warm_up():
+    """Run the warmup, then load the ASR model if configured to load in the background"""
+    if WARMUP["enabled"]:
+        run_warmup(registry, translation_service, generation_service, WARMUP, warmup_state)
+    else:
+        warmup_state.status = "ready"
+    # After the warmup, so loading Whisper never delays readiness
+    if asr_service is not None and ASR["load"] == "background":
+        try:
+            asr_service.ensure_loaded()
+            logger.info(f"ASR model loaded in {asr_service.load_ms} ms")
+        except RuntimeError as e:
+            logger.warning(str(e))
+
+
+@app.on_event("startup")
+def start_warmup():
+    """Warm up models in the background, so liveness answers while it runs"""
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+@app.on_event("shutdown")
+def shutdown_inference():
+    """Drop queued inference work, let the worker threads exit and close the cache"""
+    for executor in executors.values():
+        executor.shutdown()
+    if translation_cache is not None:
+        translation_cache.close()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics of this worker process"""
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -65,9 +120,19 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/api/health",
+            "metrics": "/metrics",
+            "live": "/api/health/live",
+            "ready": "/api/health/ready",
+            "executors": "/api/executors",
             "models": "/api/models",
+            "models_memory": "/api/models/memory",
             "translate": "/api/translate",
+            "translate_batch": "/api/translate/batch",
+            "translate_stream": "/api/translate/stream",
+            "translate_cache": "/api/translate/cache",
             "generate": "/api/generate",
+            "generate_batch": "/api/generate/batch",
+            "generate_stream": "/api/generate/stream",
             "transcribe": "/api/transcribe" if asr_service else None
         }
     }
@@ -1,26 +1,42 @@
 """
 Whisper ASR Service for Shona-accented English
+
+transformers, peft and torchaudio take seconds to import and Whisper longer
+to load, so both wait until the model is first needed: constructing the
+service only locates the adapter directory, and the API starts serving
+before any of it happens (see ensure_loaded).
 """
+import json
+import threading
+import time
 import torch
-from transformers import WhisperProcessor, WhisperForConditionalGeneration
-from peft import PeftModel, PeftConfig
-import torchaudio
 import numpy as np
 from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.core.shared_weights import share_module_weights
 
 
 class WhisperASRService:
     """Service for speech-to-text using trained Whisper model"""
     
-    def __init__(self, model_dir: str = "./whisper-small-asr-shona-lora", device: str = "cpu"):
+    def __init__(
+        self,
+        model_dir: str = "./whisper-small-asr-shona-lora",
+        device: str = "cpu",
+        shared_weights_dir: Optional[str] = None
+    ):
         """
         Initialize the ASR service with a trained Whisper model
         
         Args:
             model_dir: Path to the LoRA model directory
             device: Device to run inference on ('cpu', 'cuda', 'mps')
+            shared_weights_dir: If set (and running on CPU), worker processes
+                share one copy of the weights there (see app/core/shared_weights.py)
         """
         self.device = device
+        self.shared_weights_dir = shared_weights_dir
         self.model_dir = Path(model_dir)
         
         # Check current and parent directories
@@ -40,13 +56,58 @@ class WhisperASRService:
                 else:
                     raise ValueError(f"Model directory not found: {model_dir}")
         
-        self._load_model()
+        # Read from the adapter config directly, so it is known without peft
+        with open(self.model_dir / "adapter_config.json", 'r') as f:
+            self.base_model_name = json.load(f)["base_model_name_or_path"]
+        
+        self.processor = None
+        self.model = None
+        self.status = 'not_loaded'  # not_loaded -> loading -> ready | failed
+        self.error: Optional[str] = None
+        self.load_ms: Optional[int] = None
+        self._load_lock = threading.Lock()
+    
+    @property
+    def loaded(self) -> bool:
+        return self.status == 'ready'
+    
+    def ensure_loaded(self):
+        """
+        Load the model if it is not loaded yet. Concurrent callers wait for
+        the one load in progress; a failed load is not retried and raises
+        RuntimeError here and on every later call.
+        """
+        if self.status == 'ready':
+            return
+        with self._load_lock:
+            if self.status == 'failed':
+                raise RuntimeError(f"ASR model failed to load: {self.error}")
+            if self.status == 'ready':
+                return
+            self.status = 'loading'
+            start = time.perf_counter()
+            try:
+                self._load_model()
+            except Exception as e:
+                self.status = 'failed'
+                self.error = str(e)
+                raise RuntimeError(f"ASR model failed to load: {e}") from e
+            self.load_ms = int((time.perf_counter() - start) * 1000)
+            self.status = 'ready'
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Load status, for the readiness endpoint"""
+        return {
+            'status': self.status,
+            'model': self.base_model_name,
+            'load_ms': self.load_ms,
+            'error': self.error
+        }
     
     def _load_model(self):
         """Load the Whisper model with LoRA adapters"""
-        # Load config and base model
-        config = PeftConfig.from_pretrained(str(self.model_dir))
-        self.base_model_name = config.base_model_name_or_path
+        from transformers import WhisperProcessor, WhisperForConditionalGeneration
+        from peft import PeftModel
         
         # Load processor
         self.processor = WhisperProcessor.from_pretrained(
@@ -59,8 +120,17 @@ class WhisperASRService:
         base_model = WhisperForConditionalGeneration.from_pretrained(self.base_model_name)
         self.model = PeftModel.from_pretrained(base_model, str(self.model_dir))
         self.model.eval()
-        self.model.to(self.device)
         
+        if self.shared_weights_dir is not None and self.device == "cpu":
+            share_module_weights(self.model, self.shared_weights_dir, "whisper-asr", self._weights_version())
+        self.model.to(self.device)
+    
+    def _weights_version(self) -> str:
+        """Base model name plus size and modification time of every adapter file"""
+        files = sorted(path for path in self.model_dir.iterdir() if path.is_file())
+        stamps = [f"{path.name}:{path.stat().st_size:x}:{path.stat().st_mtime_ns:x}" for path in files]
+        return "|".join([self.base_model_name] + stamps)
+    
     def preprocess_audio(self, audio_data: np.ndarray, sample_rate: int) -> np.ndarray:
         """
         Preprocess audio data for Whisper
@@ -81,6 +151,7 @@ class WhisperASRService:
             
         # Resample to 16kHz if needed
         if sample_rate != 16000:
+            import torchaudio
             resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
             audio_tensor = resampler(audio_tensor)
             
@@ -98,6 +169,8 @@ class WhisperASRService:
         Returns:
             Transcribed text
         """
+        self.ensure_loaded()
+        
         if audio_path:
             # Load from file
             import soundfile as sf
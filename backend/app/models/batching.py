@@ -0,0 +1,191 @@
+"""
+Dynamic micro-batching for model inference.
+
+Requests submitted to a BatchScheduler are queued and handed to a single
+worker thread, which groups whatever arrives within a short window (or
+until the batch is full) and runs the group as one batch. Every request
+gets its own Future, resolved with its row of the batch result.
+
+run_sorted_batches() serves explicit batch requests: it sorts the inputs
+by length, runs them in fixed-size batches and restores the input order.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+from app.core.prometheus import BATCH_QUEUE_WAIT_SECONDS, BATCH_SIZE
+
+
+def _snapshot(child, baseline, scale: float = 1.0) -> Dict[str, Any]:
+    """
+    Counts per bucket (keyed by upper bound, '+Inf' for overflow), total
+    count and mean of a Prometheus histogram child since baseline (its
+    value() when the scheduler started), with bounds and mean times scale
+    """
+    counts, total = child.value()
+    counts = [int(now - then) for now, then in zip(counts, baseline[0])]
+    total -= baseline[1]
+    count = sum(counts)
+    labels = [f'{bound * scale:g}' for bound in child.buckets] + ['+Inf']
+    return {
+        'buckets': dict(zip(labels, counts)),
+        'count': count,
+        'mean': scale * total / count if count else 0.0
+    }
+
+
+class _Request:
+    __slots__ = ('payload', 'future', 'enqueued')
+    
+    def __init__(self, payload: Any):
+        self.payload = payload
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class BatchScheduler:
+    """
+    Collects requests for one model and runs them in batches.
+    
+    The worker waits for a request, then keeps collecting until
+    max_batch_size requests are queued or max_wait_ms has passed since that
+    first request arrived, and calls process_batch(payloads), which must
+    return one result per payload in order. Requests that queued up while
+    the previous batch ran are taken without waiting. If process_batch
+    raises, every request of the batch fails with that exception.
+    
+    Batch sizes and queue waits are recorded in the transformer_batch_size
+    and transformer_batch_queue_wait_seconds histograms, labelled with
+    endpoint and name (the model id), so process_batch must not record the
+    batch size again.
+    """
+    _CLOSE = object()
+    
+    def __init__(
+        self,
+        name: str,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        endpoint: str = 'batch'
+    ):
+        self.name = name
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batch_sizes = BATCH_SIZE.labels(endpoint, name)
+        self.queue_wait = BATCH_QUEUE_WAIT_SECONDS.labels(endpoint, name)
+        # The histograms are process-wide; stats() reports this scheduler's share
+        self._baselines = (self.batch_sizes.value(), self.queue_wait.value())
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+    
+    def submit(self, payload: Any) -> Future:
+        """Queue a request; the returned Future resolves to its result"""
+        request = _Request(payload)
+        self._queue.put(request)
+        return request.future
+    
+    def _collect(self, first: _Request):
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._CLOSE:
+                # Finish this batch, then stop
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+    
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is self._CLOSE:
+                break
+            batch = self._collect(first)
+            
+            # Skip requests whose caller has cancelled them
+            now = time.monotonic()
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            for request in batch:
+                self.queue_wait.observe(now - request.enqueued)
+            self.batch_sizes.observe(len(batch))
+            
+            try:
+                results = self.process_batch([r.payload for r in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name}: got {len(results)} results for a batch of {len(batch)}")
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': 1000 * self.max_wait,
+            'queued': self._queue.qsize(),
+            'batch_size': _snapshot(self.batch_sizes, self._baselines[0]),
+            'queue_wait_ms': _snapshot(self.queue_wait, self._baselines[1], scale=1000)
+        }
+    
+    def close(self):
+        """Run what is already queued, then stop the worker"""
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+
+
+def run_sorted_batches(
+    items: List[Any],
+    run_batch: Callable[[List[Any]], List[Any]],
+    key: Callable[[Any], int],
+    batch_size: int = 32
+) -> List[Dict[str, Any]]:
+    """
+    Run a list of inputs through run_batch in batches of similar key (e.g. length).
+    
+    Args:
+        items: Inputs, in the caller's order
+        run_batch: Returns one result per input of a batch, in order
+        key: Sort key, so each batch holds inputs of similar size
+        batch_size: Largest batch passed to run_batch
+    
+    Returns:
+        One {'result', 'time_ms'} or {'error', 'time_ms'} dict per input, in
+        input order. time_ms is the time of the batch the input ran in. If a
+        batch raises, its inputs are retried one at a time so that a bad
+        input only fails itself.
+    """
+    order = sorted(range(len(items)), key=lambda i: key(items[i]))
+    outcomes: List[Dict[str, Any]] = [None] * len(items)
+    for start in range(0, len(order), batch_size):
+        chunk = order[start:start + batch_size]
+        batch_start = time.perf_counter()
+        try:
+            results = run_batch([items[i] for i in chunk])
+            elapsed_ms = 1000 * (time.perf_counter() - batch_start)
+            for i, result in zip(chunk, results):
+                outcomes[i] = {'result': result, 'time_ms': elapsed_ms}
+            continue
+        except Exception:
+            pass
+        for i in chunk:
+            item_start = time.perf_counter()
+            try:
+                outcomes[i] = {'result': run_batch([items[i]])[0]}
+            except Exception as e:
+                outcomes[i] = {'error': str(e)}
+            outcomes[i]['time_ms'] = 1000 * (time.perf_counter() - item_start)
+    return outcomes
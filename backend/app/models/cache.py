@@ -0,0 +1,166 @@
+"""
+Translation result cache.
+
+Translations are cached in memory under an LRU order with a byte budget and
+a TTL, optionally backed by an SQLite file so results survive restarts.
+Keys include the model's weights version, so a reloaded checkpoint never
+serves translations from the old one.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Rough per-entry bookkeeping cost (OrderedDict slot, tuple, floats)
+_ENTRY_OVERHEAD = 120
+
+
+def make_key(model_id: str, version: str, token_ids: Sequence[int], params: Dict[str, Any]) -> str:
+    """
+    Cache key for one translation.
+    
+    Args:
+        model_id: ID of the translation model
+        version: Version of the model's weights (see ModelRegistry.model_version)
+        token_ids: Source text encoded by the model's tokenizer, so texts that
+            differ only in case, spacing or unknown words share an entry
+        params: Decoding parameters (e.g. max_length)
+    """
+    return json.dumps([model_id, version, list(token_ids), params], sort_keys=True, separators=(',', ':'))
+
+
+class TranslationCache:
+    """
+    Thread-safe LRU cache of translations with a memory budget and TTL.
+    
+    Entries are evicted least recently used first once their estimated size
+    exceeds max_bytes, and are treated as missing ttl_s seconds after they
+    were stored. With db_path, every entry is also written to SQLite and
+    memory misses fall back to it.
+    """
+    
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, ttl_s: float = 7 * 24 * 3600, db_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.db_path = db_path
+        # key -> (model_id, version, value, expires, size)
+        self._entries: "OrderedDict[str, Tuple[str, str, str, float, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "key TEXT PRIMARY KEY, model_id TEXT, version TEXT, value TEXT, expires REAL)"
+            )
+            self._db.execute("DELETE FROM translations WHERE expires <= ?", (time.time(),))
+            self._db.commit()
+    
+    def get(self, key: str) -> Optional[str]:
+        """The cached translation for key, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[3] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2]
+                self._remove(key)
+                self.expirations += 1
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT model_id, version, value, expires FROM translations WHERE key = ? AND expires > ?",
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    self.disk_hits += 1
+                    self._insert(key, *row)
+                    return row[2]
+            
+            self.misses += 1
+            return None
+    
+    def put(self, key: str, model_id: str, version: str, value: str):
+        """Store a translation in memory (and on disk when enabled)"""
+        expires = time.time() + self.ttl_s
+        with self._lock:
+            self._insert(key, model_id, version, value, expires)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                    (key, model_id, version, value, expires)
+                )
+                self._db.commit()
+    
+    def invalidate(self, model_id: str, keep_version: Optional[str] = None):
+        """Drop a model's entries, except those of keep_version (its current weights)"""
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry[0] == model_id and entry[1] != keep_version
+            ]
+            for key in stale:
+                self._remove(key)
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM translations WHERE model_id = ? AND version IS NOT ?",
+                    (model_id, keep_version)
+                )
+                self._db.commit()
+    
+    def clear(self):
+        """Drop every entry, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+    
+    def _insert(self, key: str, model_id: str, version: str, value: str, expires: float):
+        if key in self._entries:
+            self._remove(key)
+        size = len(key) + len(value.encode('utf-8')) + _ENTRY_OVERHEAD
+        self._entries[key] = (model_id, version, value, expires, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+    
+    def _remove(self, key: str):
+        self.bytes -= self._entries.pop(key)[4]
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_s': self.ttl_s,
+                'persistent': self._db is not None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+    
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
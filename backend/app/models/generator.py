@@ -2,22 +2,103 @@
 Generation service using the Language Model.
 """
 import torch
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional
+from pathlib import Path
+import sys
+import threading
 import time
 
+# Add parent directory to path to import the shared decoding code
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from model import init_cache, lm_decode_step
+from app.models.batching import run_sorted_batches
+from app.core.prometheus import BATCH_SIZE, PHASE_SECONDS, TOKENS_GENERATED, TOKENS_PER_SECOND
+
+# Longest context fed back to the model while generating
+CONTEXT_WINDOW = 512
+
 
 class GenerationService:
     """Service for generating text using loaded models"""
     
-    def __init__(self, registry):
+    def __init__(self, registry, max_batch_size: int = 16):
         self.registry = registry
+        self.max_batch_size = max_batch_size
+    
+    def _prefill(self, model, input_ids: torch.Tensor, pad_id: int):
+        """Run a (left-padded) context through the model into a fresh KV cache"""
+        not_pad = input_ids != pad_id
+        positions = (not_pad.long().cumsum(dim=1) - 1).clamp(min=0)
+        cache = init_cache(model)
+        logits = lm_decode_step(model, input_ids, cache, positions, key_mask=not_pad)
+        return logits[:, -1, :], cache, not_pad, positions[:, -1:] + 1
+    
+    @torch.no_grad()
+    def _sample(
+        self,
+        model_id: str,
+        model,
+        input_ids: torch.Tensor,
+        pad_id: int,
+        max_length: int,
+        temperature: float,
+        cancel: Optional[threading.Event] = None,
+        endpoint: str = 'generate'
+    ) -> Iterator[torch.Tensor]:
+        """
+        Yield the next token of every row, up to max_length times.
+        
+        Keys/values of earlier positions are cached, so each step only runs
+        the newest token and per-token latency stays flat. Past
+        CONTEXT_WINDOW tokens the model conditions on the last
+        CONTEXT_WINDOW only, with positions counted from the window start,
+        so every further step re-encodes that window into a fresh cache and
+        costs as much as uncached decoding. Stops early once cancel is set.
+        """
+        BATCH_SIZE.labels(endpoint, model_id).observe(input_ids.size(0))
+        with PHASE_SECONDS.labels(endpoint, model_id, 'prefill').time():
+            logits, cache, key_mask, positions = self._prefill(model, input_ids[:, -CONTEXT_WINDOW:], pad_id)
+        
+        # Time spent decoding, not counting the consumer's time between tokens
+        decode_seconds = 0.0
+        sampled = 0
+        try:
+            for step in range(max_length):
+                if cancel is not None and cancel.is_set():
+                    return
+                step_start = time.perf_counter()
+                probs = torch.softmax(logits / temperature, dim=-1)
+                next_token = torch.multinomial(probs, num_samples=1)
+                tokens = next_token.squeeze(1)
+                decode_seconds += time.perf_counter() - step_start
+                sampled += tokens.numel()
+                yield tokens
+                if step == max_length - 1:
+                    return
+                
+                step_start = time.perf_counter()
+                input_ids = torch.cat([input_ids, next_token], dim=1)
+                if key_mask.size(1) >= CONTEXT_WINDOW:
+                    logits, cache, key_mask, positions = self._prefill(model, input_ids[:, -CONTEXT_WINDOW:], pad_id)
+                else:
+                    key_mask = torch.cat([key_mask, torch.ones_like(next_token, dtype=torch.bool)], dim=1)
+                    logits = lm_decode_step(model, next_token, cache, positions, key_mask)[:, -1, :]
+                    positions = positions + 1
+                decode_seconds += time.perf_counter() - step_start
+        finally:
+            PHASE_SECONDS.labels(endpoint, model_id, 'decode').observe(decode_seconds)
+            TOKENS_GENERATED.labels(endpoint, model_id).inc(sampled)
+            if decode_seconds > 0:
+                TOKENS_PER_SECOND.labels(endpoint, model_id).observe(sampled / decode_seconds)
     
     def generate(
         self,
         prompt: str,
         model_id: str,
         max_length: int = 100,
-        temperature: float = 0.8
+        temperature: float = 0.8,
+        endpoint: str = 'generate'
     ) -> Dict[str, Any]:
         """
         Generate text from a prompt using the specified model.
@@ -27,7 +108,8 @@ class GenerationService:
             model_id: ID of the generation model to use
             max_length: Maximum length to generate
             temperature: Sampling temperature (higher = more random)
-            
+            endpoint: API endpoint the metrics are labelled with
+        
         Returns:
             Dictionary with generated text and metadata
         """
@@ -39,40 +121,21 @@ class GenerationService:
         device = self.registry.device
         
         # Tokenize prompt
-        tokens = tokenizer.encode(prompt)
-        input_ids = torch.tensor([tokens], dtype=torch.long).to(device)
+        with PHASE_SECONDS.labels(endpoint, model_id, 'tokenize').time():
+            tokens = tokenizer.encode(prompt)
+            input_ids = torch.tensor([tokens], dtype=torch.long).to(device)
         
         generated = tokens.copy()
         
-        with torch.no_grad():
-            for _ in range(max_length):
-                # Create causal mask
-                size = input_ids.size(1)
-                mask = torch.triu(torch.ones(size, size), diagonal=1).type_as(input_ids).float().unsqueeze(0).unsqueeze(0) == 0
-                pad_mask = (input_ids != 0).unsqueeze(1).unsqueeze(2)
-                mask = mask & pad_mask
-                
-                # Get predictions
-                output = model(input_ids, mask)
-                
-                # Get next token probabilities (last position)
-                logits = output[:, -1, :] / temperature
-                probs = torch.softmax(logits, dim=-1)
-                
-                # Sample from distribution
-                next_token = torch.multinomial(probs, num_samples=1).item()
-                
-                # Stop if we hit EOS
-                if next_token == tokenizer.eos_token_id:
-                    break
-                
-                generated.append(next_token)
-                
-                # Update input (use sliding window if too long)
-                if len(generated) > 512:
-                    input_ids = torch.tensor([generated[-512:]], dtype=torch.long).to(device)
-                else:
-                    input_ids = torch.tensor([generated], dtype=torch.long).to(device)
+        for next_token in self._sample(model_id, model, input_ids, tokenizer.pad_token_id, max_length, temperature,
+                                       endpoint=endpoint):
+            next_token = next_token.item()
+            
+            # Stop if we hit EOS
+            if next_token == tokenizer.eos_token_id:
+                break
+            
+            generated.append(next_token)
         
         generated_text = tokenizer.decode(generated, skip_special_tokens=True)
         inference_time = int((time.time() - start_time) * 1000)  # milliseconds
@@ -85,3 +148,158 @@ class GenerationService:
             'max_length': max_length,
             'inference_time_ms': inference_time
         }
+    
+    def stream(
+        self,
+        prompt: str,
+        model_id: str,
+        max_length: int = 100,
+        temperature: float = 0.8,
+        cancel: Optional[threading.Event] = None,
+        endpoint: str = 'generate_stream'
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Generate like generate(), yielding each token as soon as it is sampled.
+        
+        Args:
+            cancel: Set (e.g. when the client disconnects) to stop decoding
+                before the next token
+            endpoint: API endpoint the metrics are labelled with
+        
+        Yields:
+            {'event': 'token', 'index', 'token_id', 'text'} per token, where
+            text is the piece it adds to the decoded output, then one
+            {'event': 'done', ...} with generate()'s fields plus
+            time_to_first_token_ms, tokens_generated and cancelled
+        """
+        start_time = time.time()
+        
+        model = self.registry.get_model(model_id)
+        tokenizer = self.registry.get_tokenizers(model_id)
+        device = self.registry.device
+        
+        with PHASE_SECONDS.labels(endpoint, model_id, 'tokenize').time():
+            tokens = tokenizer.encode(prompt)
+            input_ids = torch.tensor([tokens], dtype=torch.long).to(device)
+        generated = tokens.copy()
+        text = tokenizer.decode(generated, skip_special_tokens=True)
+        first_token_ms = None
+        
+        samples = self._sample(model_id, model, input_ids, tokenizer.pad_token_id, max_length, temperature, cancel, endpoint)
+        for index, next_token in enumerate(samples):
+            next_token = next_token.item()
+            if first_token_ms is None:
+                first_token_ms = int((time.time() - start_time) * 1000)
+            if next_token == tokenizer.eos_token_id:
+                break
+            
+            generated.append(next_token)
+            # Decode the whole output and send only what is new, so the pieces
+            # always add up to the same text as generate()
+            new_text = tokenizer.decode(generated, skip_special_tokens=True)
+            yield {'event': 'token', 'index': index, 'token_id': next_token, 'text': new_text[len(text):]}
+            text = new_text
+        
+        yield {
+            'event': 'done',
+            'generated_text': text,
+            'model_used': model_id,
+            'prompt': prompt,
+            'temperature': temperature,
+            'max_length': max_length,
+            'tokens_generated': len(generated) - len(tokens),
+            'time_to_first_token_ms': first_token_ms,
+            'inference_time_ms': int((time.time() - start_time) * 1000),
+            'cancelled': cancel is not None and cancel.is_set()
+        }
+    
+    def generate_batch(
+        self,
+        prompts: List[str],
+        model_id: str,
+        max_length: int = 100,
+        temperature: float = 0.8,
+        endpoint: str = 'generate_batch'
+    ) -> List[str]:
+        """
+        Sample continuations of several prompts in one batch.
+        
+        Prompts are left-padded so every row's next token lands in the same
+        column; each row gets positions counted from its own first token and
+        never attends to padding, so it is sampled as if generated alone.
+        Rows stop independently at EOS. The metrics are labelled with endpoint.
+        """
+        model = self.registry.get_model(model_id)
+        tokenizer = self.registry.get_tokenizers(model_id)
+        device = self.registry.device
+        pad_id = tokenizer.pad_token_id
+        
+        with PHASE_SECONDS.labels(endpoint, model_id, 'tokenize').time():
+            encoded = [tokenizer.encode(prompt) for prompt in prompts]
+            width = max(len(tokens) for tokens in encoded)
+            input_ids = torch.full((len(encoded), width), pad_id, dtype=torch.long)
+            for i, tokens in enumerate(encoded):
+                input_ids[i, width - len(tokens):] = torch.tensor(tokens, dtype=torch.long)
+            input_ids = input_ids.to(device)
+        
+        finished = torch.zeros(len(encoded), dtype=torch.bool, device=device)
+        new_tokens = []
+        
+        for next_token in self._sample(model_id, model, input_ids, pad_id, max_length, temperature, endpoint=endpoint):
+            finished |= next_token == tokenizer.eos_token_id
+            if finished.all():
+                break
+            # Rows keep sampling after their EOS; everything from it on is dropped below
+            new_tokens.append(next_token)
+        
+        generated = torch.stack(new_tokens, dim=1).tolist() if new_tokens else [[] for _ in encoded]
+        texts = []
+        for tokens, row in zip(encoded, generated):
+            if tokenizer.eos_token_id in row:
+                row = row[:row.index(tokenizer.eos_token_id)]
+            texts.append(tokenizer.decode(tokens + row, skip_special_tokens=True))
+        return texts
+    
+    def generate_many(
+        self,
+        prompts: List[str],
+        model_id: str,
+        max_length: int = 100,
+        temperature: float = 0.8
+    ) -> Dict[str, Any]:
+        """
+        Generate from a list of prompts for a batch request.
+        
+        Prompts are sorted by length and sampled max_batch_size at a time; a
+        prompt that fails is reported in its own entry without failing the others.
+        
+        Returns:
+            Dictionary with one result per prompt (in input order) and metadata
+        """
+        start_time = time.time()
+        # An unknown model fails the whole request
+        self.registry.get_model(model_id)
+        
+        outcomes = run_sorted_batches(
+            prompts,
+            lambda batch: self.generate_batch(batch, model_id, max_length, temperature),
+            key=lambda prompt: len(prompt.split()),
+            batch_size=self.max_batch_size
+        )
+        
+        return {
+            'results': [
+                {
+                    'index': i,
+                    'prompt': prompt,
+                    'generated_text': outcome.get('result'),
+                    'error': outcome.get('error'),
+                    'inference_time_ms': int(outcome['time_ms'])
+                }
+                for i, (prompt, outcome) in enumerate(zip(prompts, outcomes))
+            ],
+            'model_used': model_id,
+            'temperature': temperature,
+            'max_length': max_length,
+            'total_time_ms': int((time.time() - start_time) * 1000)
+        }
@@ -1,18 +1,23 @@
 """
 Model Registry for managing multiple Transformer models.
-Supports lazy loading and hot-swapping of models.
+Supports lazy loading and hot-swapping of models, with an optional memory
+budget enforced by evicting the least recently used unpinned models.
 """
 import torch
 import json
-from typing import Dict, Optional, Any
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Any
 from pathlib import Path
 import sys
+import threading
 
 # Add parent directory to path to import model classes
 sys.path.append(str(Path(__file__).parent.parent.parent.parent))
 
 from model import make_model, make_lm_model
 from text_data import Tokenizer
+from export_model import load_exported_model, export_checkpoint, vocab_sha256
+from app.core.shared_weights import ensure_shared_export, shared_weights_path
 
 
 class ModelConfig:
@@ -21,18 +26,58 @@ class ModelConfig:
         self.model_id = config_dict['model_id']
         self.type = config_dict['type']  # 'translation' or 'generation'
         self.checkpoint_path = config_dict['checkpoint_path']
+        # Optional inference-only export (see export_model.py), preferred when present
+        self.export_path = config_dict.get('export_path')
         self.config = config_dict['config']
         self.metadata = config_dict.get('metadata', {})
         self.tokenizer_config = config_dict.get('tokenizer_config', {})
+        # Pinned models are never evicted to make room for others
+        self.pinned = config_dict.get('pinned', False)
+
+
+def resident_bytes(model: torch.nn.Module) -> int:
+    """Bytes held by a model's parameters and buffers"""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
 
 
 class ModelRegistry:
     """Central registry for managing Transformer models"""
     
-    def __init__(self, device: str = 'auto'):
+    def __init__(
+        self,
+        device: str = 'auto',
+        memory_budget_mb: Optional[float] = None,
+        shared_weights_dir: Optional[str] = None
+    ):
+        """
+        Args:
+            device: 'auto', or a torch device name
+            memory_budget_mb: Most weight memory loaded models may hold; loading
+                beyond it evicts least recently used unpinned models. None
+                means no limit.
+            shared_weights_dir: Where checkpoints without an export are
+                exported once and mapped by every worker process (see
+                app/core/shared_weights.py). None loads private copies, as
+                does running on a GPU.
+        """
+        self.shared_weights_dir = shared_weights_dir
         self.models: Dict[str, ModelConfig] = {}
         self.loaded_models: Dict[str, torch.nn.Module] = {}
         self.tokenizers: Dict[str, Any] = {}
+        # Version of the weights each loaded model came from
+        self.versions: Dict[str, str] = {}
+        self._load_listeners: List[Callable[[str, str], None]] = []
+        
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb is not None else None
+        self.resident_bytes: Dict[str, int] = {}
+        # Loaded model ids, least recently used first
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self.evictions = 0
+        # Guards the dictionaries above; each model also has a lock so that
+        # concurrent first requests load it only once
+        self._lock = threading.RLock()
+        self._load_locks: Dict[str, threading.Lock] = {}
         
         # Auto-detect device
         if device == 'auto':
@@ -53,37 +98,146 @@ class ModelRegistry:
         self.models[model_config.model_id] = model_config
         print(f"Registered model: {model_config.model_id} ({model_config.type})")
     
+    def _loaded(self, model_id: str) -> Optional[torch.nn.Module]:
+        """The model if it is loaded (marking it most recently used), else None"""
+        with self._lock:
+            model = self.loaded_models.get(model_id)
+            if model is not None:
+                self._lru.move_to_end(model_id)
+            return model
+    
     def load_model(self, model_id: str) -> torch.nn.Module:
-        """Load a model and its tokenizers"""
+        """
+        Load a model and its tokenizers.
+        
+        Concurrent calls for the same model share one load. With a memory
+        budget, least recently used unpinned models are evicted to make room.
+        """
         if model_id not in self.models:
             raise ValueError(f"Model {model_id} not registered")
         
-        if model_id in self.loaded_models:
+        model = self._loaded(model_id)
+        if model is not None:
             print(f"Model {model_id} already loaded")
-            return self.loaded_models[model_id]
+            return model
         
-        config = self.models[model_id]
-        print(f"Loading model {model_id}...")
-        
-        # Load tokenizers first
-        self._load_tokenizers(model_id, config)
-        
-        # Load model based on type
-        if config.type == 'translation':
-            model = self._load_translation_model(config)
-        elif config.type == 'generation':
-            model = self._load_generation_model(config)
-        else:
-            raise ValueError(f"Unknown model type: {config.type}")
-        
-        model.to(self.device)
-        model.eval()
-        
-        self.loaded_models[model_id] = model
-        print(f"Successfully loaded model {model_id}")
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+        with load_lock:
+            # Another request may have loaded it while we waited
+            model = self._loaded(model_id)
+            if model is not None:
+                return model
+            
+            config = self.models[model_id]
+            print(f"Loading model {model_id}...")
+            
+            # Load tokenizers first (kept across evictions, so reloads skip this)
+            if model_id not in self.tokenizers:
+                self._load_tokenizers(model_id, config)
+            
+            # Load model based on type
+            if config.export_path and Path(config.export_path).exists():
+                weights_path = config.export_path
+                # The export holds just the weights, so its size is a good estimate
+                self._evict_over_budget(Path(weights_path).stat().st_size, keep=model_id)
+                model = self._load_exported_model(model_id, config, config.export_path)
+            elif self.shared_weights_dir is not None and self.device.type == 'cpu' and config.type in ('translation', 'generation'):
+                # Only CPU models share pages; moving to a GPU would copy the weights anyway
+                weights_path = config.checkpoint_path
+                shared_path = self._shared_export(model_id, config)
+                self._evict_over_budget(shared_path.stat().st_size, keep=model_id)
+                model = self._load_exported_model(model_id, config, str(shared_path))
+            elif config.type == 'translation':
+                weights_path = config.checkpoint_path
+                model = self._load_translation_model(config)
+            elif config.type == 'generation':
+                weights_path = config.checkpoint_path
+                model = self._load_generation_model(config)
+            else:
+                raise ValueError(f"Unknown model type: {config.type}")
+            
+            model.to(self.device)
+            model.eval()
+            
+            with self._lock:
+                self.loaded_models[model_id] = model
+                self.resident_bytes[model_id] = resident_bytes(model)
+                self._lru[model_id] = None
+                self.versions[model_id] = self._weights_version(weights_path)
+            self._evict_over_budget(keep=model_id)
+            print(f"Successfully loaded model {model_id} ({self.resident_bytes[model_id] / 1024**2:.1f} MB)")
+            
+            for listener in self._load_listeners:
+                listener(model_id, self.versions[model_id])
         
         return model
     
+    def _evict_over_budget(self, incoming: int = 0, keep: Optional[str] = None):
+        """
+        Evict least recently used unpinned models (never keep) until the
+        resident models plus incoming bytes fit the memory budget.
+        """
+        if self.memory_budget_bytes is None:
+            return
+        evicted = []
+        with self._lock:
+            for model_id in list(self._lru):
+                if sum(self.resident_bytes.values()) + incoming <= self.memory_budget_bytes:
+                    break
+                if model_id == keep or self.models[model_id].pinned:
+                    continue
+                # Requests already holding the model keep their reference;
+                # its memory is freed once they finish
+                del self.loaded_models[model_id]
+                del self.resident_bytes[model_id]
+                del self._lru[model_id]
+                self.evictions += 1
+                evicted.append(model_id)
+            resident = sum(self.resident_bytes.values())
+        
+        for model_id in evicted:
+            print(f"Evicted model {model_id} to stay within the memory budget")
+        if evicted and self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+        if resident + incoming > self.memory_budget_bytes:
+            print(
+                f"Warning: {resident + incoming} bytes of models exceed the memory budget of "
+                f"{self.memory_budget_bytes} bytes (the rest are pinned or in use)"
+            )
+    
+    @staticmethod
+    def _weights_version(path: str) -> str:
+        stat = Path(path).stat()
+        return f"{Path(path).name}:{stat.st_size:x}:{stat.st_mtime_ns:x}"
+    
+    def _shared_export(self, model_id: str, config: ModelConfig) -> Path:
+        """Export the model's checkpoint to shared memory, unless another worker already has"""
+        path = shared_weights_path(
+            self.shared_weights_dir, model_id, self._weights_version(config.checkpoint_path)
+        )
+        tokenizers = self.tokenizers[model_id]
+        if config.type == 'generation':
+            tokenizers = {'vocab': tokenizers}
+        return ensure_shared_export(
+            path,
+            lambda out: export_checkpoint(config.checkpoint_path, out, config.type, config.config, tokenizers)
+        )
+    
+    def add_load_listener(self, listener: Callable[[str, str], None]):
+        """Call listener(model_id, version) every time a model is (re)loaded"""
+        self._load_listeners.append(listener)
+    
+    def model_version(self, model_id: str) -> str:
+        """
+        Version of a loaded model's weights: the file name, size and
+        modification time, so it changes whenever the checkpoint is replaced
+        but stays the same across restarts.
+        """
+        if model_id not in self.versions:
+            raise ValueError(f"Model {model_id} not loaded")
+        return self.versions[model_id]
+    
     def _load_tokenizers(self, model_id: str, config: ModelConfig):
         """Load tokenizers for the model"""
         tokenizer_config = config.tokenizer_config
@@ -112,6 +266,23 @@ class ModelRegistry:
             
             self.tokenizers[model_id] = tokenizer
     
+    def _load_exported_model(self, model_id: str, config: ModelConfig, path: str) -> torch.nn.Module:
+        """Load a model from a memory-mapped export, checking it matches the registry config"""
+        model, metadata = load_exported_model(path)
+        
+        if metadata['model_type'] != config.type or metadata['config'] != config.config:
+            raise ValueError(f"Export {path} does not match the config of {model_id}")
+        
+        tokenizers = self.tokenizers[model_id]
+        if config.type == 'generation':
+            tokenizers = {'vocab': tokenizers}
+        for name, tokenizer in tokenizers.items():
+            expected = metadata.get(f'vocab_sha256_{name}')
+            if expected is not None and expected != vocab_sha256(tokenizer):
+                raise ValueError(f"Vocabulary '{name}' of {model_id} differs from the one it was exported with")
+        
+        return model
+    
     def _load_translation_model(self, config: ModelConfig) -> torch.nn.Module:
         """Load a translation model"""
         model_config = config.config
@@ -125,8 +296,8 @@ class ModelRegistry:
             dropout=model_config['dropout']
         )
         
-        # Load checkpoint
-        checkpoint = torch.load(config.checkpoint_path, map_location=self.device)
+        # Load checkpoint (mmap'd, so the optimizer state is never read in)
+        checkpoint = torch.load(config.checkpoint_path, map_location='cpu', mmap=True, weights_only=False)
         model.load_state_dict(checkpoint['state_dict'])
         
         return model
@@ -143,19 +314,23 @@ class ModelRegistry:
             dropout=model_config['dropout']
         )
         
-        # Load checkpoint
-        checkpoint = torch.load(config.checkpoint_path, map_location=self.device)
+        # Load checkpoint (mmap'd, so the optimizer state is never read in)
+        checkpoint = torch.load(config.checkpoint_path, map_location='cpu', mmap=True, weights_only=False)
         model.load_state_dict(checkpoint['state_dict'])
         
         return model
     
     def unload_model(self, model_id: str):
         """Unload a model to free memory"""
-        if model_id in self.loaded_models:
-            del self.loaded_models[model_id]
-            if model_id in self.tokenizers:
-                del self.tokenizers[model_id]
-            
+        with self._lock:
+            loaded = model_id in self.loaded_models
+            if loaded:
+                del self.loaded_models[model_id]
+                self.resident_bytes.pop(model_id, None)
+                self._lru.pop(model_id, None)
+                self.tokenizers.pop(model_id, None)
+                self.versions.pop(model_id, None)
+        if loaded:
             # Clear CUDA cache if using GPU
             if self.device.type == 'cuda':
                 torch.cuda.empty_cache()
@@ -164,9 +339,27 @@ class ModelRegistry:
     
     def get_model(self, model_id: str) -> torch.nn.Module:
         """Get a model, loading it if necessary"""
-        if model_id not in self.loaded_models:
-            self.load_model(model_id)
-        return self.loaded_models[model_id]
+        model = self._loaded(model_id)
+        if model is None:
+            model = self.load_model(model_id)
+        return model
+    
+    def memory_stats(self) -> Dict[str, Any]:
+        """Memory budget, resident bytes per loaded model (least recently used first) and evictions"""
+        with self._lock:
+            return {
+                'budget_bytes': self.memory_budget_bytes,
+                'resident_bytes': sum(self.resident_bytes.values()),
+                'evictions': self.evictions,
+                'models': [
+                    {
+                        'model_id': model_id,
+                        'resident_bytes': self.resident_bytes[model_id],
+                        'pinned': self.models[model_id].pinned
+                    }
+                    for model_id in self._lru
+                ]
+            }
     
     def get_tokenizers(self, model_id: str):
         """Get tokenizers for a model"""
@@ -181,7 +374,9 @@ class ModelRegistry:
                 'model_id': model_id,
                 'type': config.type,
                 'metadata': config.metadata,
-                'loaded': model_id in self.loaded_models
+                'loaded': model_id in self.loaded_models,
+                'pinned': config.pinned,
+                'resident_bytes': self.resident_bytes.get(model_id)
             }
             for model_id, config in self.models.items()
         }
@@ -2,15 +2,134 @@
 Translation service using the Transformer model.
 """
 import torch
-from typing import Dict, Any
+from concurrent.futures import Future
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from pathlib import Path
+import sys
+import threading
 import time
 
+# Add parent directory to path to import the shared decoding code
+sys.path.append(str(Path(__file__).parent.parent.parent.parent))
+
+from model import greedy_decode, init_cache, translation_decode_step
+from app.models.batching import BatchScheduler, run_sorted_batches
+from app.models.cache import TranslationCache, make_key
+from app.core.prometheus import BATCH_SIZE, PHASE_SECONDS, TOKENS_GENERATED, TOKENS_PER_SECOND
+
 
 class TranslationService:
     """Service for translating text using loaded models"""
     
-    def __init__(self, registry):
+    def __init__(
+        self,
+        registry,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        cache: Optional[TranslationCache] = None
+    ):
+        """
+        Args:
+            registry: ModelRegistry holding the translation models
+            max_batch_size: Most requests decoded together in one batch
+            max_wait_ms: How long a request may wait for others to batch with
+            cache: Optional result cache consulted before decoding
+        """
         self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.schedulers: Dict[str, BatchScheduler] = {}
+        self._lock = threading.Lock()
+        self.cache = cache
+        if cache is not None:
+            # A reloaded model drops the translations of its previous weights
+            registry.add_load_listener(lambda model_id, version: cache.invalidate(model_id, keep_version=version))
+    
+    def _cache_key(self, model_id: str, text: str, max_length: int) -> str:
+        """Cache key of a translation; loads the model if needed"""
+        self.registry.get_model(model_id)
+        src_tokenizer = self.registry.get_tokenizers(model_id)['src']
+        return make_key(
+            model_id, self.registry.model_version(model_id),
+            src_tokenizer.encode(text), {'max_length': max_length}
+        )
+    
+    def _scheduler(self, model_id: str) -> BatchScheduler:
+        """The model's batch scheduler, created on first use"""
+        if model_id not in self.registry.models:
+            raise ValueError(f"Model {model_id} not registered")
+        with self._lock:
+            if model_id not in self.schedulers:
+                self.schedulers[model_id] = BatchScheduler(
+                    model_id,
+                    lambda requests: self._run_batch(model_id, requests),
+                    max_batch_size=self.max_batch_size,
+                    max_wait_ms=self.max_wait_ms,
+                    endpoint='translate'
+                )
+            return self.schedulers[model_id]
+    
+    def _run_batch(self, model_id: str, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Only /translate (and translate()) submit to the batch scheduler,
+        # which has already recorded the batch size
+        translations = self.translate_batch(
+            [r['text'] for r in requests], model_id, [r['max_length'] for r in requests],
+            endpoint='translate', record_batch_size=False
+        )
+        end_time = time.time()
+        if self.cache is not None:
+            version = self.registry.model_version(model_id)
+            for r, translation in zip(requests, translations):
+                if r['cache_key'] is not None:
+                    self.cache.put(r['cache_key'], model_id, version, translation)
+        return [
+            {
+                'translation': translation,
+                'model_used': model_id,
+                # Includes the time the request waited to be batched
+                'inference_time_ms': int((end_time - r['submitted']) * 1000),
+                'source_text': r['text'],
+                'cached': False
+            }
+            for r, translation in zip(requests, translations)
+        ]
+    
+    def lookup(self, text: str, model_id: str, max_length: int = 100) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Look a translation up in the cache; loads the model if needed.
+        
+        Returns:
+            (cache key, cached result in the form translate() returns, or
+            None on a miss); (None, None) when caching is disabled
+        """
+        if self.cache is None:
+            return None, None
+        start_time = time.time()
+        key = self._cache_key(model_id, text, max_length)
+        translation = self.cache.get(key)
+        if translation is None:
+            return key, None
+        return key, {
+            'translation': translation,
+            'model_used': model_id,
+            'inference_time_ms': int((time.time() - start_time) * 1000),
+            'source_text': text,
+            'cached': True
+        }
+    
+    def submit(self, text: str, model_id: str, max_length: int = 100, cache_key: Optional[str] = None) -> Future:
+        """
+        Queue a translation to be decoded in a batch with concurrent requests.
+        
+        Args:
+            cache_key: Key from lookup(); the result is cached under it
+        
+        Returns:
+            Future resolving to the same dictionary as translate()
+        """
+        return self._scheduler(model_id).submit(
+            {'text': text, 'max_length': max_length, 'submitted': time.time(), 'cache_key': cache_key}
+        )
     
     def translate(
         self,
@@ -25,55 +144,219 @@ class TranslationService:
             text: Source text to translate
             model_id: ID of the translation model to use
             max_length: Maximum length of translation
-            
+        
         Returns:
             Dictionary with translation and metadata
         """
-        start_time = time.time()
+        key, cached = self.lookup(text, model_id, max_length)
+        if cached is not None:
+            return cached
+        return self.submit(text, model_id, max_length, cache_key=key).result()
+    
+    def translate_batch(
+        self,
+        texts: List[str],
+        model_id: str,
+        max_lengths: List[int],
+        endpoint: str = 'translate_batch',
+        record_batch_size: bool = True
+    ) -> List[str]:
+        """
+        Translate several texts with one padded, batched greedy decode.
         
-        # Get model and tokenizers
+        Rows stop independently at EOS; row i keeps at most max_lengths[i]
+        tokens, exactly as if it had been translated on its own. The metrics
+        are labelled with endpoint; record_batch_size=False leaves the batch
+        size to the caller (the batch scheduler records its own).
+        """
         model = self.registry.get_model(model_id)
         tokenizers = self.registry.get_tokenizers(model_id)
         src_tokenizer = tokenizers['src']
         trg_tokenizer = tokenizers['trg']
         
         device = self.registry.device
+        if record_batch_size:
+            BATCH_SIZE.labels(endpoint, model_id).observe(len(texts))
         
-        # Encode source text
-        src_ids = torch.LongTensor([src_tokenizer.encode(text)]).to(device)
-        src_mask = (src_ids != 0).unsqueeze(1).unsqueeze(2)
+        # Encode and right-pad the sources
+        with PHASE_SECONDS.labels(endpoint, model_id, 'tokenize').time():
+            encoded = [src_tokenizer.encode(text) for text in texts]
+            src_ids = torch.full((len(encoded), max(len(ids) for ids in encoded)), src_tokenizer.pad_token_id, dtype=torch.long)
+            for i, ids in enumerate(encoded):
+                src_ids[i, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+            src_ids = src_ids.to(device)
+            src_mask = (src_ids != src_tokenizer.pad_token_id).unsqueeze(1).unsqueeze(2)
         
-        # Encode
         with torch.no_grad():
+            with PHASE_SECONDS.labels(endpoint, model_id, 'encode').time():
+                memory = model.encode(src_ids, src_mask)
+            decode_start = time.perf_counter()
+            ys = greedy_decode(
+                model, src_ids, src_mask, max_len=max(max_lengths) + 1,
+                start_symbol=trg_tokenizer.sos_token_id, end_symbol=trg_tokenizer.eos_token_id,
+                pad_symbol=trg_tokenizer.pad_token_id, memory=memory
+            )
+            rows = ys[:, 1:].tolist()
+            decode_seconds = time.perf_counter() - decode_start
+        
+        translations = []
+        n_tokens = 0
+        with PHASE_SECONDS.labels(endpoint, model_id, 'detokenize').time():
+            for row, max_length in zip(rows, max_lengths):
+                row = row[:max_length]
+                if trg_tokenizer.eos_token_id in row:
+                    row = row[:row.index(trg_tokenizer.eos_token_id)]
+                n_tokens += len(row)
+                translations.append(trg_tokenizer.decode(row, skip_special_tokens=True))
+        
+        PHASE_SECONDS.labels(endpoint, model_id, 'decode').observe(decode_seconds)
+        TOKENS_GENERATED.labels(endpoint, model_id).inc(n_tokens)
+        if decode_seconds > 0:
+            TOKENS_PER_SECOND.labels(endpoint, model_id).observe(n_tokens / decode_seconds)
+        return translations
+    
+    @torch.no_grad()
+    def stream(
+        self,
+        text: str,
+        model_id: str,
+        max_length: int = 100,
+        cancel: Optional[threading.Event] = None,
+        endpoint: str = 'translate_stream'
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Translate text on its own (not through the batch scheduler), yielding
+        each token as soon as it is decoded.
+        
+        Args:
+            cancel: Set (e.g. when the client disconnects) to stop decoding
+                before the next token
+            endpoint: API endpoint the metrics are labelled with
+        
+        Yields:
+            {'event': 'token', 'index', 'token_id', 'text'} per token, where
+            text is the piece it adds to the decoded translation, then one
+            {'event': 'done', ...} with translate()'s fields plus
+            time_to_first_token_ms, tokens_generated and cancelled
+        """
+        start_time = time.time()
+        
+        model = self.registry.get_model(model_id)
+        tokenizers = self.registry.get_tokenizers(model_id)
+        src_tokenizer = tokenizers['src']
+        trg_tokenizer = tokenizers['trg']
+        device = self.registry.device
+        
+        with PHASE_SECONDS.labels(endpoint, model_id, 'tokenize').time():
+            src_ids = torch.tensor([src_tokenizer.encode(text)], dtype=torch.long).to(device)
+            src_mask = (src_ids != src_tokenizer.pad_token_id).unsqueeze(1).unsqueeze(2)
+        with PHASE_SECONDS.labels(endpoint, model_id, 'encode').time():
             memory = model.encode(src_ids, src_mask)
+        cache = init_cache(model)
         
-        # Greedy decoding
-        ys = torch.ones(1, 1).fill_(trg_tokenizer.sos_token_id).type_as(src_ids)
+        next_word = torch.full((1, 1), trg_tokenizer.sos_token_id, dtype=torch.long, device=device)
+        generated = []
+        translation = ''
+        first_token_ms = None
+        decode_seconds = 0.0
         
-        for _ in range(max_length):
-            with torch.no_grad():
-                out = model.decode(
-                    memory, src_mask, ys,
-                    torch.triu(torch.ones(1, ys.size(1), ys.size(1), device=device), diagonal=1) == 0
-                )
-            
-            prob = out[:, -1]
-            _, next_word = torch.max(prob, dim=1)
-            next_word = next_word.data[0]
-            
-            if next_word == trg_tokenizer.eos_token_id:
+        for index in range(max_length):
+            if cancel is not None and cancel.is_set():
+                break
+            step_start = time.perf_counter()
+            logits = translation_decode_step(model, memory, src_mask, next_word, cache)
+            next_word = logits[:, -1].argmax(dim=-1, keepdim=True)
+            token_id = next_word.item()
+            decode_seconds += time.perf_counter() - step_start
+            if first_token_ms is None:
+                first_token_ms = int((time.time() - start_time) * 1000)
+            if token_id == trg_tokenizer.eos_token_id:
                 break
             
-            ys = torch.cat([ys, torch.ones(1, 1).type_as(src_ids).fill_(next_word)], dim=1)
+            generated.append(token_id)
+            # Decode the whole output and send only what is new, so the pieces
+            # always add up to the same text as translate()
+            new_translation = trg_tokenizer.decode(generated, skip_special_tokens=True)
+            yield {'event': 'token', 'index': index, 'token_id': token_id, 'text': new_translation[len(translation):]}
+            translation = new_translation
+        
+        PHASE_SECONDS.labels(endpoint, model_id, 'decode').observe(decode_seconds)
+        TOKENS_GENERATED.labels(endpoint, model_id).inc(len(generated))
+        if decode_seconds > 0:
+            TOKENS_PER_SECOND.labels(endpoint, model_id).observe(len(generated) / decode_seconds)
+        
+        yield {
+            'event': 'done',
+            'translation': translation,
+            'model_used': model_id,
+            'source_text': text,
+            'tokens_generated': len(generated),
+            'time_to_first_token_ms': first_token_ms,
+            'inference_time_ms': int((time.time() - start_time) * 1000),
+            'cancelled': cancel is not None and cancel.is_set()
+        }
+    
+    def translate_many(self, texts: List[str], model_id: str, max_length: int = 100) -> Dict[str, Any]:
+        """
+        Translate a list of texts for a batch request.
+        
+        Cached texts are answered from the cache; the rest are sorted by
+        length and decoded max_batch_size at a time, so each batch carries
+        little padding. A text that fails is reported in its own entry
+        without failing the others.
         
-        # Decode to text
-        translation = trg_tokenizer.decode(ys[0].tolist(), skip_special_tokens=True)
+        Returns:
+            Dictionary with one result per text (in input order) and metadata
+        """
+        start_time = time.time()
+        # An unknown model fails the whole request
+        self.registry.get_model(model_id)
         
-        inference_time = int((time.time() - start_time) * 1000)  # milliseconds
+        outcomes: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+        keys = None
+        if self.cache is not None:
+            keys = [self._cache_key(model_id, text, max_length) for text in texts]
+            for i, key in enumerate(keys):
+                translation = self.cache.get(key)
+                if translation is not None:
+                    outcomes[i] = {'result': translation, 'time_ms': 0.0, 'cached': True}
+        
+        misses = [i for i, outcome in enumerate(outcomes) if outcome is None]
+        computed = run_sorted_batches(
+            [texts[i] for i in misses],
+            lambda batch: self.translate_batch(batch, model_id, [max_length] * len(batch)),
+            key=lambda text: len(text.split()),
+            batch_size=self.max_batch_size
+        )
+        for i, outcome in zip(misses, computed):
+            outcomes[i] = outcome
+            if keys is not None and 'result' in outcome:
+                self.cache.put(keys[i], model_id, self.registry.model_version(model_id), outcome['result'])
         
         return {
-            'translation': translation,
+            'results': [
+                {
+                    'index': i,
+                    'source_text': text,
+                    'translation': outcome.get('result'),
+                    'error': outcome.get('error'),
+                    'inference_time_ms': int(outcome['time_ms']),
+                    'cached': outcome.get('cached', False)
+                }
+                for i, (text, outcome) in enumerate(zip(texts, outcomes))
+            ],
             'model_used': model_id,
-            'inference_time_ms': inference_time,
-            'source_text': text
+            'total_time_ms': int((time.time() - start_time) * 1000)
         }
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and size of the result cache"""
+        if self.cache is None:
+            return {'enabled': False}
+        return {'enabled': True, **self.cache.stats()}
+    
+    def stats(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait histograms per model"""
+        with self._lock:
+            schedulers = dict(self.schedulers)
+        return {model_id: scheduler.stats() for model_id, scheduler in schedulers.items()}
@@ -0,0 +1,89 @@
+"""
+Translation throughput under concurrent load, with and without dynamic batching.
+
+Runs in-process against the registry (no HTTP), from the backend directory:
+
+    python benchmark_batching.py --clients 50 --requests 1000
+
+Each client thread sends translate() calls back to back. The unbatched run
+uses max_batch_size=1, which is the old one-request-at-a-time behaviour.
+"""
+import argparse
+import itertools
+import threading
+import time
+
+from app.config import MODEL_CONFIGS, TRANSLATION_BATCHING
+from app.models.registry import ModelRegistry
+from app.models.translator import TranslationService
+
+
+def run_load(service, model_id, sentences, clients, requests, max_length):
+    """Return (requests/s, {sentence: translation}) for `requests` calls from `clients` threads"""
+    work = iter(itertools.islice(itertools.cycle(sentences), requests))
+    lock = threading.Lock()
+    outputs = {}
+    
+    def client():
+        while True:
+            with lock:
+                text = next(work, None)
+            if text is None:
+                return
+            result = service.translate(text, model_id, max_length)
+            outputs[text] = result['translation']
+    
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests / (time.perf_counter() - start), outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of /api/translate's service with and without batching")
+    parser.add_argument('--model_id', type=str, default='translation-final')
+    parser.add_argument('--input', type=str, default='../Test/shona_test.txt', help='Sentences to translate, one per line')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--max_length', type=int, default=100)
+    parser.add_argument('--max_batch_size', type=int, default=TRANSLATION_BATCHING['max_batch_size'])
+    parser.add_argument('--max_wait_ms', type=float, default=TRANSLATION_BATCHING['max_wait_ms'])
+    args = parser.parse_args()
+    
+    registry = ModelRegistry(device='auto')
+    for config in MODEL_CONFIGS:
+        registry.register_model(config)
+    registry.load_model(args.model_id)
+    
+    with open(args.input, 'r', encoding='utf-8') as f:
+        sentences = [line.strip() for line in f if line.strip()]
+    
+    rows = []
+    results = {}
+    for label, max_batch_size in (('unbatched', 1), ('batched', args.max_batch_size)):
+        service = TranslationService(registry, max_batch_size=max_batch_size, max_wait_ms=args.max_wait_ms)
+        # Warm up the model and allocator outside the timed run
+        service.translate(sentences[0], args.model_id, args.max_length)
+        print(f"Running {label} ({args.clients} clients, {args.requests} requests)...")
+        throughput, results[label] = run_load(
+            service, args.model_id, sentences, args.clients, args.requests, args.max_length
+        )
+        stats = service.stats()[args.model_id]
+        rows.append((label, throughput, stats['batch_size']['mean'], stats['queue_wait_ms']['mean']))
+    
+    mismatches = sum(results['batched'][text] != results['unbatched'][text] for text in results['unbatched'])
+    baseline = rows[0][1]
+    print("\n" + "=" * 64)
+    print(f"TRANSLATION THROUGHPUT ({args.clients} concurrent clients, {registry.device})")
+    print("=" * 64)
+    print(f"{'Mode':>10} | {'Req/s':>8} | {'Speedup':>7} | {'Mean batch':>10} | {'Mean wait ms':>12}")
+    for label, throughput, batch_size, wait in rows:
+        print(f"{label:>10} | {throughput:>8.1f} | {throughput / baseline:>6.2f}x | {batch_size:>10.1f} | {wait:>12.1f}")
+    print(f"\nTranslations differing between modes: {mismatches} of {len(results['unbatched'])}")
+
+
+if __name__ == "__main__":
+    main()
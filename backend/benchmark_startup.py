@@ -0,0 +1,139 @@
+"""
+API cold start: import time of app.main and time until the server first
+answers a health check, then until it reports ready.
+
+Runs from the backend directory, starting fresh interpreters and servers:
+
+    python benchmark_startup.py --runs 3
+
+Import time is measured with `python -X importtime -c "import app.main"`,
+which also gives the slowest top-level imports. The server is started with
+uvicorn on a free port and polled until /api/health/live answers (first
+healthy response) and /api/health/ready returns 200 (warmup finished).
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+# Cold-start budget (see DEPLOYMENT.md)
+BUDGET_S = {'import': 5.0, 'live': 10.0, 'ready': 60.0}
+
+
+def measure_import(top):
+    """Return (seconds to import app.main, [(seconds, module)] of the slowest `top` top-level imports)"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app.main'],
+        capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import app.main failed:\n{result.stderr[-2000:]}")
+    
+    # Lines look like "import time:  self [us] | cumulative | imported package", nested by indent
+    modules = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)', line)
+        if match and not match.group(3):
+            modules.append((int(match.group(2)) / 1e6, match.group(4)))
+    return elapsed, sorted(modules, reverse=True)[:top]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get_status(url):
+    """(HTTP status, JSON body) of a GET to url, or (None, None) if nothing is listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'null')
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None, None
+
+
+def measure_server(timeout):
+    """Start uvicorn and return (seconds to first live response, seconds to ready or None, readiness body)"""
+    port = free_port()
+    base = f"http://127.0.0.1:{port}/api/health"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    live = ready = body = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"Server exited with code {server.returncode}")
+            if live is None:
+                status, _ = get_status(f"{base}/live")
+                if status == 200:
+                    live = time.perf_counter() - start
+            else:
+                status, body = get_status(f"{base}/ready")
+                if status == 200:
+                    ready = time.perf_counter() - start
+                    break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    if live is None:
+        raise RuntimeError(f"Server did not answer {base}/live within {timeout} s")
+    return live, ready, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and time to first healthy response of the API")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10, help='Slowest top-level imports to list')
+    parser.add_argument('--timeout', type=float, default=300.0, help='Seconds to wait for readiness per run')
+    parser.add_argument('--import_only', action='store_true', help='Skip starting the server')
+    args = parser.parse_args()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    
+    rows = {'import': [], 'live': [], 'ready': []}
+    slowest = []
+    for run in range(args.runs):
+        print(f"Run {run + 1}/{args.runs}...")
+        elapsed, slowest = measure_import(args.top)
+        rows['import'].append(elapsed)
+        if not args.import_only:
+            live, ready, body = measure_server(args.timeout)
+            rows['live'].append(live)
+            if ready is not None:
+                rows['ready'].append(ready)
+            else:
+                print(f"  not ready after {args.timeout} s: {body}")
+    
+    print("\n" + "=" * 64)
+    print(f"API COLD START ({args.runs} runs)")
+    print("=" * 64)
+    labels = {'import': 'import app.main', 'live': 'first live response', 'ready': 'ready'}
+    print(f"{'Stage':>20} | {'Median s':>8} | {'Max s':>7} | {'Budget s':>8} | {'OK':>3}")
+    for stage, values in rows.items():
+        if not values:
+            continue
+        within = max(values) <= BUDGET_S[stage]
+        print(f"{labels[stage]:>20} | {statistics.median(values):>8.2f} | {max(values):>7.2f} | {BUDGET_S[stage]:>8.1f} | {'yes' if within else 'NO':>3}")
+    
+    print("\nSlowest top-level imports (last run):")
+    for seconds, module in slowest:
+        print(f"  {seconds:>7.3f} s  {module}")
+
+
+if __name__ == "__main__":
+    main()
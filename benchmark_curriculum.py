@@ -0,0 +1,94 @@
+"""
+Wall-clock time to a target validation loss: uniform shuffling vs length
+bucketing vs a length curriculum, each a full train.py run in its own process.
+
+The target defaults to the best validation loss the uniform run reaches, so
+the table shows how much sooner (if at all) the other schedules get there.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+VARIANTS = {
+    'uniform': [],
+    'bucketed': ['--bucket_batches'],
+    'curriculum': ['--curriculum_epochs', '{curriculum_epochs}'],
+    'curriculum+bucketed': ['--curriculum_epochs', '{curriculum_epochs}', '--bucket_batches'],
+}
+
+def read_validations(metrics_path):
+    """Return (elapsed_sec, valid_loss) for every full validation pass in a metrics file."""
+    points = []
+    with open(metrics_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if 'valid_loss' in record and 'elapsed_sec' in record:
+                points.append((record['elapsed_sec'], record['valid_loss']))
+    return points
+
+def time_to_target(points, target):
+    return next((elapsed for elapsed, loss in points if loss <= target), None)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time-to-target validation loss of length-based training schedules")
+    parser.add_argument('--variants', type=str, nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--curriculum_epochs', type=int, default=4)
+    parser.add_argument('--curriculum_start', type=float, default=0.2)
+    parser.add_argument('--val_every', type=int, default=0,
+                        help='Validate every N optimizer steps for a finer time resolution (0: per epoch)')
+    parser.add_argument('--target_loss', type=float, default=None,
+                        help="Validation loss to reach (default: the uniform run's best)")
+    parser.add_argument('--batch_size', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out_dir', type=str, default='benchmarks/curriculum')
+    parser.add_argument('train_args', nargs=argparse.REMAINDER, help='Extra train.py arguments, after --')
+    args = parser.parse_args()
+    
+    os.makedirs(args.out_dir, exist_ok=True)
+    data_cache = os.path.join(args.out_dir, 'data.pt')
+    extra = [a for a in args.train_args if a != '--']
+    shared = [
+        '--epochs', str(args.epochs), '--batch_size', str(args.batch_size), '--seed', str(args.seed),
+        '--val_every', str(args.val_every), '--curriculum_start', str(args.curriculum_start),
+        '--data_cache', data_cache, '--log_backends', 'jsonl', '--log_dir', args.out_dir
+    ] + extra
+    # Tokenize once so no variant pays for it
+    subprocess.run([sys.executable, 'train.py', '--prepare_data'] + shared, check=True, capture_output=True)
+    
+    results = {}
+    for name in args.variants:
+        run_name = f"curriculum-bench-{name.replace('+', '-')}"
+        metrics_path = os.path.join(args.out_dir, f"{run_name}.metrics.jsonl")
+        if os.path.exists(metrics_path):
+            os.remove(metrics_path)
+        flags = [flag.format(curriculum_epochs=args.curriculum_epochs) for flag in VARIANTS[name]]
+        cmd = [sys.executable, 'train.py', '--run_name', run_name, '--metrics_file', metrics_path] + shared + flags
+        print(f"Running {name}...")
+        subprocess.run(cmd, check=True, capture_output=True)
+        results[name] = read_validations(metrics_path)
+    
+    target = args.target_loss
+    if target is None:
+        baseline = results.get('uniform')
+        if not baseline:
+            parser.error("--target_loss is required when the uniform variant is not run")
+        target = min(loss for _, loss in baseline)
+    
+    print("\n" + "="*72)
+    print(f"TIME TO VALIDATION LOSS <= {target:.3f} ({args.epochs} epochs, curriculum over {args.curriculum_epochs})")
+    print("="*72)
+    print(f"{'Schedule':>20} | {'To target s':>11} | {'Best val':>8} | {'Total s':>8} | {'Speedup':>7}")
+    uniform_time = time_to_target(results.get('uniform', []), target)
+    for name, points in results.items():
+        reached = time_to_target(points, target)
+        best = min((loss for _, loss in points), default=float('inf'))
+        total = points[-1][0] if points else 0.0
+        speedup = f"{uniform_time / reached:.2f}x" if reached and uniform_time else '-'
+        reached = f"{reached:.1f}" if reached is not None else 'not hit'
+        print(f"{name:>20} | {reached:>11} | {best:>8.3f} | {total:>8.1f} | {speedup:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import torch
+import argparse
+import time
+from model import make_model, make_lm_model, init_cache, lm_decode_step, translation_decode_step, greedy_decode
+
+def uncached_step_times(model, prompt, steps):
+    """Seconds for each new token when the whole prefix is re-run every step."""
+    ids = prompt
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        size = ids.size(1)
+        mask = torch.tril(torch.ones(size, size, dtype=torch.bool, device=ids.device)).unsqueeze(0).unsqueeze(0)
+        next_token = model(ids, mask)[:, -1].argmax(dim=-1, keepdim=True)
+        ids = torch.cat([ids, next_token], dim=1)
+        if ids.device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return times
+
+def cached_step_times(model, prompt, steps):
+    """Seconds for each new token when earlier keys/values come from the cache."""
+    cache = init_cache(model)
+    tokens = prompt
+    times = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        tokens = lm_decode_step(model, tokens, cache)[:, -1].argmax(dim=-1, keepdim=True)
+        if tokens.device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+    return times
+
+def causal_mask(size, device):
+    return torch.tril(torch.ones(size, size, dtype=torch.bool, device=device)).unsqueeze(0).unsqueeze(0)
+
+def check_translation_cache(model, src, src_mask, max_len, atol=1e-4):
+    """
+    Greedy decoding of a padded batch with the cache against the uncached
+    model.decode() loop: every step's logits must match and greedy_decode()
+    must return the same tokens.
+    """
+    memory = model.encode(src, src_mask)
+    cache = init_cache(model)
+    ys = torch.full((src.size(0), 1), 2, dtype=torch.long, device=src.device)
+    for step in range(max_len - 1):
+        expected = model.decode(memory, src_mask, ys, causal_mask(ys.size(1), ys.device))[:, -1]
+        logits = translation_decode_step(model, memory, src_mask, ys[:, -1:], cache)[:, -1]
+        if not torch.allclose(logits, expected, atol=atol, rtol=atol):
+            raise RuntimeError(f"Transformer: cached logits differ at step {step} "
+                               f"(max abs diff {(logits - expected).abs().max().item():.2e})")
+        ys = torch.cat([ys, expected.argmax(dim=-1, keepdim=True)], dim=1)
+    
+    # Nothing is finished early (end_symbol=-1), so both runs produce max_len tokens
+    decoded = greedy_decode(model, src, src_mask, max_len=max_len, end_symbol=-1)
+    if not torch.equal(decoded, ys):
+        raise RuntimeError("Transformer: greedy_decode() tokens differ from uncached decoding")
+
+def check_lm_cache(model, prompts, steps, pad_id=0, atol=1e-4):
+    """
+    Greedy generation of a left-padded batch with the cache (as the backend
+    generator runs it) against running each unpadded prompt alone without
+    the cache: tokens and logits of every step must match.
+    """
+    device = prompts[0].device
+    width = max(len(prompt) for prompt in prompts)
+    input_ids = torch.stack([
+        torch.cat([torch.full((width - len(prompt),), pad_id, dtype=torch.long, device=device), prompt])
+        for prompt in prompts
+    ])
+    not_pad = input_ids != pad_id
+    positions = (not_pad.long().cumsum(dim=1) - 1).clamp(min=0)
+    cache = init_cache(model)
+    logits = lm_decode_step(model, input_ids, cache, positions, key_mask=not_pad)[:, -1]
+    key_mask, positions = not_pad, positions[:, -1:] + 1
+    cached_logits, cached_tokens = [], []
+    for _ in range(steps):
+        cached_logits.append(logits)
+        next_token = logits.argmax(dim=-1, keepdim=True)
+        cached_tokens.append(next_token)
+        key_mask = torch.cat([key_mask, torch.ones_like(next_token, dtype=torch.bool)], dim=1)
+        logits = lm_decode_step(model, next_token, cache, positions, key_mask)[:, -1]
+        positions = positions + 1
+    
+    for row, prompt in enumerate(prompts):
+        ids = prompt.unsqueeze(0)
+        for step in range(steps):
+            expected = model(ids, causal_mask(ids.size(1), device))[:, -1]
+            if not torch.allclose(cached_logits[step][row:row + 1], expected, atol=atol, rtol=atol):
+                diff = (cached_logits[step][row:row + 1] - expected).abs().max().item()
+                raise RuntimeError(f"LanguageModel: cached logits differ for row {row} at step {step} (max abs diff {diff:.2e})")
+            next_token = expected.argmax(dim=-1, keepdim=True)
+            if next_token.item() != cached_tokens[step][row].item():
+                raise RuntimeError(f"LanguageModel: cached tokens differ for row {row} at step {step}")
+            ids = torch.cat([ids, next_token], dim=1)
+
+def check_cache_equivalence(args, device):
+    """Run both checks on small random models with padded batches of mixed lengths."""
+    lengths = [3, 9, 6, 1]
+    translation = make_model(args.vocab_size, args.vocab_size, N=args.n_layers, d_model=args.d_model, h=args.heads).to(device).eval()
+    src = torch.zeros(len(lengths), max(lengths), dtype=torch.long, device=device)
+    for row, length in enumerate(lengths):
+        src[row, :length] = torch.randint(4, args.vocab_size, (length,), device=device)
+    check_translation_cache(translation, src, (src != 0).unsqueeze(1).unsqueeze(2), max_len=args.check_steps)
+    
+    lm = make_lm_model(args.vocab_size, N=args.n_layers, d_model=args.d_model, h=args.heads).to(device).eval()
+    prompts = [torch.randint(4, args.vocab_size, (length,), device=device) for length in lengths]
+    check_lm_cache(lm, prompts, args.check_steps)
+    print(f"Cache equivalence: cached and uncached decoding match (Transformer and LanguageModel, {args.check_steps} steps)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-token decode latency with and without the key/value cache")
+    parser.add_argument('--vocab_size', type=int, default=8000)
+    parser.add_argument('--d_model', type=int, default=256)
+    parser.add_argument('--n_layers', type=int, default=3)
+    parser.add_argument('--heads', type=int, default=4)
+    parser.add_argument('--prompt_len', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--check_steps', type=int, default=24, help='Decoding steps of the cache equivalence check')
+    parser.add_argument('--check_only', action='store_true', help='Only check that cached decoding matches uncached')
+    args = parser.parse_args()
+    
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    torch.manual_seed(args.seed)
+    with torch.no_grad():
+        check_cache_equivalence(args, device)
+    if args.check_only:
+        return
+    
+    model = make_lm_model(args.vocab_size, N=args.n_layers, d_model=args.d_model, h=args.heads).to(device).eval()
+    prompt = torch.randint(4, args.vocab_size, (1, args.prompt_len), device=device)
+    
+    with torch.no_grad():
+        # Warm up kernels and the allocator
+        cached_step_times(model, prompt, 10)
+        uncached = uncached_step_times(model, prompt, args.steps)
+        cached = cached_step_times(model, prompt, args.steps)
+    
+    print("\n" + "="*60)
+    print(f"PER-TOKEN LATENCY (d_model={args.d_model}, N={args.n_layers}, {device})")
+    print("="*60)
+    print(f"{'Tokens generated':>16} | {'Uncached ms':>11} | {'Cached ms':>9}")
+    for step in sorted({0, args.steps // 4, args.steps // 2, args.steps - 1}):
+        print(f"{step + 1:>16} | {1000 * uncached[step]:>11.2f} | {1000 * cached[step]:>9.2f}")
+    print(f"{'total':>16} | {1000 * sum(uncached):>11.1f} | {1000 * sum(cached):>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Peak memory and throughput of Transformer training for each combination of
+gradient accumulation, activation checkpointing and (with --with_compile)
+torch.compile, each run in its own process:
+
+    python benchmark_memory.py --grad_accum_options 1 4
+
+Measured with the defaults on a 1-core CPU VM (torch 2.14; peak MB is the
+process's max RSS):
+
+    Grad accum | Checkpointing | Compile |  Samples/s |   Peak MB
+             1 |         False |   False |        6.8 |    4428.2
+             1 |          True |   False |        4.8 |    3365.3
+             4 |         False |   False |        7.0 |    2276.6
+             4 |          True |   False |        4.9 |    1846.4
+"""
+import torch
+import torch.nn as nn
+import torch.optim as optim
+import argparse
+import itertools
+import json
+import resource
+import subprocess
+import sys
+import time
+from model import make_model, set_activation_checkpointing
+
+def peak_memory_mb(device):
+    if device.type == 'cuda':
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_single(args):
+    """Train on synthetic batches with one option combination and print a JSON result line."""
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    torch.manual_seed(args.seed)
+    
+    model = make_model(
+        args.vocab_size, args.vocab_size,
+        N=args.n_layers, d_model=args.d_model, h=args.heads, dropout=0.1
+    ).to(device)
+    if args.checkpoint_activations:
+        set_activation_checkpointing(model)
+    if args.compile:
+        model = torch.compile(model, dynamic=True)
+    optimizer = optim.Adam(model.parameters(), lr=1e-4, betas=(0.9, 0.98), eps=1e-9)
+    criterion = nn.CrossEntropyLoss(ignore_index=0)
+    
+    micro_batch = args.batch_size // args.grad_accum
+    src = torch.randint(4, args.vocab_size, (micro_batch, args.seq_len), device=device)
+    trg = torch.randint(4, args.vocab_size, (micro_batch, args.seq_len + 1), device=device)
+    trg_input, trg_output = trg[:, :-1], trg[:, 1:]
+    src_mask = (src != 0).unsqueeze(1).unsqueeze(2)
+    trg_mask = torch.tril(torch.ones(args.seq_len, args.seq_len, dtype=torch.bool, device=device)).unsqueeze(0).unsqueeze(0)
+    
+    def step():
+        for _ in range(args.grad_accum):
+            output = model(src, trg_input, src_mask, trg_mask)
+            loss = criterion(output.reshape(-1, output.size(-1)), trg_output.reshape(-1))
+            (loss / args.grad_accum).backward()
+        torch.nn.utils.clip_grad_norm_(model.parameters(), 1.0)
+        optimizer.step()
+        optimizer.zero_grad()
+    
+    for _ in range(args.warmup_steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats(device)
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    elapsed = time.perf_counter() - start
+    
+    print(json.dumps({
+        'samples_per_sec': args.steps * args.batch_size / elapsed,
+        'peak_memory_mb': peak_memory_mb(device),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory/throughput of grad accumulation, activation checkpointing and torch.compile")
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--grad_accum', type=int, default=1)
+    parser.add_argument('--checkpoint_activations', action='store_true')
+    parser.add_argument('--compile', action='store_true')
+    parser.add_argument('--grad_accum_options', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--with_compile', action='store_true', help='Also benchmark torch.compile combinations')
+    parser.add_argument('--batch_size', type=int, default=64, help='Effective batch size per optimizer step')
+    parser.add_argument('--seq_len', type=int, default=64)
+    parser.add_argument('--vocab_size', type=int, default=8000)
+    parser.add_argument('--d_model', type=int, default=256)
+    parser.add_argument('--n_layers', type=int, default=6)
+    parser.add_argument('--heads', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--warmup_steps', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    if args.single:
+        run_single(args)
+        return
+    
+    # Each combination runs in a fresh process so peak memory is not shared
+    shared = [
+        '--batch_size', str(args.batch_size), '--seq_len', str(args.seq_len),
+        '--vocab_size', str(args.vocab_size), '--d_model', str(args.d_model),
+        '--n_layers', str(args.n_layers), '--heads', str(args.heads),
+        '--steps', str(args.steps), '--warmup_steps', str(args.warmup_steps), '--seed', str(args.seed)
+    ]
+    compile_options = [False, True] if args.with_compile else [False]
+    rows = []
+    for grad_accum, checkpointing, compiled in itertools.product(args.grad_accum_options, [False, True], compile_options):
+        cmd = [sys.executable, __file__, '--single', '--grad_accum', str(grad_accum)] + shared
+        if checkpointing:
+            cmd.append('--checkpoint_activations')
+        if compiled:
+            cmd.append('--compile')
+        print(f"Running grad_accum={grad_accum} checkpointing={checkpointing} compile={compiled}...")
+        output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        rows.append((grad_accum, checkpointing, compiled, result))
+    
+    print("\n" + "="*72)
+    print(f"MEMORY / THROUGHPUT (effective batch {args.batch_size}, seq_len {args.seq_len}, N={args.n_layers})")
+    print("="*72)
+    print(f"{'Grad accum':>10} | {'Checkpointing':>13} | {'Compile':>7} | {'Samples/s':>10} | {'Peak MB':>9}")
+    for grad_accum, checkpointing, compiled, result in rows:
+        print(f"{grad_accum:>10} | {str(checkpointing):>13} | {str(compiled):>7} | "
+              f"{result['samples_per_sec']:>10.1f} | {result['peak_memory_mb']:>9.1f}")
+
+if __name__ == "__main__":
+    main()
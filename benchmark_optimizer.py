@@ -0,0 +1,71 @@
+import torch
+import argparse
+import time
+from model import make_model
+from utils import make_optimizer
+
+def time_optimizer_step(model, optimizer, steps, warmup_steps, foreach_clip):
+    """Mean seconds per clip_grad_norm_ + optimizer.step() on fixed random gradients."""
+    params = [p for p in model.parameters() if p.requires_grad]
+    for p in params:
+        p.grad = torch.randn_like(p) * 1e-3
+    device = params[0].device
+    
+    def step():
+        torch.nn.utils.clip_grad_norm_(params, 1.0, foreach=foreach_clip)
+        optimizer.step()
+    
+    for _ in range(warmup_steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / steps
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimizer time per step: per-tensor Adam vs foreach/fused AdamW")
+    parser.add_argument('--vocab_size', type=int, default=8000)
+    parser.add_argument('--d_model', type=int, default=256)
+    parser.add_argument('--n_layers', type=int, default=3)
+    parser.add_argument('--heads', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--warmup_steps', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    torch.manual_seed(args.seed)
+    model = make_model(
+        args.vocab_size, args.vocab_size,
+        N=args.n_layers, d_model=args.d_model, h=args.heads, dropout=0.1
+    ).to(device)
+    n_tensors = sum(1 for _ in model.parameters())
+    
+    # (label, optimizer factory, foreach clip)
+    configs = [
+        ('Adam (previous)', lambda: torch.optim.Adam(model.parameters(), lr=1e-4, betas=(0.9, 0.98), eps=1e-9, foreach=False), False),
+        ('AdamW for-loop', lambda: make_optimizer(model, 1e-4, impl='for-loop'), False),
+        ('AdamW foreach', lambda: make_optimizer(model, 1e-4, impl='foreach'), device.type == 'cuda' or None),
+    ]
+    if device.type == 'cuda':
+        configs.append(('AdamW fused', lambda: make_optimizer(model, 1e-4, impl='fused'), True))
+    
+    rows = []
+    for label, factory, foreach_clip in configs:
+        print(f"Running {label}...")
+        rows.append((label, time_optimizer_step(model, factory(), args.steps, args.warmup_steps, foreach_clip)))
+    
+    baseline = rows[0][1]
+    print("\n" + "="*60)
+    print(f"OPTIMIZER STEP ({n_tensors} parameter tensors, d_model={args.d_model}, N={args.n_layers}, {device})")
+    print("="*60)
+    print(f"{'Optimizer':>16} | {'ms/step':>8} | {'Speedup':>7}")
+    for label, seconds in rows:
+        print(f"{label:>16} | {1000 * seconds:>8.2f} | {baseline / seconds:>6.2f}x")
+
+if __name__ == "__main__":
+    main()
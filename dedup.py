@@ -0,0 +1,335 @@
+"""
+Exact and near-duplicate removal for line-delimited training corpora.
+
+Exact duplicates are caught by hashing the normalised line. Near duplicates
+are caught with MinHash signatures over character n-grams, bucketed with
+LSH banding: two lines collide in a band when all `rows` minhashes of that
+band agree, which happens with high probability once their Jaccard
+similarity passes roughly (1 / bands) ** (1 / rows).
+
+Only fixed-size hashes are kept per unique line, never the text, and the
+signatures are computed in a process pool over streamed chunks. The index
+of those hashes still grows with the corpus (bands + 1 keys per unique
+line); give an index path to keep it in SQLite on disk instead of memory.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+
+from preprocess_and_split import atomic_write, bounded_imap, read_chunks
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+def normalize(text):
+    """Lowercase and collapse whitespace so trivial variants hash identically."""
+    return ' '.join(text.lower().split())
+
+def _hash64(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+class MinHasher:
+    """Computes exact keys, MinHash signatures and LSH band keys for lines."""
+    def __init__(self, num_perm=128, bands=16, ngram=5, seed=42):
+        assert num_perm % bands == 0, "num_perm must be divisible by bands"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+    
+    @property
+    def threshold(self):
+        """Approximate Jaccard similarity at which lines start colliding."""
+        return (1.0 / self.bands) ** (1.0 / self.rows)
+    
+    def shingles(self, text):
+        if len(text) <= self.ngram:
+            return {text}
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+    
+    def signature(self, text):
+        hv = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in self.shingles(text)),
+            dtype=np.uint64
+        )
+        # Universal hashing (a * x + b) mod p; the uint64 product may wrap,
+        # which is fine since only consistency across lines matters
+        permuted = (np.outer(hv, self.a) + self.b) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=0)
+    
+    def keys(self, text):
+        """Return (exact_key, band_keys) for a line."""
+        text = normalize(text)
+        exact_key = _hash64(text.encode('utf-8'))
+        signature = self.signature(text)
+        band_keys = [
+            _hash64(bytes([band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+        return exact_key, band_keys
+
+def _keys_chunk(lines, hasher):
+    """Compute keys for a chunk of lines (runs in a worker)."""
+    return [hasher.keys(line) for line in lines]
+
+def _signed64(key):
+    # SQLite integers are signed 64-bit
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+class Deduplicator:
+    """
+    Streaming duplicate filter over (exact_key, band_keys) pairs.
+    
+    The first line seen of each cluster is its representative; later lines
+    that match it exactly or share an LSH band with it are duplicates. At
+    most max_examples duplicates are remembered per cluster for reporting.
+    
+    Every unique line adds bands + 1 keys to the index, roughly 100 bytes
+    each as in-memory dicts (about 2 KB per line with 16 bands), so memory
+    grows linearly with the corpus. With index_path the keys live in an
+    SQLite file instead and memory is bounded by its page cache
+    (cache_mb), at the cost of one lookup query per line; only the
+    duplicate clusters stay in memory.
+    """
+    def __init__(self, bands, max_examples=5, index_path=None, cache_mb=256):
+        self.clusters = {}
+        self.max_examples = max_examples
+        self.n_exact = 0
+        self.n_near = 0
+        self._db = None
+        if index_path is None:
+            self.exact = {}
+            self.band_tables = [{} for _ in range(bands)]
+            return
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        self._db = sqlite3.connect(index_path)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+        self._db.execute("CREATE TABLE exact (key INTEGER PRIMARY KEY, rep INTEGER) WITHOUT ROWID")
+        # Band keys already hash in the band number, so one table holds every band
+        self._db.execute("CREATE TABLE bands (key INTEGER PRIMARY KEY, rep INTEGER) WITHOUT ROWID")
+        self._pending = 0
+    
+    def _find(self, exact_key, band_keys):
+        """Return (representative idx or None, whether the match is exact)."""
+        if self._db is None:
+            rep = self.exact.get(exact_key)
+            if rep is not None:
+                return rep, True
+            for table, key in zip(self.band_tables, band_keys):
+                rep = table.get(key)
+                if rep is not None:
+                    return rep, False
+            return None, False
+        
+        row = self._db.execute("SELECT rep FROM exact WHERE key = ?", (_signed64(exact_key),)).fetchone()
+        if row is not None:
+            return row[0], True
+        keys = [_signed64(key) for key in band_keys]
+        found = dict(self._db.execute(
+            f"SELECT key, rep FROM bands WHERE key IN ({','.join('?' * len(keys))})", keys
+        ).fetchall())
+        # First band in order, as with the in-memory tables
+        for key in keys:
+            if key in found:
+                return found[key], False
+        return None, False
+    
+    def _insert(self, idx, exact_key, band_keys):
+        if self._db is None:
+            self.exact[exact_key] = idx
+            for table, key in zip(self.band_tables, band_keys):
+                table.setdefault(key, idx)
+            return
+        
+        self._db.execute("INSERT OR REPLACE INTO exact VALUES (?, ?)", (_signed64(exact_key), idx))
+        self._db.executemany("INSERT OR IGNORE INTO bands VALUES (?, ?)", [(_signed64(key), idx) for key in band_keys])
+        self._pending += 1
+        if self._pending >= 10000:
+            self._db.commit()
+            self._pending = 0
+    
+    def add(self, idx, exact_key, band_keys, text=None):
+        """Register line idx; return its representative's idx if it is a duplicate, else None."""
+        rep, exact = self._find(exact_key, band_keys)
+        if rep is not None:
+            if exact:
+                self.n_exact += 1
+            else:
+                self.n_near += 1
+            cluster = self.clusters.setdefault(rep, {'size': 1, 'examples': []})
+            cluster['size'] += 1
+            if len(cluster['examples']) < self.max_examples:
+                cluster['examples'].append((idx, text))
+            return rep
+        
+        self._insert(idx, exact_key, band_keys)
+        return None
+    
+    def close(self):
+        """Close (but keep) the on-disk index, if any."""
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+    
+    @property
+    def n_duplicates(self):
+        return self.n_exact + self.n_near
+
+def iter_keys(chunks, hasher, num_workers):
+    """Yield per-chunk key lists for streamed chunks of lines, in input order."""
+    compute = partial(_keys_chunk, hasher=hasher)
+    if num_workers <= 1:
+        yield from map(compute, chunks)
+        return
+    with Pool(num_workers) as pool:
+        yield from bounded_imap(pool, compute, chunks, 2 * num_workers)
+
+def lookup_lines(path, wanted):
+    """Stream path and return {line_idx: stripped line} for the indices in wanted."""
+    found = {}
+    wanted = set(wanted)
+    with open(path, 'r', encoding='utf-8') as f:
+        for idx, line in enumerate(f):
+            if idx in wanted:
+                found[idx] = line.strip()
+                if len(found) == len(wanted):
+                    break
+    return found
+
+def write_cluster_report(deduplicator, rep_texts, report_file):
+    """Write one JSON line per duplicate cluster, largest first."""
+    clusters = sorted(deduplicator.clusters.items(), key=lambda item: -item[1]['size'])
+    with atomic_write(report_file) as f:
+        for rep, cluster in clusters:
+            f.write(json.dumps({
+                'representative': rep,
+                'text': rep_texts.get(rep),
+                'size': cluster['size'],
+                'duplicates': [{'line': idx, 'text': text} for idx, text in cluster['examples']],
+            }, ensure_ascii=False) + '\n')
+    print(f"  Wrote {len(clusters)} duplicate clusters to {report_file}")
+
+def _print_summary(deduplicator, n_lines, n_kept):
+    print(f"Lines: {n_lines} | Exact duplicates: {deduplicator.n_exact} | "
+          f"Near duplicates: {deduplicator.n_near} | Kept: {n_kept}")
+
+def dedup_file(input_file, output_file, report_file=None, num_workers=None, chunk_size=10000,
+               num_perm=128, bands=16, ngram=5, seed=42, index_path=None):
+    """
+    Remove exact and near-duplicate lines from a corpus, keeping first occurrences.
+    
+    Args:
+        input_file: Line-delimited input corpus
+        output_file: Where to write the deduplicated corpus (atomically)
+        report_file: Optional JSONL path for the duplicate cluster report
+        num_workers: Signature processes (defaults to the CPU count)
+        chunk_size: Lines per chunk handed to a worker
+        num_perm: MinHash permutations
+        bands: LSH bands (num_perm / bands rows each)
+        ngram: Character n-gram size for shingling
+        seed: Seed for the MinHash permutations
+        index_path: Optional SQLite file for the key index, bounding memory
+            on large corpora (see Deduplicator); overwritten if it exists
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    hasher = MinHasher(num_perm, bands, ngram, seed)
+    deduplicator = Deduplicator(bands, index_path=index_path)
+    print(f"Deduplicating {input_file} (near-duplicate threshold ~{hasher.threshold:.2f})...")
+    
+    n_lines = 0
+    n_kept = 0
+    with atomic_write(output_file) as out, open(input_file, 'r', encoding='utf-8') as src:
+        for keys in iter_keys(read_chunks(input_file, chunk_size), hasher, num_workers):
+            for exact_key, band_keys in keys:
+                line = src.readline().strip()
+                if line and deduplicator.add(n_lines, exact_key, band_keys, line) is None:
+                    out.write(line + '\n')
+                    n_kept += 1
+                n_lines += 1
+    
+    deduplicator.close()
+    _print_summary(deduplicator, n_lines, n_kept)
+    if report_file:
+        write_cluster_report(deduplicator, lookup_lines(input_file, deduplicator.clusters), report_file)
+    return deduplicator
+
+def dedup_parallel(src_file, trg_file, out_src_file, out_trg_file, report_file=None, num_workers=None,
+                   chunk_size=10000, num_perm=128, bands=16, ngram=5, seed=42, index_path=None):
+    """
+    Deduplicate a parallel corpus on (source, target) pairs, keeping both sides aligned.
+    
+    Arguments are as for dedup_file, with one input and output per side.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    hasher = MinHasher(num_perm, bands, ngram, seed)
+    deduplicator = Deduplicator(bands, index_path=index_path)
+    print(f"Deduplicating {src_file} / {trg_file} (near-duplicate threshold ~{hasher.threshold:.2f})...")
+    
+    def pair_chunks():
+        for src_chunk, trg_chunk in zip(read_chunks(src_file, chunk_size), read_chunks(trg_file, chunk_size)):
+            yield [f"{s.strip()} ||| {t.strip()}" for s, t in zip(src_chunk, trg_chunk)]
+    
+    n_lines = 0
+    n_kept = 0
+    with atomic_write(out_src_file) as out_src, atomic_write(out_trg_file) as out_trg, \
+            open(src_file, 'r', encoding='utf-8') as src, open(trg_file, 'r', encoding='utf-8') as trg:
+        for keys in iter_keys(pair_chunks(), hasher, num_workers):
+            for exact_key, band_keys in keys:
+                src_line, trg_line = src.readline().strip(), trg.readline().strip()
+                pair = f"{src_line} ||| {trg_line}"
+                if deduplicator.add(n_lines, exact_key, band_keys, pair) is None:
+                    out_src.write(src_line + '\n')
+                    out_trg.write(trg_line + '\n')
+                    n_kept += 1
+                n_lines += 1
+    
+    deduplicator.close()
+    _print_summary(deduplicator, n_lines, n_kept)
+    if report_file:
+        src_texts = lookup_lines(src_file, deduplicator.clusters)
+        trg_texts = lookup_lines(trg_file, deduplicator.clusters)
+        rep_texts = {idx: f"{src_texts.get(idx)} ||| {trg_texts.get(idx)}" for idx in deduplicator.clusters}
+        write_cluster_report(deduplicator, rep_texts, report_file)
+    return deduplicator
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remove exact and near-duplicate lines from a corpus")
+    parser.add_argument('inputs', nargs='+', help='Input corpus, or source and target files with --parallel')
+    parser.add_argument('--output', nargs='+', required=True, help='Output file(s), one per input')
+    parser.add_argument('--parallel', action='store_true', help='Deduplicate aligned source/target files as pairs')
+    parser.add_argument('--report', type=str, default=None, help='JSONL report of duplicate clusters')
+    parser.add_argument('--num_workers', type=int, default=None)
+    parser.add_argument('--chunk_size', type=int, default=10000)
+    parser.add_argument('--num_perm', type=int, default=128)
+    parser.add_argument('--bands', type=int, default=16)
+    parser.add_argument('--ngram', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--index', type=str, default=None,
+                        help='SQLite file for the key index, to bound memory on large corpora')
+    args = parser.parse_args()
+    
+    options = dict(
+        report_file=args.report, num_workers=args.num_workers, chunk_size=args.chunk_size,
+        num_perm=args.num_perm, bands=args.bands, ngram=args.ngram, seed=args.seed,
+        index_path=args.index
+    )
+    if args.parallel:
+        assert len(args.inputs) == 2 and len(args.output) == 2, "--parallel takes two inputs and two outputs"
+        dedup_parallel(args.inputs[0], args.inputs[1], args.output[0], args.output[1], **options)
+    else:
+        assert len(args.inputs) == 1 and len(args.output) == 1, "Expected one input and one output"
+        dedup_file(args.inputs[0], args.output[0], **options)
@@ -0,0 +1,225 @@
+"""
+Export training checkpoints to an inference-only, memory-mappable format.
+
+Training checkpoints hold the Adam state alongside the weights and must be
+fully unpickled to load. The export keeps only the model's state_dict in the
+safetensors layout (an 8-byte header length, a JSON header with dtype, shape
+and byte offsets per tensor, then the raw tensor bytes), plus string metadata
+with the model type, its config and a sha256 of each vocabulary. It is
+written by hand here so neither training nor serving needs the safetensors
+package.
+
+load_exported() maps the file copy-on-write and builds every tensor as a
+view into the mapping, so loading reads no tensor data up front and pages
+are only faulted in (and shared through the page cache) as they are used.
+"""
+import torch
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import resource
+import subprocess
+import sys
+import time
+from model import make_model, make_lm_model
+from text_data import Tokenizer, iter_corpus_lines
+
+_DTYPES = {
+    torch.float64: 'F64', torch.float32: 'F32', torch.float16: 'F16', torch.bfloat16: 'BF16',
+    torch.int64: 'I64', torch.int32: 'I32', torch.int16: 'I16', torch.int8: 'I8',
+    torch.uint8: 'U8', torch.bool: 'BOOL',
+}
+_DTYPE_NAMES = {name: dtype for dtype, name in _DTYPES.items()}
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+def vocab_sha256(tokenizer):
+    """Hash of a tokenizer's id -> token table, to catch vocab/weights mismatches."""
+    tokens = [tokenizer.reverse_vocab[i] for i in range(len(tokenizer))]
+    return hashlib.sha256(json.dumps(tokens, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def save_exported(state_dict, path, metadata=None):
+    """
+    Write state_dict (and string metadata) to path in the safetensors layout.
+    
+    Tensors are laid out largest element size first, so with the 8-byte
+    aligned header every tensor starts at a multiple of its element size.
+    """
+    tensors = {name: t.detach().to('cpu').contiguous() for name, t in state_dict.items()}
+    order = sorted(tensors, key=lambda name: (-tensors[name].element_size(), name))
+    
+    header = {'__metadata__': {k: str(v) for k, v in (metadata or {}).items()}}
+    offset = 0
+    for name in order:
+        t = tensors[name]
+        nbytes = t.numel() * t.element_size()
+        header[name] = {'dtype': _DTYPES[t.dtype], 'shape': list(t.shape), 'data_offsets': [offset, offset + nbytes]}
+        offset += nbytes
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+    
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        for name in order:
+            t = tensors[name]
+            if t.numel():
+                f.write(t.reshape(-1).view(torch.uint8).numpy().tobytes())
+    os.replace(tmp, path)
+
+def load_exported(path):
+    """
+    Map an exported file and return (state_dict, metadata).
+    
+    The tensors are views into a private copy-on-write mapping of the file,
+    so they can be used (and even written) without copying the weights.
+    """
+    with open(path, 'rb') as f:
+        header_len = int.from_bytes(f.read(8), 'little')
+        header = json.loads(f.read(header_len))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    metadata = header.pop('__metadata__', {})
+    data_start = 8 + header_len
+    
+    state_dict = {}
+    for name, info in header.items():
+        dtype = _DTYPE_NAMES[info['dtype']]
+        start, end = info['data_offsets']
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        if count:
+            t = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start)
+        else:
+            t = torch.empty(0, dtype=dtype)
+        state_dict[name] = t.view(info['shape'])
+    return state_dict, metadata
+
+def build_model(model_type, config):
+    """Instantiate an architecture from a registry config dict."""
+    if model_type == 'translation':
+        return make_model(
+            config['src_vocab_size'], config['trg_vocab_size'],
+            N=config['n_layers'], d_model=config['d_model'], h=config['heads'], dropout=config['dropout']
+        )
+    if model_type == 'generation':
+        return make_lm_model(
+            config['vocab_size'],
+            N=config['n_layers'], d_model=config['d_model'], h=config['heads'], dropout=config['dropout']
+        )
+    raise ValueError(f"Unknown model type: {model_type}")
+
+def load_exported_model(path):
+    """
+    Build the model for an exported file without allocating its weights twice.
+    
+    The module is created on the meta device (no storage at all) and the
+    mapped tensors are assigned into it as its parameters.
+    Returns (model, metadata), with metadata['config'] decoded.
+    """
+    state_dict, metadata = load_exported(path)
+    metadata['config'] = json.loads(metadata['config'])
+    with torch.device('meta'):
+        model = build_model(metadata['model_type'], metadata['config'])
+    model.load_state_dict(state_dict, assign=True)
+    return model, metadata
+
+def build_tokenizers(model_type, tokenizer_config, base_dir='.'):
+    """Rebuild a model's tokenizers from its registry tokenizer_config."""
+    def build(vocab_file):
+        tokenizer = Tokenizer(min_freq=tokenizer_config.get('min_freq', 2))
+        tokenizer.build_vocab(iter_corpus_lines(os.path.join(base_dir, vocab_file)))
+        return tokenizer
+    
+    if model_type == 'translation':
+        return {'src': build(tokenizer_config['src_vocab_file']), 'trg': build(tokenizer_config['trg_vocab_file'])}
+    return {'vocab': build(tokenizer_config['vocab_file'])}
+
+def export_checkpoint(checkpoint_path, output_path, model_type, config, tokenizers=None):
+    """
+    Export the weights of a training checkpoint for inference.
+    
+    Args:
+        checkpoint_path: Checkpoint saved by train.py / train_gen.py
+        output_path: Destination of the exported file
+        model_type: 'translation' or 'generation'
+        config: Architecture config (as in backend/app/config.py)
+        tokenizers: Optional {name: Tokenizer}; their vocab hashes are
+            stored as vocab_sha256_<name> metadata
+    """
+    checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+    state_dict = checkpoint.get('state_dict', checkpoint)
+    # Check the weights fit the architecture before writing anything
+    with torch.device('meta'):
+        build_model(model_type, config).load_state_dict(state_dict, assign=True)
+    
+    metadata = {
+        'format': 'pt',
+        'model_type': model_type,
+        'config': json.dumps(config, sort_keys=True),
+        'source_checkpoint': os.path.basename(checkpoint_path),
+    }
+    for name, tokenizer in (tokenizers or {}).items():
+        metadata[f'vocab_sha256_{name}'] = vocab_sha256(tokenizer)
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    save_exported(state_dict, output_path, metadata)
+    size_mb = os.path.getsize(output_path) / 2**20
+    print(f"Exported {checkpoint_path} -> {output_path} ({size_mb:.1f} MB, {len(state_dict)} tensors)")
+
+def _benchmark_single(mode, path):
+    start = time.perf_counter()
+    if mode == 'checkpoint':
+        torch.load(path, map_location='cpu', weights_only=False)
+    else:
+        model, _ = load_exported_model(path)
+        # Touch every weight once, as the first request would
+        with torch.no_grad():
+            sum(float(p.sum()) for p in model.parameters())
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+def _benchmark(checkpoint_path, export_path):
+    """Compare load time and peak RSS of the two formats, each in a fresh process."""
+    print(f"{'Format':>12} | {'Load s':>8} | {'Peak RSS MB':>11}")
+    for mode, path in (('checkpoint', checkpoint_path), ('export', export_path)):
+        cmd = [sys.executable, __file__, '--benchmark_single', mode, path]
+        result = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout.strip().splitlines()[-1])
+        print(f"{mode:>12} | {result['seconds']:>8.3f} | {result['peak_rss_mb']:>11.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export checkpoints in backend/app/config.py to mmap-able inference files")
+    parser.add_argument('--model_id', type=str, nargs='*', default=None,
+                        help='Models to export (default: every registered model with an export_path)')
+    parser.add_argument('--benchmark', action='store_true', help='Compare load time and peak RSS after exporting')
+    parser.add_argument('--benchmark_single', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.benchmark_single:
+        _benchmark_single(*args.benchmark_single)
+        return
+    
+    sys.path.insert(0, BACKEND_DIR)
+    from app.config import MODEL_CONFIGS
+    
+    # Registry paths are relative to backend/, where the server runs
+    for entry in MODEL_CONFIGS:
+        if args.model_id and entry['model_id'] not in args.model_id:
+            continue
+        if 'export_path' not in entry:
+            print(f"Skipping {entry['model_id']}: no export_path configured")
+            continue
+        checkpoint_path = os.path.join(BACKEND_DIR, entry['checkpoint_path'])
+        export_path = os.path.join(BACKEND_DIR, entry['export_path'])
+        if not os.path.exists(checkpoint_path):
+            print(f"Skipping {entry['model_id']}: {checkpoint_path} not found")
+            continue
+        tokenizers = build_tokenizers(entry['type'], entry.get('tokenizer_config', {}), BACKEND_DIR)
+        export_checkpoint(checkpoint_path, export_path, entry['type'], entry['config'], tokenizers)
+        if args.benchmark:
+            _benchmark(checkpoint_path, export_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Training metrics: step instrumentation and non-blocking metric sinks.
+
+Sinks take metric dicts via write(metrics, step=None) and persist them on
+flush(). AsyncMetricsLogger puts a bounded queue and a background thread in
+front of any set of sinks, so the training loop never waits on logging I/O.
+"""
+import torch
+import json
+import os
+import queue
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+class JSONLSink:
+    """
+    Writes each metrics dict as one JSON line to a local file, which is
+    truncated first unless append (e.g. for a resumed run).
+    """
+    def __init__(self, path, append=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'a' if append else 'w', encoding='utf-8')
+    
+    def write(self, metrics, step=None):
+        if step is not None:
+            metrics = {**metrics, 'step': step}
+        self.file.write(json.dumps(metrics) + '\n')
+    
+    def flush(self):
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+
+class TensorBoardSink:
+    """Writes numeric metrics as TensorBoard scalars, to log_dir or an existing SummaryWriter."""
+    def __init__(self, log_dir=None, writer=None):
+        if writer is None:
+            from torch.utils.tensorboard import SummaryWriter
+            writer = SummaryWriter(log_dir=log_dir)
+        self.writer = writer
+        self.default_step = 0
+    
+    def write(self, metrics, step=None):
+        if step is None:
+            step = metrics.get('train/step', metrics.get('epoch', self.default_step))
+            self.default_step += 1
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.writer.add_scalar(name, value, step)
+    
+    def flush(self):
+        self.writer.flush()
+    
+    def close(self):
+        self.writer.close()
+
+class WandbSink:
+    """Forwards metrics to the active wandb run (online or offline)."""
+    def write(self, metrics, step=None):
+        import wandb
+        if step is None:
+            wandb.log(metrics)
+        else:
+            wandb.log(metrics, step=step)
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        import wandb
+        wandb.finish()
+
+class AsyncMetricsLogger:
+    """
+    Sink front-end that never blocks the caller.
+    
+    write() only appends to a bounded queue; a background thread hands the
+    records to every sink and flushes them all every flush_interval seconds
+    (and on close()). If the queue is full the record is dropped and counted
+    in `dropped` rather than stalling training. A sink that raises is
+    reported once and skipped from then on.
+    """
+    _CLOSE = object()
+    
+    def __init__(self, sinks, max_queue=10000, flush_interval=5.0):
+        self.sinks = list(sinks)
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._failed = set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def write(self, metrics, step=None):
+        try:
+            self._queue.put_nowait((metrics, step))
+        except queue.Full:
+            self.dropped += 1
+    
+    def _call(self, sink, method, *args):
+        if id(sink) in self._failed:
+            return
+        try:
+            getattr(sink, method)(*args)
+        except Exception as e:
+            self._failed.add(id(sink))
+            print(f"Metrics sink {type(sink).__name__} failed in {method}() and was disabled: {e}")
+    
+    def _flush_sinks(self):
+        for sink in self.sinks:
+            self._call(sink, 'flush')
+    
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(next_flush - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = None
+            if item is self._CLOSE:
+                break
+            if item is not None:
+                for sink in self.sinks:
+                    self._call(sink, 'write', *item)
+            if time.monotonic() >= next_flush:
+                self._flush_sinks()
+                next_flush = time.monotonic() + self.flush_interval
+        self._flush_sinks()
+    
+    def flush(self):
+        pass # the writer thread flushes on its own schedule
+    
+    def close(self, close_sinks=True):
+        """Drain the queue and flush every sink, then close them unless close_sinks=False."""
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+        if close_sinks:
+            for sink in self.sinks:
+                self._call(sink, 'close')
+        if self.dropped:
+            print(f"Metrics logger dropped {self.dropped} records (queue full)")
+
+LOG_BACKENDS = ('jsonl', 'tensorboard', 'wandb', 'wandb-offline')
+
+def make_metrics_logger(backends, run_name, log_dir='logs', project=None, config=None,
+                        jsonl_path=None, flush_interval=5.0, resume=False):
+    """
+    Build an AsyncMetricsLogger over the requested backends.
+    
+    Args:
+        backends: Any of LOG_BACKENDS; 'wandb-offline' records the run
+            locally for a later `wandb sync`
+        run_name: Run name, used for file names and the wandb run
+        log_dir: Directory for JSONL files and TensorBoard event files
+        project: wandb project
+        config: Run config passed to wandb
+        jsonl_path: JSONL file (default: <log_dir>/<run_name>.metrics.jsonl)
+        flush_interval: Seconds between sink flushes
+        resume: Append to an existing JSONL file instead of starting it afresh
+    """
+    sinks = []
+    for backend in backends:
+        if backend == 'jsonl':
+            sinks.append(JSONLSink(jsonl_path or os.path.join(log_dir, f"{run_name}.metrics.jsonl"), append=resume))
+        elif backend == 'tensorboard':
+            sinks.append(TensorBoardSink(os.path.join(log_dir, 'tensorboard', run_name)))
+        elif backend in ('wandb', 'wandb-offline'):
+            import wandb
+            wandb.init(project=project, name=run_name, config=config,
+                       mode='offline' if backend == 'wandb-offline' else 'online')
+            sinks.append(WandbSink())
+        else:
+            raise ValueError(f"Unknown log backend: {backend} (expected one of {LOG_BACKENDS})")
+    return AsyncMetricsLogger(sinks, flush_interval=flush_interval)
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+class TrainingMonitor:
+    """
+    Low-overhead step instrumentation for the training loops.
+    
+    Loss and token counts are accumulated as device tensors, so the loop never
+    forces a device sync except when a window of log_every steps is emitted.
+    Forward/backward/optimizer phases are only timed (with a sync around each
+    phase) on every sample_every-th step. Every log_every steps a metrics dict
+    with tokens/s, padding ratio, step-time percentiles, data wait, phase
+    times and peak memory is written to each sink (typically a single
+    AsyncMetricsLogger), keys prefixed with "train/".
+    """
+    PHASES = ('forward', 'backward', 'optimizer')
+    
+    def __init__(self, device, sinks=(), log_every=50, sample_every=10):
+        self.device = torch.device(device)
+        self.sinks = list(sinks)
+        self.log_every = log_every
+        self.sample_every = sample_every
+        self.global_step = 0
+        self._reset_window()
+        self._reset_epoch()
+        self._last_step_end = time.perf_counter()
+    
+    def _zero(self):
+        return torch.zeros((), device=self.device)
+    
+    def _reset_window(self):
+        self.window_loss = self._zero()
+        self.window_tokens = self._zero()
+        self.window_positions = self._zero()
+        self.window_steps = 0
+        self.window_start = time.perf_counter()
+        self.step_times = []
+        self.data_waits = []
+        self.phase_times = {phase: [] for phase in self.PHASES}
+    
+    def _reset_epoch(self):
+        self.epoch_loss = self._zero()
+        self.epoch_tokens = self._zero()
+        self.epoch_steps = 0
+        self.epoch_data_wait = 0.0
+        self.epoch_start = time.perf_counter()
+    
+    def _sync(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+        elif self.device.type == 'mps':
+            torch.mps.synchronize()
+    
+    @property
+    def sampling(self):
+        return self.sample_every > 0 and self.global_step % self.sample_every == 0
+    
+    def start_epoch(self):
+        # Validation and checkpointing since the last step stay out of the first window
+        self._reset_window()
+        self._reset_epoch()
+        self._last_step_end = time.perf_counter()
+    
+    def batch_ready(self):
+        """Call as soon as the next batch is available; records the data wait."""
+        self._step_start = time.perf_counter()
+        wait = self._step_start - self._last_step_end
+        self.data_waits.append(wait)
+        self.epoch_data_wait += wait
+    
+    @contextmanager
+    def phase(self, name):
+        """Time a phase of the step, on sampled steps only."""
+        if not self.sampling:
+            yield
+            return
+        self._sync()
+        start = time.perf_counter()
+        yield
+        self._sync()
+        self.phase_times[name].append(time.perf_counter() - start)
+    
+    def step_end(self, loss, n_tokens, n_positions):
+        """
+        Record a finished micro-batch.
+        
+        loss is the (undivided) batch loss tensor, n_tokens the number of
+        non-pad target tokens and n_positions all target positions, both
+        as tensors or ints; none of them are read back to the host here.
+        """
+        loss = loss.detach()
+        self.window_loss += loss
+        self.epoch_loss += loss
+        self.window_tokens += n_tokens
+        self.epoch_tokens += n_tokens
+        self.window_positions += n_positions
+        self.window_steps += 1
+        self.epoch_steps += 1
+        self.global_step += 1
+        
+        now = time.perf_counter()
+        self.step_times.append(now - self._step_start)
+        self._last_step_end = now
+        
+        if self.log_every > 0 and self.window_steps >= self.log_every:
+            self.emit()
+    
+    def peak_memory_mb(self):
+        if self.device.type == 'cuda':
+            return torch.cuda.max_memory_allocated(self.device) / 2**20
+        # ru_maxrss is in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    
+    def emit(self):
+        """Write the current window's metrics to the sinks and start a new window."""
+        if self.window_steps == 0:
+            return
+        # Single host sync for the whole window
+        loss, tokens, positions = torch.stack(
+            [self.window_loss, self.window_tokens, self.window_positions]
+        ).tolist()
+        elapsed = time.perf_counter() - self.window_start
+        step_times = sorted(self.step_times)
+        metrics = {
+            'train/step': self.global_step,
+            'train/loss': loss / self.window_steps,
+            'train/tokens_per_sec': tokens / elapsed,
+            'train/padding_ratio': 1 - tokens / positions if positions else 0.0,
+            'train/step_time_p50_ms': 1000 * _percentile(step_times, 0.5),
+            'train/step_time_p90_ms': 1000 * _percentile(step_times, 0.9),
+            'train/step_time_p99_ms': 1000 * _percentile(step_times, 0.99),
+            'train/data_wait_ms': 1000 * sum(self.data_waits) / len(self.data_waits),
+            'train/peak_memory_mb': self.peak_memory_mb(),
+        }
+        for phase, times in self.phase_times.items():
+            if times:
+                metrics[f'train/{phase}_ms'] = 1000 * sum(times) / len(times)
+        for sink in self.sinks:
+            sink.write(metrics)
+        self._reset_window()
+    
+    def epoch_summary(self):
+        """Return (mean epoch loss, stats dict) for the epoch so far."""
+        # Log the epoch's last, partial window before validation starts
+        self.emit()
+        steps = max(self.epoch_steps, 1)
+        loss, tokens = torch.stack([self.epoch_loss, self.epoch_tokens]).tolist()
+        return loss / steps, {
+            'tokens_per_sec': tokens / (time.perf_counter() - self.epoch_start),
+            'data_wait_ms': 1000 * self.epoch_data_wait / steps,
+        }
+    
+    def close(self):
+        self.emit()
+        for sink in self.sinks:
+            sink.close()
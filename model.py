@@ -1,6 +1,7 @@
 import torch
 import torch.nn as nn
 import math
+from torch.utils.checkpoint import checkpoint
 
 class Embeddings(nn.Module):
     def __init__(self, d_model, vocab_size):
@@ -26,8 +27,13 @@ class PositionalEncoding(nn.Module):
         pe = pe.unsqueeze(0)
         self.register_buffer('pe', pe)
 
-    def forward(self, x):
-        x = x + self.pe[:, :x.size(1)]
+    def forward(self, x, positions=None):
+        if positions is None:
+            x = x + self.pe[:, :x.size(1)]
+        else:
+            # Explicit per-token positions, e.g. restarting at 0 for every
+            # document packed into the same row
+            x = x + self.pe[0, positions]
         return self.dropout(x)
 
 class MultiHeadAttention(nn.Module):
@@ -120,10 +126,14 @@ class Encoder(nn.Module):
         super(Encoder, self).__init__()
         self.layers = nn.ModuleList([copy.deepcopy(layer) for _ in range(N)])
         self.norm = nn.LayerNorm(layer.size)
+        self.checkpoint_activations = False
 
     def forward(self, x, mask):
         for layer in self.layers:
-            x = layer(x, mask)
+            if self.checkpoint_activations and self.training and torch.is_grad_enabled():
+                x = checkpoint(layer, x, mask, use_reentrant=False)
+            else:
+                x = layer(x, mask)
         return self.norm(x)
 
 class Decoder(nn.Module):
@@ -131,10 +141,14 @@ class Decoder(nn.Module):
         super(Decoder, self).__init__()
         self.layers = nn.ModuleList([copy.deepcopy(layer) for _ in range(N)])
         self.norm = nn.LayerNorm(layer.size)
+        self.checkpoint_activations = False
 
     def forward(self, x, memory, src_mask, tgt_mask):
         for layer in self.layers:
-            x = layer(x, memory, src_mask, tgt_mask)
+            if self.checkpoint_activations and self.training and torch.is_grad_enabled():
+                x = checkpoint(layer, x, memory, src_mask, tgt_mask, use_reentrant=False)
+            else:
+                x = layer(x, memory, src_mask, tgt_mask)
         return self.norm(x)
 
 class Transformer(nn.Module):
@@ -189,8 +203,12 @@ class LanguageModel(nn.Module):
             if p.dim() > 1:
                 nn.init.xavier_uniform_(p)
 
-    def forward(self, x, mask):
-        return self.generator(self.decoder(self.embed(x), None, None, mask))
+    def forward(self, x, mask, positions=None):
+        # mask is (batch, 1, seq_len, seq_len) or broadcastable to it, so a
+        # block-diagonal causal mask for packed sequences works as-is.
+        # positions (batch, seq_len) overrides the default 0..seq_len-1.
+        x = self.embed[1](self.embed[0](x), positions)
+        return self.generator(self.decoder(x, None, None, mask))
 
 class DecoderLayerLM(nn.Module):
     def __init__(self, size, self_attn, feed_forward, dropout):
@@ -213,3 +231,110 @@ def make_model(src_vocab, tgt_vocab, N=6, d_model=512, d_ff=2048, h=8, dropout=0
 def make_lm_model(vocab_size, N=6, d_model=512, d_ff=2048, h=8, dropout=0.1):
     return LanguageModel(vocab_size, N, d_model, d_ff, h, dropout)
 
+def set_activation_checkpointing(model, enabled=True):
+    """
+    Recompute each Encoder/Decoder layer's activations during backward
+    instead of storing them, trading compute for memory.
+    """
+    for module in model.modules():
+        if isinstance(module, (Encoder, Decoder)):
+            module.checkpoint_activations = enabled
+
+def init_cache(model):
+    """Empty key/value cache (one dict per decoder layer) for incremental decoding"""
+    return [{} for _ in model.decoder.layers]
+
+def cache_length(cache):
+    """Number of positions already held in a cache from init_cache()"""
+    return cache[0]['keys'].size(2) if 'keys' in cache[0] else 0
+
+def _split_heads(attn, linear, x):
+    return linear(x).view(x.size(0), -1, attn.h, attn.d_k).transpose(1, 2)
+
+def _cached_attention(attn, x, keys, values, mask):
+    """MultiHeadAttention of the positions in x over keys/values already split into heads"""
+    query = _split_heads(attn, attn.linears[0], x)
+    out, _ = attn.attention(query, keys, values, mask=mask)
+    out = out.transpose(1, 2).contiguous().view(x.size(0), -1, attn.h * attn.d_k)
+    return attn.linears[-1](out)
+
+def _decode_cached(decoder, x, cache, tgt_mask, memory=None, src_mask=None):
+    """
+    Run a Decoder over the new positions x only. Each layer's self-attention
+    keys/values (and its projection of memory, computed once) are kept in
+    cache, which is extended in place.
+    """
+    for layer, layer_cache in zip(decoder.layers, cache):
+        def self_attn(h):
+            keys = _split_heads(layer.self_attn, layer.self_attn.linears[1], h)
+            values = _split_heads(layer.self_attn, layer.self_attn.linears[2], h)
+            if 'keys' in layer_cache:
+                keys = torch.cat([layer_cache['keys'], keys], dim=2)
+                values = torch.cat([layer_cache['values'], values], dim=2)
+            layer_cache['keys'], layer_cache['values'] = keys, values
+            return _cached_attention(layer.self_attn, h, keys, values, tgt_mask)
+        
+        x = layer.sublayer[0](x, self_attn)
+        if memory is not None:
+            if 'memory_keys' not in layer_cache:
+                layer_cache['memory_keys'] = _split_heads(layer.src_attn, layer.src_attn.linears[1], memory)
+                layer_cache['memory_values'] = _split_heads(layer.src_attn, layer.src_attn.linears[2], memory)
+            x = layer.sublayer[1](x, lambda h: _cached_attention(
+                layer.src_attn, h, layer_cache['memory_keys'], layer_cache['memory_values'], src_mask))
+        x = layer.sublayer[-1](x, layer.feed_forward)
+    return decoder.norm(x)
+
+def _step_mask(n, past, device):
+    # New position i sees every cached position and new positions up to i
+    return torch.ones(n, past + n, dtype=torch.bool, device=device).tril(diagonal=past).unsqueeze(0).unsqueeze(0)
+
+def lm_decode_step(model, tokens, cache, positions=None, key_mask=None):
+    """
+    LanguageModel logits for new tokens (batch, n), attending to the cached
+    keys/values of all earlier positions, so a step only runs the new tokens.
+    
+    positions (batch, n) or (n,) defaults to continuing after the cache.
+    key_mask (batch, past + n) is False for padding keys. The first call
+    with an empty cache is the prefill of the whole prompt.
+    """
+    past = cache_length(cache)
+    if positions is None:
+        positions = torch.arange(past, past + tokens.size(1), device=tokens.device)
+    mask = _step_mask(tokens.size(1), past, tokens.device)
+    if key_mask is not None:
+        mask = mask & key_mask.unsqueeze(1).unsqueeze(2)
+    x = model.embed[1](model.embed[0](tokens), positions)
+    return model.generator(_decode_cached(model.decoder, x, cache, mask))
+
+def translation_decode_step(model, memory, src_mask, tokens, cache):
+    """Transformer.decode() for new target tokens (batch, n) using a key/value cache"""
+    past = cache_length(cache)
+    positions = torch.arange(past, past + tokens.size(1), device=tokens.device)
+    x = model.tgt_embed[1](model.tgt_embed[0](tokens), positions)
+    tgt_mask = _step_mask(tokens.size(1), past, tokens.device)
+    return model.generator(_decode_cached(model.decoder, x, cache, tgt_mask, memory, src_mask))
+
+def greedy_decode(model, src, src_mask, max_len=50, start_symbol=2, end_symbol=3, pad_symbol=0, memory=None):
+    """
+    Greedy decoding for a whole batch at once.
+    
+    The source is encoded once and all rows are extended in lockstep; rows
+    that have emitted end_symbol are filled with pad_symbol, and decoding
+    stops as soon as every row has finished or max_len is reached. Each
+    step only decodes the newest token, using a key/value cache. memory
+    can be passed in if the source has already been encoded.
+    Returns (batch, <= max_len) token ids starting with start_symbol.
+    """
+    if memory is None:
+        memory = model.encode(src, src_mask)
+    cache = init_cache(model)
+    ys = torch.full((src.size(0), 1), start_symbol, dtype=torch.long, device=src.device)
+    finished = torch.zeros(src.size(0), dtype=torch.bool, device=src.device)
+    for _ in range(max_len - 1):
+        next_word = translation_decode_step(model, memory, src_mask, ys[:, -1:], cache)[:, -1].argmax(dim=-1)
+        next_word = next_word.masked_fill(finished, pad_symbol)
+        ys = torch.cat([ys, next_word.unsqueeze(1)], dim=1)
+        finished |= next_word == end_symbol
+        if finished.all():
+            break
+    return ys
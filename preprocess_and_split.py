@@ -1,5 +1,14 @@
 import re
+import os
 import random
+import argparse
+import tempfile
+from collections import Counter, deque
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from analyze_dataset import analyze_line, print_report
 
 def clean_text(text):
     """Clean a single line of text."""
@@ -26,10 +35,92 @@ def clean_text(text):
     
     return text.strip()
 
-def preprocess_and_split(input_file, output_dir='Train', train_ratio=0.8, dev_ratio=0.1, test_ratio=0.1, seed=42):
+def read_chunks(input_file, chunk_size):
+    """Stream the raw input as lists of at most chunk_size lines."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = list(islice(f, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+def _process_chunk(lines, hasher=None):
+    """
+    Clean a chunk of raw lines and collect its character statistics (runs in a worker).
+    
+    Returns the cleaned lines with their offsets in the chunk, the raw line
+    count, the statistics and, when a dedup.MinHasher is given, the dedup
+    keys of each cleaned line.
+    """
+    stats = (Counter(), Counter(), Counter())
+    cleaned_lines = []
+    offsets = []
+    for offset, line in enumerate(lines):
+        analyze_line(line, *stats)
+        cleaned = clean_text(line)
+        if cleaned:  # Only keep non-empty lines
+            cleaned_lines.append(cleaned)
+            offsets.append(offset)
+    keys = [hasher.keys(line) for line in cleaned_lines] if hasher is not None else None
+    return cleaned_lines, offsets, len(lines), stats, keys
+
+def bounded_imap(pool, fn, items, window):
+    """
+    Like pool.imap, but with at most `window` items submitted and not yet consumed.
+    
+    Pool.imap reads its whole input into the task queue up front, which would pull
+    the entire corpus into memory; this keeps the streaming bounded.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(fn, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+def _map_chunks(chunks, num_workers, hasher=None):
+    """Process chunks in a pool, yielding results in input order."""
+    process = partial(_process_chunk, hasher=hasher)
+    if num_workers <= 1:
+        yield from map(process, chunks)
+        return
+    with Pool(num_workers) as pool:
+        yield from bounded_imap(pool, process, chunks, 2 * num_workers)
+
+@contextmanager
+def atomic_write(path):
+    """Open path for writing via a temporary file that replaces it only on success."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            yield f
+        # mkstemp creates the file 0600; give it the mode a plain open() would
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def preprocess_and_split(input_file, output_dir='Train', train_ratio=0.8, dev_ratio=0.1, test_ratio=0.1, seed=42,
+                         num_workers=None, chunk_size=10000, bucket_size_mb=64,
+                         dedup=False, dedup_report=None, dedup_on_disk=False):
     """
     Preprocess dataset and split into train/dev/test.
     
+    The input is streamed in chunks that a process pool cleans (clean_text)
+    and analyses (analyze_dataset.analyze_line) in the same pass. Cleaned
+    lines are scattered into random on-disk buckets, and each bucket is then
+    shuffled in memory and streamed into the splits, so memory is bounded by
+    the bucket size rather than the corpus size. Output files are replaced
+    atomically.
+    
+    With dedup=True, exact and MinHash near-duplicate lines (see dedup.py)
+    are dropped in the same pass, before splitting, so duplicates cannot
+    leak across train/dev/test.
+    
     Args:
         input_file: Path to input file
         output_dir: Directory to save output files
@@ -37,77 +128,133 @@ def preprocess_and_split(input_file, output_dir='Train', train_ratio=0.8, dev_ra
         dev_ratio: Fraction for development
         test_ratio: Fraction for testing
         seed: Random seed for reproducibility
+        num_workers: Cleaning processes (defaults to the CPU count)
+        chunk_size: Lines per chunk handed to a worker
+        bucket_size_mb: Approximate size of each shuffle bucket
+        dedup: Drop exact and near-duplicate lines before splitting
+        dedup_report: Optional JSONL path for the duplicate cluster report
+        dedup_on_disk: Keep the dedup key index in a temporary SQLite file,
+            so its memory stays bounded on large corpora
     """
     assert abs(train_ratio + dev_ratio + test_ratio - 1.0) < 1e-6, "Ratios must sum to 1.0"
     
-    random.seed(seed)
-    
-    # Read and clean all lines
-    print(f"Reading {input_file}...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+    rng = random.Random(seed)
+    num_workers = num_workers or os.cpu_count() or 1
+    bucket_bytes = max(1, int(bucket_size_mb * 1024 * 1024))
+    num_buckets = max(1, -(-os.path.getsize(input_file) // bucket_bytes))
     
-    print(f"Total lines: {len(lines)}")
-    
-    # Clean lines
-    print("Cleaning text...")
-    cleaned_lines = []
-    for idx, line in enumerate(lines):
-        cleaned = clean_text(line)
-        if cleaned:  # Only keep non-empty lines
-            cleaned_lines.append(cleaned)
-        
-        if (idx + 1) % 10000 == 0:
-            print(f"  Processed {idx + 1}/{len(lines)} lines...")
-    
-    print(f"Non-empty lines after cleaning: {len(cleaned_lines)}")
+    train_file = f"{output_dir}/shona_100K_train.txt"
+    dev_file = f"{output_dir}/shona_100K_dev.txt"
+    test_file = f"{output_dir}/shona_100K_test.txt"
     
-    # Shuffle
-    print("Shuffling...")
-    random.shuffle(cleaned_lines)
+    hasher, deduplicator = None, None
+    if dedup:
+        from dedup import MinHasher
+        hasher = MinHasher(seed=seed)
     
-    # Split
-    n_total = len(cleaned_lines)
-    n_train = int(n_total * train_ratio)
-    n_dev = int(n_total * dev_ratio)
+    special_chars, line_starts, unicode_cats = Counter(), Counter(), Counter()
+    n_lines = 0
+    n_total = 0
     
-    train_lines = cleaned_lines[:n_train]
-    dev_lines = cleaned_lines[n_train:n_train + n_dev]
-    test_lines = cleaned_lines[n_train + n_dev:]
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        bucket_paths = [os.path.join(tmp_dir, f"bucket_{i}.txt") for i in range(num_buckets)]
+        if dedup:
+            from dedup import Deduplicator
+            index_path = os.path.join(tmp_dir, "dedup_index.sqlite") if dedup_on_disk else None
+            deduplicator = Deduplicator(hasher.bands, index_path=index_path)
+        
+        # Pass 1: read, clean and analyse in parallel, scatter into buckets
+        print(f"Reading and cleaning {input_file} with {num_workers} workers...")
+        buckets = [open(path, 'w', encoding='utf-8') for path in bucket_paths]
+        try:
+            chunks = read_chunks(input_file, chunk_size)
+            for cleaned_lines, offsets, n_raw, stats, keys in _map_chunks(chunks, num_workers, hasher):
+                for i, line in enumerate(cleaned_lines):
+                    if deduplicator is not None and deduplicator.add(n_lines + offsets[i], *keys[i], text=line) is not None:
+                        continue
+                    buckets[rng.randrange(num_buckets)].write(line + '\n')
+                    n_total += 1
+                for total, part in zip((special_chars, line_starts, unicode_cats), stats):
+                    total.update(part)
+                n_lines += n_raw
+                print(f"  Processed {n_lines} lines...")
+        finally:
+            for bucket in buckets:
+                bucket.close()
+            if deduplicator is not None:
+                deduplicator.close()
+        
+        print(f"Total lines: {n_lines}")
+        if deduplicator is not None:
+            print(f"Duplicates removed: {deduplicator.n_exact} exact, {deduplicator.n_near} near")
+        print(f"Non-empty lines after cleaning: {n_total}")
+        
+        # Split
+        n_train = int(n_total * train_ratio)
+        n_dev = int(n_total * dev_ratio)
+        n_test = n_total - n_train - n_dev
+        
+        # Pass 2: shuffle each bucket and stream it into the splits
+        print("Shuffling and splitting...")
+        sample_lines = []
+        written = 0
+        with atomic_write(train_file) as train_f, atomic_write(dev_file) as dev_f, atomic_write(test_file) as test_f:
+            for path in bucket_paths:
+                with open(path, 'r', encoding='utf-8') as f:
+                    lines = f.read().splitlines()
+                rng.shuffle(lines)
+                for line in lines:
+                    if written < n_train:
+                        train_f.write(line + '\n')
+                        if len(sample_lines) < 5:
+                            sample_lines.append(line)
+                    elif written < n_train + n_dev:
+                        dev_f.write(line + '\n')
+                    else:
+                        test_f.write(line + '\n')
+                    written += 1
     
     print(f"\nSplit sizes:")
-    print(f"  Train: {len(train_lines)} ({len(train_lines)/n_total*100:.1f}%)")
-    print(f"  Dev:   {len(dev_lines)} ({len(dev_lines)/n_total*100:.1f}%)")
-    print(f"  Test:  {len(test_lines)} ({len(test_lines)/n_total*100:.1f}%)")
+    print(f"  Train: {n_train} ({n_train/max(n_total, 1)*100:.1f}%)")
+    print(f"  Dev:   {n_dev} ({n_dev/max(n_total, 1)*100:.1f}%)")
+    print(f"  Test:  {n_test} ({n_test/max(n_total, 1)*100:.1f}%)")
     
-    # Save
-    train_file = f"{output_dir}/shona_100K_train.txt"
-    dev_file = f"{output_dir}/shona_100K_dev.txt"
-    test_file = f"{output_dir}/shona_100K_test.txt"
+    print(f"\nSaved {train_file}, {dev_file}, {test_file}")
     
-    print(f"\nSaving files...")
-    with open(train_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(train_lines))
-    print(f"  Saved {train_file}")
+    if deduplicator is not None and dedup_report:
+        from dedup import lookup_lines, write_cluster_report
+        rep_texts = {idx: clean_text(line) for idx, line in lookup_lines(input_file, deduplicator.clusters).items()}
+        write_cluster_report(deduplicator, rep_texts, dedup_report)
     
-    with open(dev_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(dev_lines))
-    print(f"  Saved {dev_file}")
-    
-    with open(test_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(test_lines))
-    print(f"  Saved {test_file}")
+    # Character statistics from the same pass
+    print_report(special_chars, line_starts, unicode_cats, num_lines=n_lines)
     
     # Print sample
     print("\n" + "="*60)
     print("SAMPLE FROM TRAIN SET (first 5 lines)")
     print("="*60)
-    for i, line in enumerate(train_lines[:5], 1):
+    for i, line in enumerate(sample_lines, 1):
         print(f"{i}. {line[:100]}..." if len(line) > 100 else f"{i}. {line}")
     
     return train_file, dev_file, test_file
 
 if __name__ == "__main__":
-    input_file = "Train/shona_100K.txt"
-    train_file, dev_file, test_file = preprocess_and_split(input_file)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_file', type=str, default="Train/shona_100K.txt")
+    parser.add_argument('--output_dir', type=str, default="Train")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--num_workers', type=int, default=None)
+    parser.add_argument('--chunk_size', type=int, default=10000)
+    parser.add_argument('--bucket_size_mb', type=int, default=64)
+    parser.add_argument('--dedup', action='store_true', help='Drop exact and near-duplicate lines before splitting')
+    parser.add_argument('--dedup_report', type=str, default=None)
+    parser.add_argument('--dedup_on_disk', action='store_true', help='Keep the dedup index on disk to bound memory')
+    args = parser.parse_args()
+    
+    train_file, dev_file, test_file = preprocess_and_split(
+        args.input_file, args.output_dir, seed=args.seed,
+        num_workers=args.num_workers, chunk_size=args.chunk_size,
+        bucket_size_mb=args.bucket_size_mb,
+        dedup=args.dedup, dedup_report=args.dedup_report, dedup_on_disk=args.dedup_on_disk
+    )
     print("\n✅ Preprocessing and splitting complete!")
@@ -0,0 +1,303 @@
+"""
+Parallel hyperparameter sweeps over train.py / train_gen.py.
+
+A sweep spec is a JSON file such as:
+
+    {
+        "script": "train.py",
+        "method": "random",
+        "num_trials": 12,
+        "parameters": {
+            "d_model": [128, 256, 512],
+            "n_layers": {"values": [2, 3, 4]},
+            "heads": [4, 8],
+            "dropout": {"min": 0.1, "max": 0.5},
+            "label_smoothing": {"min": 0.0, "max": 0.2},
+            "lr": {"min": 1e-5, "max": 1e-3, "log": true}
+        },
+        "fixed": {"epochs": 9, "batch_size": 32}
+    }
+
+With "method": "grid" every combination of the listed values is run. Each
+trial is a separate process pinned (sched_setaffinity) to its own subset of
+cores with OMP/MKL threads set to match, and every trial reads the same
+pre-tokenized --data_cache, which is built once before any trial starts.
+Trials report per-epoch validation loss through --metrics_file (the
+fixed-subset loss for trials run with --val_subset, which report it every
+epoch, else the full-pass loss); at each successive-halving rung
+(min_epochs * eta**k epochs) a trial is killed unless its loss is in the
+best 1/eta of the trials that have reached that rung with the same metric.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+def valid_heads(trial):
+    """Multi-head attention needs d_model divisible by the number of heads."""
+    return trial.get('d_model', 1) % trial.get('heads', 1) == 0
+
+def sample_trials(spec, seed=42, max_attempts=1000):
+    """Expand a sweep spec into a list of parameter dicts."""
+    parameters = spec['parameters']
+    if spec.get('method', 'grid') == 'grid':
+        names = sorted(parameters)
+        grids = []
+        for name in names:
+            values = parameters[name]
+            if isinstance(values, dict):
+                if 'values' not in values:
+                    raise ValueError(f"Grid sweeps need a list of values for '{name}'; "
+                                     f"min/max ranges are only supported with \"method\": \"random\"")
+                values = values['values']
+            grids.append(values)
+        combos = [dict(zip(names, combo)) for combo in itertools.product(*grids)]
+        trials = [t for t in combos if valid_heads(t)]
+        if len(trials) < len(combos):
+            print(f"Skipping {len(combos) - len(trials)} grid combinations with d_model not divisible by heads")
+        return trials
+    
+    rng = random.Random(seed)
+    num_trials = spec.get('num_trials', 10)
+    trials = []
+    for _ in range(max_attempts):
+        if len(trials) == num_trials:
+            break
+        trial = {}
+        for name, values in sorted(parameters.items()):
+            if isinstance(values, dict) and 'values' in values:
+                values = values['values']
+            if isinstance(values, list):
+                trial[name] = rng.choice(values)
+            elif values.get('log'):
+                trial[name] = math.exp(rng.uniform(math.log(values['min']), math.log(values['max'])))
+            else:
+                trial[name] = rng.uniform(values['min'], values['max'])
+            if isinstance(values, dict) and values.get('type') == 'int':
+                trial[name] = int(round(trial[name]))
+        # Resample invalid combinations so the sweep still runs num_trials trials
+        if valid_heads(trial):
+            trials.append(trial)
+    if len(trials) < num_trials:
+        raise ValueError(f"Only {len(trials)} of {num_trials} trials had d_model divisible by heads "
+                         f"after {max_attempts} samples; check the d_model and heads values")
+    return trials
+
+def validation_loss(record):
+    """
+    (metric, loss) to rank a trial's epoch record by. A --val_subset trial
+    reports val_subset_loss every epoch (the full pass only runs when it
+    improves), so it is always ranked on that; other trials on valid_loss.
+    """
+    if 'val_subset_loss' in record:
+        return 'val_subset_loss', record['val_subset_loss']
+    return 'valid_loss', record.get('valid_loss')
+
+def to_cli(params):
+    """Turn {name: value} into argparse-style flags."""
+    args = []
+    for name, value in params.items():
+        if isinstance(value, bool):
+            if value:
+                args.append(f'--{name}')
+        else:
+            args += [f'--{name}', str(value)]
+    return args
+
+class SuccessiveHalving:
+    """
+    Asynchronous successive-halving stopping rule.
+    
+    Rungs are at min_epochs * eta**k epochs. A trial reporting at a rung
+    continues only if its loss is within the best 1/eta of all losses seen
+    at that rung so far for the same metric (full-pass and subset losses are
+    not comparable); until eta such trials have reached a rung, all continue.
+    """
+    def __init__(self, max_epochs, min_epochs=1, eta=3):
+        self.eta = eta
+        self.rungs = {}
+        epochs = min_epochs
+        while epochs < max_epochs:
+            self.rungs[epochs] = {}
+            epochs *= eta
+    
+    def should_stop(self, epoch, loss, metric='valid_loss'):
+        if epoch not in self.rungs:
+            return False
+        results = self.rungs[epoch].setdefault(metric, [])
+        results.append(loss)
+        keep = len(results) // self.eta
+        if keep == 0:
+            return False
+        return loss > sorted(results)[keep - 1]
+
+class Trial:
+    def __init__(self, idx, params, out_dir, sweep_name):
+        self.idx = idx
+        self.params = params
+        self.run_name = f"{sweep_name}-t{idx:03d}"
+        self.metrics_path = os.path.join(out_dir, f"{self.run_name}.metrics.jsonl")
+        self.log_path = os.path.join(out_dir, f"{self.run_name}.log")
+        self.process = None
+        self.status = 'pending'
+        self.epochs = []
+        self._offset = 0
+        self.start_time = None
+        self.duration = 0.0
+    
+    def launch(self, script, fixed, cores, data_cache, gpu=None):
+        cmd = [sys.executable, script] + to_cli({**fixed, **self.params}) + [
+            '--run_name', self.run_name, '--metrics_file', self.metrics_path, '--data_cache', data_cache
+        ]
+        if 'log_backends' not in fixed:
+            cmd += ['--log_backends', 'jsonl']
+        env = dict(os.environ)
+        for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+            env[var] = str(len(cores))
+        if gpu is not None:
+            env['CUDA_VISIBLE_DEVICES'] = str(gpu)
+        # A previous run of the same trial must not be read as this one's epochs
+        if os.path.exists(self.metrics_path):
+            os.remove(self.metrics_path)
+        self.log_file = open(self.log_path, 'w')
+        self.process = subprocess.Popen(
+            cmd, stdout=self.log_file, stderr=subprocess.STDOUT, env=env,
+            preexec_fn=lambda: os.sched_setaffinity(0, cores)
+        )
+        self.cores = cores
+        self.status = 'running'
+        self.start_time = time.time()
+    
+    def poll_epochs(self):
+        """Return epoch records written since the last poll."""
+        if not os.path.exists(self.metrics_path):
+            return []
+        new = []
+        with open(self.metrics_path, 'r', encoding='utf-8') as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break # partially written; read it next time
+                self._offset += len(line.encode('utf-8'))
+                record = json.loads(line)
+                # Epoch records only; mid-epoch validation records carry no 'epoch'
+                if 'epoch' in record and validation_loss(record)[1] is not None:
+                    new.append(record)
+        self.epochs += new
+        return new
+    
+    def finish(self, status):
+        self.status = status
+        self.duration = time.time() - self.start_time
+        self.log_file.close()
+    
+    @property
+    def best_valid_loss(self):
+        return min((validation_loss(e)[1] for e in self.epochs), default=float('inf'))
+
+def run_sweep(spec, concurrency, out_dir, data_cache, sweep_name, eta=3, min_epochs=1, gpus=None, seed=42):
+    script = spec.get('script', 'train.py')
+    fixed = spec.get('fixed', {})
+    trials = [Trial(i, params, out_dir, sweep_name) for i, params in enumerate(sample_trials(spec, seed))]
+    os.makedirs(out_dir, exist_ok=True)
+    
+    # Tokenize once; every trial then mmaps the same cache
+    print(f"Preparing data cache {data_cache}...")
+    subprocess.run(
+        [sys.executable, script, '--data_cache', data_cache, '--prepare_data', '--log_backends', 'jsonl',
+         '--log_dir', out_dir] + to_cli({k: v for k, v in fixed.items() if k != 'log_backends'}),
+        check=True
+    )
+    
+    cores = sorted(os.sched_getaffinity(0))
+    per_trial = max(1, len(cores) // concurrency)
+    core_slots = [set(cores[i * per_trial:(i + 1) * per_trial]) or set(cores) for i in range(concurrency)]
+    scheduler = SuccessiveHalving(fixed.get('epochs', 10), min_epochs, eta)
+    print(f"Running {len(trials)} trials, {concurrency} at a time on {per_trial} core(s) each")
+    
+    pending = list(trials)
+    running = {} # slot -> trial
+    while pending or running:
+        for slot in range(concurrency):
+            if slot not in running and pending:
+                trial = pending.pop(0)
+                gpu = gpus[slot % len(gpus)] if gpus else None
+                trial.launch(script, fixed, core_slots[slot], data_cache, gpu)
+                running[slot] = trial
+                print(f"[{trial.run_name}] started {trial.params}")
+        
+        time.sleep(1.0)
+        for slot, trial in list(running.items()):
+            for record in trial.poll_epochs():
+                metric, loss = validation_loss(record)
+                if scheduler.should_stop(record['epoch'], loss, metric):
+                    trial.process.terminate()
+                    trial.process.wait()
+                    trial.finish('pruned')
+                    print(f"[{trial.run_name}] pruned at epoch {record['epoch']} ({metric} {loss:.3f})")
+                    break
+            if trial.status == 'running' and trial.process.poll() is not None:
+                trial.poll_epochs()
+                trial.finish('done' if trial.process.returncode == 0 else 'failed')
+                print(f"[{trial.run_name}] {trial.status}")
+            if trial.status != 'running':
+                del running[slot]
+    
+    return trials
+
+def print_results(trials, results_path=None):
+    """Print all trials as one table, best validation loss first."""
+    trials = sorted(trials, key=lambda t: t.best_valid_loss)
+    names = sorted({name for t in trials for name in t.params})
+    header = f"{'Run':>14} | {'Status':>7} | {'Epochs':>6} | {'Best val':>8} | {'Time s':>7} | " + ' | '.join(names)
+    print("\n" + "=" * len(header))
+    print("SWEEP RESULTS")
+    print("=" * len(header))
+    print(header)
+    for t in trials:
+        values = ' | '.join(f"{t.params.get(name, ''):.4g}" if isinstance(t.params.get(name), float)
+                            else str(t.params.get(name, '')) for name in names)
+        print(f"{t.run_name:>14} | {t.status:>7} | {len(t.epochs):>6} | {t.best_valid_loss:>8.3f} | "
+              f"{t.duration:>7.0f} | {values}")
+    
+    if results_path:
+        with open(results_path, 'w', encoding='utf-8') as f:
+            for t in trials:
+                f.write(json.dumps({
+                    'run_name': t.run_name, 'status': t.status, 'params': t.params,
+                    'best_valid_loss': t.best_valid_loss, 'epochs': t.epochs, 'seconds': t.duration,
+                }) + '\n')
+        print(f"\nResults written to {results_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a hyperparameter sweep over train.py / train_gen.py")
+    parser.add_argument('spec', type=str, help='JSON sweep spec')
+    parser.add_argument('--concurrency', type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help='Trials run at once; cores are split evenly between them')
+    parser.add_argument('--eta', type=int, default=3, help='Successive-halving reduction factor')
+    parser.add_argument('--min_epochs', type=int, default=1, help='Epochs before the first halving rung')
+    parser.add_argument('--gpus', type=int, nargs='*', default=None, help='GPU ids assigned round-robin to trial slots')
+    parser.add_argument('--name', type=str, default=None, help='Sweep name (default: spec file name)')
+    parser.add_argument('--out_dir', type=str, default='sweeps')
+    parser.add_argument('--data_cache', type=str, default=None,
+                        help='Pre-tokenized data shared by all trials (default: <out_dir>/<name>.data.pt)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for random search')
+    args = parser.parse_args()
+    
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+    name = args.name or os.path.splitext(os.path.basename(args.spec))[0]
+    out_dir = os.path.join(args.out_dir, name)
+    data_cache = args.data_cache or os.path.join(out_dir, f"{name}.data.pt")
+    
+    trials = run_sweep(spec, args.concurrency, out_dir, data_cache, name,
+                       eta=args.eta, min_epochs=args.min_epochs, gpus=args.gpus, seed=args.seed)
+    print_results(trials, os.path.join(out_dir, 'results.jsonl'))
+
+if __name__ == "__main__":
+    main()
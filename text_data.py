@@ -1,7 +1,15 @@
 import torch
-from torch.utils.data import Dataset, DataLoader
+import torch.distributed as dist
+from torch.utils.data import Dataset, IterableDataset, DataLoader, Sampler, Subset, get_worker_info
 from collections import Counter
+import itertools
+import json
+import math
 import os
+import queue
+import random
+import threading
+import time
 from typing import List, Tuple, Dict
 import re
 
@@ -101,6 +109,234 @@ class GenerationDataset(Dataset):
         # But here we just return the full sequence, slicing happens in training loop or collate
         return torch.tensor(ids)
 
+def encode_corpus(texts: List[str], tokenizer: Tokenizer) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Encode texts into one flat id tensor plus offsets; text i is ids[offsets[i]:offsets[i + 1]]."""
+    ids, offsets = [], [0]
+    for text in texts:
+        ids.extend(tokenizer.encode(text))
+        offsets.append(len(ids))
+    return torch.tensor(ids, dtype=torch.long), torch.tensor(offsets, dtype=torch.long)
+
+class TokenizedDataset(Dataset):
+    """
+    Pre-tokenized corpus held as flat (ids, offsets) tensors, one pair per column.
+    
+    With two columns it yields the same (src, trg) items as TranslationDataset,
+    with one the same sequences as GenerationDataset, without re-tokenizing.
+    Loaded from a data cache with mmap=True, the tensors are shared through
+    the page cache by every process that reads the cache.
+    """
+    def __init__(self, *columns: Tuple[torch.Tensor, torch.Tensor]):
+        self.columns = columns
+    
+    def __len__(self):
+        return len(self.columns[0][1]) - 1
+    
+    def __getitem__(self, idx):
+        # clone() so workers don't ship the whole flat storage with each item
+        items = tuple(
+            ids[int(offsets[idx]):int(offsets[idx + 1])].clone()
+            for ids, offsets in self.columns
+        )
+        return items if len(items) > 1 else items[0]
+
+def _save_data_cache(cache: Dict, cache_path: str):
+    directory = os.path.dirname(cache_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{cache_path}.tmp.{os.getpid()}"
+    torch.save(cache, tmp)
+    os.replace(tmp, cache_path)
+
+def _load_data_cache(cache_path: str, sources: Dict) -> Dict:
+    cache = torch.load(cache_path, mmap=True, weights_only=False)
+    if cache['sources'] != sources:
+        raise ValueError(f"Data cache {cache_path} was built from {cache['sources']}, not {sources}")
+    return cache
+
+def build_translation_cache(train_src: str, train_trg: str, test_src: str, test_trg: str,
+                            cache_path: str, min_freq: int = 2):
+    """Tokenize the translation corpora once and save tokenizers plus encoded splits to cache_path."""
+    src_tokenizer = Tokenizer(min_freq=min_freq)
+    trg_tokenizer = Tokenizer(min_freq=min_freq)
+    with open(train_src, 'r') as f: src_tokenizer.build_vocab(f.readlines())
+    with open(train_trg, 'r') as f: trg_tokenizer.build_vocab(f.readlines())
+    
+    train = TranslationDataset(train_src, train_trg, src_tokenizer, trg_tokenizer)
+    test = TranslationDataset(test_src, test_trg, src_tokenizer, trg_tokenizer)
+    _save_data_cache({
+        'sources': {'train': [train_src, train_trg], 'test': [test_src, test_trg], 'min_freq': min_freq},
+        'src_tokenizer': src_tokenizer,
+        'trg_tokenizer': trg_tokenizer,
+        'train': [encode_corpus(train.src_data, src_tokenizer), encode_corpus(train.trg_data, trg_tokenizer)],
+        'test': [encode_corpus(test.src_data, src_tokenizer), encode_corpus(test.trg_data, trg_tokenizer)],
+    }, cache_path)
+
+def build_generation_cache(train_path: str, dev_path: str, test_path: str, cache_path: str, min_freq: int = 2):
+    """Tokenize the generation corpora once and save the tokenizer plus encoded splits to cache_path."""
+    tokenizer = Tokenizer(min_freq=min_freq)
+    tokenizer.build_vocab(iter_corpus_lines(train_path))
+    
+    def encode(path):
+        return [encode_corpus(GenerationDataset(path, tokenizer).data, tokenizer)] if path else None
+    
+    _save_data_cache({
+        'sources': {'train': train_path, 'dev': dev_path, 'test': test_path, 'min_freq': min_freq},
+        'tokenizer': tokenizer,
+        'train': encode(train_path),
+        'dev': encode(dev_path),
+        'test': encode(test_path),
+    }, cache_path)
+
+def iter_corpus_lines(path: str):
+    """Lazily yield the stripped, non-empty lines of a line-delimited corpus."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+def get_shard_info() -> Tuple[int, int]:
+    """
+    Return (shard_id, num_shards) for the calling DataLoader worker.
+
+    Shards are laid out rank-major over (rank, worker), so every line of the
+    corpus is owned by exactly one worker across all processes.
+    """
+    rank, world_size = 0, 1
+    if dist.is_available() and dist.is_initialized():
+        rank, world_size = dist.get_rank(), dist.get_world_size()
+    worker = get_worker_info()
+    worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+    return rank * num_workers + worker_id, world_size * num_workers
+
+class StreamingGenerationDataset(IterableDataset):
+    """
+    Reads a line-delimited corpus lazily instead of holding it in memory.
+
+    Line i goes to shard i % num_shards (see get_shard_info) and is shuffled
+    through a bounded buffer whose RNG is keyed on (seed, epoch, shard), so an
+    epoch is reproducible for a fixed worker/rank layout. Call set_epoch()
+    before iterating each epoch.
+
+    With holdout_every=k, every k-th line forms the 'val' split and the rest
+    the 'train' split, a deterministic stand-in for random_split. With
+    block_size set, sentences are packed as in PackedGenerationDataset.
+    """
+    def __init__(
+        self, path: str, tokenizer: Tokenizer,
+        shuffle_buffer: int = 10000, seed: int = 42,
+        holdout_every: int = 0, split: str = 'train',
+        block_size: int = None
+    ):
+        assert split in ('train', 'val'), f"Unknown split: {split}"
+        self.path = path
+        self.tokenizer = tokenizer
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.holdout_every = holdout_every
+        self.split = split
+        self.block_size = block_size
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def _iter_shard(self, shard_id: int, num_shards: int):
+        for idx, line in enumerate(iter_corpus_lines(self.path)):
+            if self.holdout_every:
+                in_val = idx % self.holdout_every == 0
+                if in_val != (self.split == 'val'):
+                    continue
+            if idx % num_shards == shard_id:
+                yield line
+
+    def _shuffle(self, items, rng: random.Random):
+        buffer = []
+        for item in items:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(item)
+                continue
+            j = rng.randrange(len(buffer))
+            yield buffer[j]
+            buffer[j] = item
+        rng.shuffle(buffer)
+        yield from buffer
+
+    def __iter__(self):
+        shard_id, num_shards = get_shard_info()
+        lines = self._iter_shard(shard_id, num_shards)
+        if self.shuffle_buffer > 0:
+            rng = random.Random(f"{self.seed}-{self.epoch}-{shard_id}")
+            lines = self._shuffle(lines, rng)
+        docs = (self.tokenizer.encode(line) for line in lines)
+        if self.block_size:
+            for block in pack_documents(docs, self.block_size, self.tokenizer.pad_token_id):
+                yield tuple(torch.tensor(t) for t in block)
+        else:
+            for ids in docs:
+                yield torch.tensor(ids)
+
+def pack_documents(docs, block_size: int, pad_idx: int = 0):
+    """
+    Greedily pack tokenized documents into fixed-length rows.
+
+    Each document [<sos>, w1, ..., <eos>] contributes inputs ids[:-1] and
+    targets ids[1:], exactly as the padded path slices it, so the loss covers
+    the same tokens. A document never straddles two rows unless it is longer
+    than block_size, in which case it is split into chunks.
+
+    Yields (input_ids, target_ids, position_ids, segment_ids) lists of length
+    block_size. Positions restart at 0 for every document; segment ids number
+    the documents within a row from 1, with 0 marking padding.
+    """
+    inputs, targets, positions, segments = [], [], [], []
+
+    def flush():
+        n_pad = block_size - len(inputs)
+        return (
+            inputs + [pad_idx] * n_pad,
+            targets + [pad_idx] * n_pad,
+            positions + [0] * n_pad,
+            segments + [0] * n_pad,
+        )
+
+    for ids in docs:
+        doc_inputs, doc_targets = ids[:-1], ids[1:]
+        for start in range(0, len(doc_inputs), block_size):
+            chunk = doc_inputs[start:start + block_size]
+            if len(inputs) + len(chunk) > block_size:
+                yield flush()
+                inputs, targets, positions, segments = [], [], [], []
+            segment_id = (segments[-1] if segments else 0) + 1
+            inputs.extend(chunk)
+            targets.extend(doc_targets[start:start + block_size])
+            positions.extend(range(start, start + len(chunk)))
+            segments.extend([segment_id] * len(chunk))
+
+    if inputs:
+        yield flush()
+
+class PackedGenerationDataset(Dataset):
+    """
+    Packs the sentences of a generation dataset into fixed-length blocks.
+
+    Items are (input_ids, target_ids, position_ids, segment_ids) tensors of
+    length block_size; see pack_documents for the layout.
+    """
+    def __init__(self, dataset: Dataset, block_size: int = 128, pad_idx: int = 0):
+        self.block_size = block_size
+        docs = (dataset[i].tolist() for i in range(len(dataset)))
+        blocks = [torch.tensor(block) for block in pack_documents(docs, block_size, pad_idx)]
+        self.blocks = torch.stack(blocks) if blocks else torch.empty(0, 4, block_size, dtype=torch.long)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, idx):
+        input_ids, target_ids, position_ids, segment_ids = self.blocks[idx]
+        return input_ids, target_ids, position_ids, segment_ids
+
 def collate_fn_translation(batch, pad_idx):
     src_batch, trg_batch = zip(*batch)
     
@@ -113,44 +349,436 @@ def collate_fn_generation(batch, pad_idx):
     batch_padded = torch.nn.utils.rnn.pad_sequence(batch, padding_value=pad_idx, batch_first=True)
     return batch_padded
 
+class TranslationCollator:
+    """Picklable collate_fn for translation batches, usable from spawned workers."""
+    def __init__(self, pad_idx: int):
+        self.pad_idx = pad_idx
+
+    def __call__(self, batch):
+        return collate_fn_translation(batch, self.pad_idx)
+
+class GenerationCollator:
+    """Picklable collate_fn for generation batches, usable from spawned workers."""
+    def __init__(self, pad_idx: int):
+        self.pad_idx = pad_idx
+
+    def __call__(self, batch):
+        return collate_fn_generation(batch, self.pad_idx)
+
+def _loader_kwargs(num_workers: int, prefetch_factor: int, persistent_workers: bool, pin_memory: bool) -> Dict:
+    kwargs = {'num_workers': num_workers, 'pin_memory': pin_memory}
+    # DataLoader rejects these options when loading in the main process
+    if num_workers > 0:
+        kwargs['prefetch_factor'] = prefetch_factor
+        kwargs['persistent_workers'] = persistent_workers
+    return kwargs
+
+class ResumableSampler(Sampler):
+    """
+    Shuffling, optionally rank-sharded sampler that can restart mid-epoch.
+    
+    The order of an epoch depends only on (seed, epoch), and the padding and
+    rank interleaving mirror DistributedSampler. set_start(n) skips the first
+    n indices of this rank's share for the current epoch, so a loader resumed
+    after k batches yields exactly the batches that would have followed;
+    set_epoch() clears it.
+    """
+    def __init__(self, dataset, shuffle: bool = True, num_replicas: int = None, rank: int = None,
+                 seed: int = 0, drop_last: bool = False):
+        if num_replicas is None or rank is None:
+            distributed = dist.is_available() and dist.is_initialized()
+            num_replicas = dist.get_world_size() if distributed else 1
+            rank = dist.get_rank() if distributed else 0
+        self.dataset = dataset
+        self.shuffle = shuffle
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.drop_last = drop_last
+        if drop_last:
+            self.num_samples = len(dataset) // num_replicas
+        else:
+            self.num_samples = math.ceil(len(dataset) / num_replicas)
+        self.total_size = self.num_samples * num_replicas
+        self.epoch = 0
+        self.start = 0
+    
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+        self.start = 0
+    
+    def set_start(self, start: int):
+        self.start = min(start, self.num_samples)
+    
+    def __iter__(self):
+        if self.shuffle:
+            g = torch.Generator()
+            g.manual_seed(self.seed + self.epoch)
+            indices = torch.randperm(len(self.dataset), generator=g).tolist()
+        else:
+            indices = list(range(len(self.dataset)))
+        if self.drop_last:
+            indices = indices[:self.total_size]
+        else:
+            # Repeat from the start so every rank gets the same number of samples
+            padding = self.total_size - len(indices)
+            indices += (indices * math.ceil(padding / max(len(indices), 1)))[:padding]
+        indices = indices[self.rank:self.total_size:self.num_replicas]
+        return iter(indices[self.start:])
+    
+    def __len__(self):
+        return self.num_samples - self.start
+
+def sequence_lengths(dataset) -> torch.Tensor:
+    """
+    Token length of every item of a dataset (the longer side of a
+    translation pair). Read from the offsets of a TokenizedDataset, so a
+    data cache needs no re-tokenization; other datasets are encoded once.
+    """
+    if isinstance(dataset, Subset):
+        return sequence_lengths(dataset.dataset)[torch.as_tensor(dataset.indices, dtype=torch.long)]
+    if isinstance(dataset, TokenizedDataset):
+        return torch.stack([offsets[1:] - offsets[:-1] for _, offsets in dataset.columns]).amax(dim=0)
+    lengths = []
+    for idx in range(len(dataset)):
+        item = dataset[idx]
+        items = item if isinstance(item, (list, tuple)) else (item,)
+        lengths.append(max(len(t) for t in items))
+    return torch.tensor(lengths, dtype=torch.long)
+
+class LengthCurriculumBatchSampler(Sampler):
+    """
+    Batch sampler that buckets by length and widens the admissible length
+    over training.
+    
+    Each epoch admits the shortest `competence` fraction of the items, with
+    competence = sqrt(start**2 + (1 - start**2) * epoch / curriculum_epochs)
+    capped at 1 (curriculum_epochs=0 admits everything from the start).
+    With bucket=True the admitted items are shuffled, cut into pools of
+    batch_size * bucket_pool items, sorted by length within each pool and
+    batched, so each batch holds similar lengths and little padding; the
+    batch order is then shuffled. Otherwise batches are drawn uniformly from
+    the admitted items.
+    
+    Like ResumableSampler, the batches of an epoch depend only on
+    (seed, epoch), are interleaved across num_replicas ranks (padded by
+    repeating batches so every rank has as many), and set_start(n) skips
+    this rank's first n batches of the epoch.
+    """
+    def __init__(self, lengths: torch.Tensor, batch_size: int, curriculum_epochs: int = 0, start: float = 0.2,
+                 bucket: bool = True, bucket_pool: int = 50, num_replicas: int = None, rank: int = None, seed: int = 0):
+        if num_replicas is None or rank is None:
+            distributed = dist.is_available() and dist.is_initialized()
+            num_replicas = dist.get_world_size() if distributed else 1
+            rank = dist.get_rank() if distributed else 0
+        self.lengths = lengths
+        self.sorted_lengths = lengths.sort().values
+        self.batch_size = batch_size
+        self.curriculum_epochs = curriculum_epochs
+        self.start_competence = start
+        self.bucket = bucket
+        self.bucket_pool = bucket_pool
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.seed = seed
+        self.start = 0
+        self.set_epoch(0)
+    
+    def competence(self, epoch: int) -> float:
+        if self.curriculum_epochs <= 0:
+            return 1.0
+        c0 = self.start_competence
+        return min(1.0, math.sqrt(c0 ** 2 + (1 - c0 ** 2) * epoch / self.curriculum_epochs))
+    
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+        self.start = 0
+        n = len(self.sorted_lengths)
+        # Longest admissible length: the competence quantile of all lengths
+        self.max_length = int(self.sorted_lengths[max(math.ceil(self.competence(epoch) * n), 1) - 1]) if n else 0
+        self._batches = self._make_batches()
+    
+    def set_start(self, start: int):
+        self.start = min(start, len(self._batches))
+    
+    def _make_batches(self) -> List[List[int]]:
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        admitted = torch.nonzero(self.lengths <= self.max_length).flatten()
+        admitted = admitted[torch.randperm(len(admitted), generator=g)]
+        if self.bucket:
+            pool_size = self.batch_size * self.bucket_pool
+            batches = []
+            for pool in admitted.split(pool_size):
+                pool = pool[self.lengths[pool].argsort(stable=True)]
+                batches += [b.tolist() for b in pool.split(self.batch_size)]
+            batches = [batches[i] for i in torch.randperm(len(batches), generator=g).tolist()]
+        else:
+            batches = [b.tolist() for b in admitted.split(self.batch_size)]
+        # Repeat from the start so every rank gets the same number of batches
+        num_batches = math.ceil(len(batches) / self.num_replicas)
+        padding = num_batches * self.num_replicas - len(batches)
+        batches += (batches * math.ceil(padding / max(len(batches), 1)))[:padding]
+        return batches[self.rank::self.num_replicas]
+    
+    def __iter__(self):
+        return iter(self._batches[self.start:])
+    
+    def __len__(self):
+        return len(self._batches) - self.start
+
+def _make_loader(dataset, batch_size: int, shuffle: bool, distributed: bool = False, seed: int = 0, **kwargs) -> DataLoader:
+    # Under torch.distributed each rank iterates its own 1/world_size of the data.
+    # Shuffled loaders always get a ResumableSampler so training can resume mid-epoch
+    sampler = None
+    if distributed or shuffle:
+        sampler = ResumableSampler(dataset, shuffle=shuffle, num_replicas=None if distributed else 1,
+                                   rank=None if distributed else 0, seed=seed)
+    # A private generator keeps worker seeding off the global RNG, which the
+    # DevicePrefetcher thread would otherwise draw from concurrently with training
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return DataLoader(dataset, batch_size=batch_size, sampler=sampler, generator=generator, **kwargs)
+
+def _make_length_loader(dataset, batch_size: int, curriculum_epochs: int, curriculum_start: float, bucket: bool,
+                        distributed: bool = False, seed: int = 0, **kwargs) -> DataLoader:
+    batch_sampler = LengthCurriculumBatchSampler(
+        sequence_lengths(dataset), batch_size, curriculum_epochs, curriculum_start, bucket,
+        num_replicas=None if distributed else 1, rank=None if distributed else 0, seed=seed
+    )
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    return DataLoader(dataset, batch_sampler=batch_sampler, generator=generator, **kwargs)
+
+def seek_loader(loader, batches: int) -> int:
+    """
+    Position a loader (or a DevicePrefetcher over one) to resume after the
+    first `batches` batches of the current epoch; call after set_epoch().
+    
+    Returns how many batches the caller still has to skip by iterating,
+    which is non-zero only for loaders without a ResumableSampler or
+    LengthCurriculumBatchSampler (e.g. streaming datasets).
+    """
+    inner = getattr(loader, 'loader', loader)
+    if batches and isinstance(getattr(inner, 'batch_sampler', None), LengthCurriculumBatchSampler):
+        inner.batch_sampler.set_start(batches)
+        return 0
+    sampler = getattr(inner, 'sampler', None)
+    if batches and isinstance(sampler, ResumableSampler):
+        sampler.set_start(batches * inner.batch_size)
+        return 0
+    return batches
+
+def split_indices(n: int, val_fraction: float = 0.2, split_file: str = None, seed: int = 42) -> Tuple[List[int], List[int]]:
+    """
+    Train/validation indices for a dataset of n items, laid out as random_split does.
+    
+    With split_file, the split is read from it if it exists (it must have been
+    made for n items with the same seed and val_fraction) and written to it
+    otherwise, so every run that shares the file validates on the same
+    examples. Without one, the permutation is drawn from the global RNG
+    exactly like random_split.
+    """
+    if split_file and os.path.exists(split_file):
+        with open(split_file, 'r') as f:
+            split = json.load(f)
+        if split['n'] != n:
+            raise ValueError(f"Split file {split_file} was made for {split['n']} items, dataset has {n}")
+        for name, value in (('seed', seed), ('val_fraction', val_fraction)):
+            if name in split and split[name] != value:
+                raise ValueError(f"Split file {split_file} was made with {name}={split[name]}, this run uses "
+                                 f"{name}={value}; pass a different --split_file or delete it to re-split")
+        return split['train'], split['val']
+    
+    generator = torch.Generator().manual_seed(seed) if split_file else None
+    perm = torch.randperm(n, generator=generator).tolist()
+    train_size = n - int(val_fraction * n)
+    train, val = perm[:train_size], perm[train_size:]
+    
+    if split_file:
+        directory = os.path.dirname(split_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{split_file}.tmp.{os.getpid()}"
+        with open(tmp, 'w') as f:
+            json.dump({'n': n, 'seed': seed, 'val_fraction': val_fraction, 'train': train, 'val': val}, f)
+        os.replace(tmp, split_file)
+    return train, val
+
+class _FirstBatches:
+    """Re-iterable view of the first n batches of a loader."""
+    def __init__(self, loader, n: int):
+        self.loader = loader
+        self.n = n
+    
+    def __iter__(self):
+        return itertools.islice(iter(self.loader), self.n)
+    
+    def __len__(self):
+        return self.n
+
+def subset_loader(loader, size: int, distributed: bool = False):
+    """
+    Loader over the first `size` items of loader's dataset, batched and
+    collated the same way.
+    
+    For a persisted validation split (see split_indices) this is a fixed
+    random subset of it. Streaming loaders are cut to the batches covering
+    their first `size` items.
+    """
+    if isinstance(loader.dataset, IterableDataset):
+        return _FirstBatches(loader, math.ceil(size / loader.batch_size))
+    subset = Subset(loader.dataset, range(min(size, len(loader.dataset))))
+    return _make_loader(subset, loader.batch_size, shuffle=False, distributed=distributed, collate_fn=loader.collate_fn)
+
+def _to_device(batch, device, non_blocking: bool = False):
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(t.to(device, non_blocking=non_blocking) for t in batch)
+    return batch.to(device, non_blocking=non_blocking)
+
+class DevicePrefetcher:
+    """
+    Iterates a loader while a background thread moves the next batches to device.
+
+    On CUDA the copies are issued with non_blocking=True on a side stream, so
+    with a pinned-memory loader they overlap the current step's compute. On
+    other devices the thread still takes collation off the training thread.
+    wait_time accumulates the seconds the consumer spent blocked on a batch.
+    """
+    _END = object()
+
+    def __init__(self, loader, device, depth: int = 2):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.depth = depth
+        self.wait_time = 0.0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _produce(self, out: queue.Queue, stop: threading.Event):
+        stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+        try:
+            for batch in self.loader:
+                event = None
+                if stream is not None:
+                    with torch.cuda.stream(stream):
+                        batch = _to_device(batch, self.device, non_blocking=True)
+                        event = torch.cuda.Event()
+                        event.record(stream)
+                else:
+                    batch = _to_device(batch, self.device)
+                item = (batch, event)
+                while not stop.is_set():
+                    try:
+                        out.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            out.put(e)
+            return
+        out.put(self._END)
+
+    def __iter__(self):
+        out = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(out, stop), daemon=True)
+        thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = out.get()
+                self.wait_time += time.perf_counter() - start
+                if item is self._END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                batch, event = item
+                if event is not None:
+                    current = torch.cuda.current_stream(self.device)
+                    current.wait_event(event)
+                    # Keep the side-stream allocations alive until this step is done with them
+                    for t in (batch if isinstance(batch, (list, tuple)) else [batch]):
+                        t.record_stream(current)
+                yield batch
+        finally:
+            stop.set()
+            while thread.is_alive():
+                try:
+                    out.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
 def get_dataloaders(
     train_src: str, train_trg: str, 
     test_src: str, test_trg: str,
     batch_size: int,
-    min_freq: int = 2
+    min_freq: int = 2,
+    num_workers: int = 0,
+    prefetch_factor: int = 2,
+    persistent_workers: bool = False,
+    pin_memory: bool = False,
+    distributed: bool = False,
+    cache_path: str = None,
+    split_file: str = None,
+    bucket_batches: bool = False,
+    curriculum_epochs: int = 0,
+    curriculum_start: float = 0.2,
+    seed: int = 42
 ):
-    # Build tokenizers
-    src_tokenizer = Tokenizer(min_freq=min_freq)
-    trg_tokenizer = Tokenizer(min_freq=min_freq)
-    
-    with open(train_src, 'r') as f: src_texts = f.readlines()
-    with open(train_trg, 'r') as f: trg_texts = f.readlines()
-    
-    src_tokenizer.build_vocab(src_texts)
-    trg_tokenizer.build_vocab(trg_texts)
-    
-    # Create datasets
-    full_dataset = TranslationDataset(train_src, train_trg, src_tokenizer, trg_tokenizer)
-    
-    # Split train/val (20% val)
-    val_size = int(0.2 * len(full_dataset))
-    train_size = len(full_dataset) - val_size
-    train_dataset, val_dataset = torch.utils.data.random_split(full_dataset, [train_size, val_size])
+    if cache_path is not None:
+        # Pre-tokenized splits, built on first use and shared by every run that reads them
+        if not os.path.exists(cache_path):
+            build_translation_cache(train_src, train_trg, test_src, test_trg, cache_path, min_freq)
+        cache = _load_data_cache(cache_path, {
+            'train': [train_src, train_trg], 'test': [test_src, test_trg], 'min_freq': min_freq
+        })
+        src_tokenizer, trg_tokenizer = cache['src_tokenizer'], cache['trg_tokenizer']
+        full_dataset = TokenizedDataset(*cache['train'])
+        test_dataset = TokenizedDataset(*cache['test'])
+    else:
+        # Build tokenizers
+        src_tokenizer = Tokenizer(min_freq=min_freq)
+        trg_tokenizer = Tokenizer(min_freq=min_freq)
+        
+        with open(train_src, 'r') as f: src_texts = f.readlines()
+        with open(train_trg, 'r') as f: trg_texts = f.readlines()
+        
+        src_tokenizer.build_vocab(src_texts)
+        trg_tokenizer.build_vocab(trg_texts)
+        
+        # Create datasets
+        full_dataset = TranslationDataset(train_src, train_trg, src_tokenizer, trg_tokenizer)
+        test_dataset = TranslationDataset(test_src, test_trg, src_tokenizer, trg_tokenizer)
     
-    test_dataset = TranslationDataset(test_src, test_trg, src_tokenizer, trg_tokenizer)
+    # Split train/val (20% val), persisted to split_file when given
+    train_indices, val_indices = split_indices(len(full_dataset), 0.2, split_file, seed=seed)
+    train_dataset, val_dataset = Subset(full_dataset, train_indices), Subset(full_dataset, val_indices)
     
     # Create loaders
-    train_loader = DataLoader(
-        train_dataset, batch_size=batch_size, shuffle=True, 
-        collate_fn=lambda x: collate_fn_translation(x, src_tokenizer.pad_token_id)
-    )
-    val_loader = DataLoader(
-        val_dataset, batch_size=batch_size, shuffle=False, 
-        collate_fn=lambda x: collate_fn_translation(x, src_tokenizer.pad_token_id)
+    collate = TranslationCollator(src_tokenizer.pad_token_id)
+    loader_kwargs = _loader_kwargs(num_workers, prefetch_factor, persistent_workers, pin_memory)
+    if bucket_batches or curriculum_epochs:
+        # Length-bucketed and/or length-curriculum batches (LengthCurriculumBatchSampler)
+        train_loader = _make_length_loader(
+            train_dataset, batch_size, curriculum_epochs, curriculum_start, bucket_batches,
+            distributed=distributed, seed=seed, collate_fn=collate, **loader_kwargs
+        )
+    else:
+        train_loader = _make_loader(
+            train_dataset, batch_size, shuffle=True, distributed=distributed, seed=seed,
+            collate_fn=collate, **loader_kwargs
+        )
+    val_loader = _make_loader(
+        val_dataset, batch_size, shuffle=False, distributed=distributed,
+        collate_fn=collate, **loader_kwargs
     )
-    test_loader = DataLoader(
-        test_dataset, batch_size=batch_size, shuffle=False, 
-        collate_fn=lambda x: collate_fn_translation(x, src_tokenizer.pad_token_id)
+    test_loader = _make_loader(
+        test_dataset, batch_size, shuffle=False, distributed=distributed,
+        collate_fn=collate, **loader_kwargs
     )
     
     return train_loader, val_loader, test_loader, src_tokenizer, trg_tokenizer
@@ -161,7 +789,22 @@ def get_generation_dataloaders(
     test_path: str = None, 
     batch_size: int = 16,
     min_freq: int = 2,
-    use_validation_split: bool = True
+    use_validation_split: bool = True,
+    pack_sequences: bool = False,
+    block_size: int = 128,
+    streaming: bool = False,
+    shuffle_buffer: int = 10000,
+    seed: int = 42,
+    num_workers: int = 0,
+    prefetch_factor: int = 2,
+    persistent_workers: bool = False,
+    pin_memory: bool = False,
+    distributed: bool = False,
+    cache_path: str = None,
+    split_file: str = None,
+    bucket_batches: bool = False,
+    curriculum_epochs: int = 0,
+    curriculum_start: float = 0.2
 ):
     """
     Get dataloaders for generation task.
@@ -173,24 +816,73 @@ def get_generation_dataloaders(
         batch_size: Batch size
         min_freq: Minimum frequency for vocabulary
         use_validation_split: If True and dev_path is None, split train data 80/20
+        pack_sequences: If True, the train loader yields packed blocks
+            (see PackedGenerationDataset) instead of padded batches.
+            Validation and test loaders stay padded.
+        block_size: Row length when packing
+        streaming: If True, read the corpora lazily with
+            StreamingGenerationDataset. The validation split (when dev_path
+            is None) is every 5th training line instead of a random 20%.
+        shuffle_buffer: Shuffle buffer size for the streaming train set
+        seed: Shuffle seed of the train loader (and of the streaming train set)
+        num_workers: DataLoader worker processes (0 loads in the main process)
+        prefetch_factor: Batches each worker loads ahead
+        persistent_workers: Keep workers alive between epochs. Ignored for
+            the streaming train set, whose workers must pick up set_epoch().
+        pin_memory: Return batches in pinned memory for faster device copies
+        distributed: Give each torch.distributed rank its own shard of every
+            split (ResumableSampler, or rank sharding when streaming)
+        cache_path: Optional pre-tokenized data cache (see
+            build_generation_cache), built on first use. Ignored when streaming.
+        split_file: Optional JSON file persisting the train/validation split
+            indices (see split_indices). Ignored when streaming.
+        bucket_batches: Batch training sentences of similar length together
+            (see LengthCurriculumBatchSampler)
+        curriculum_epochs: Epochs over which the admissible training
+            sentence length widens to the full corpus (0 disables)
+        curriculum_start: Fraction of the shortest sentences admitted at epoch 0
     """
-    tokenizer = Tokenizer(min_freq=min_freq)
+    if (bucket_batches or curriculum_epochs) and (streaming or pack_sequences):
+        raise ValueError("bucket_batches/curriculum_epochs need padded, non-streaming batches")
     
-    with open(train_path, 'r') as f: texts = f.readlines()
-    tokenizer.build_vocab(texts)
+    cache = None
+    if cache_path is not None and not streaming:
+        if not os.path.exists(cache_path):
+            build_generation_cache(train_path, dev_path, test_path, cache_path, min_freq)
+        cache = _load_data_cache(cache_path, {
+            'train': train_path, 'dev': dev_path, 'test': test_path, 'min_freq': min_freq
+        })
+        tokenizer = cache['tokenizer']
+    else:
+        tokenizer = Tokenizer(min_freq=min_freq)
+        tokenizer.build_vocab(iter_corpus_lines(train_path))
     
-    full_dataset = GenerationDataset(train_path, tokenizer)
+    collate = GenerationCollator(tokenizer.pad_token_id)
+    loader_kwargs = _loader_kwargs(num_workers, prefetch_factor, persistent_workers, pin_memory)
+    
+    if streaming:
+        return _get_streaming_generation_dataloaders(
+            train_path, dev_path, test_path, tokenizer, batch_size,
+            use_validation_split, pack_sequences, block_size, shuffle_buffer, seed,
+            collate, loader_kwargs
+        )
+    
+    def load_split(path, split):
+        if cache is not None:
+            return TokenizedDataset(*cache[split])
+        return GenerationDataset(path, tokenizer)
+    
+    full_dataset = load_split(train_path, 'train')
     
     # Handle dev set
     if dev_path is not None:
         # Use provided dev set
         train_dataset = full_dataset
-        val_dataset = GenerationDataset(dev_path, tokenizer)
+        val_dataset = load_split(dev_path, 'dev')
     elif use_validation_split:
         # Split train data
-        val_size = int(0.2 * len(full_dataset))
-        train_size = len(full_dataset) - val_size
-        train_dataset, val_dataset = torch.utils.data.random_split(full_dataset, [train_size, val_size])
+        train_indices, val_indices = split_indices(len(full_dataset), 0.2, split_file, seed=seed)
+        train_dataset, val_dataset = Subset(full_dataset, train_indices), Subset(full_dataset, val_indices)
     else:
         # No validation
         train_dataset = full_dataset
@@ -198,28 +890,75 @@ def get_generation_dataloaders(
     
     # Handle test set
     if test_path is not None:
-        test_dataset = GenerationDataset(test_path, tokenizer)
+        test_dataset = load_split(test_path, 'test')
     else:
         test_dataset = None
     
-    train_loader = DataLoader(
-        train_dataset, batch_size=batch_size, shuffle=True, 
-        collate_fn=lambda x: collate_fn_generation(x, tokenizer.pad_token_id)
-    )
+    if pack_sequences:
+        train_dataset = PackedGenerationDataset(train_dataset, block_size, tokenizer.pad_token_id)
+        train_loader = _make_loader(train_dataset, batch_size, shuffle=True, distributed=distributed, seed=seed, **loader_kwargs)
+    elif bucket_batches or curriculum_epochs:
+        train_loader = _make_length_loader(
+            train_dataset, batch_size, curriculum_epochs, curriculum_start, bucket_batches,
+            distributed=distributed, seed=seed, collate_fn=collate, **loader_kwargs
+        )
+    else:
+        train_loader = _make_loader(
+            train_dataset, batch_size, shuffle=True, distributed=distributed, seed=seed,
+            collate_fn=collate, **loader_kwargs
+        )
     
     val_loader = None
     if val_dataset is not None:
-        val_loader = DataLoader(
-            val_dataset, batch_size=batch_size, shuffle=False, 
-            collate_fn=lambda x: collate_fn_generation(x, tokenizer.pad_token_id)
+        val_loader = _make_loader(
+            val_dataset, batch_size, shuffle=False, distributed=distributed,
+            collate_fn=collate, **loader_kwargs
         )
     
     test_loader = None
     if test_dataset is not None:
-        test_loader = DataLoader(
-            test_dataset, batch_size=batch_size, shuffle=False, 
-            collate_fn=lambda x: collate_fn_generation(x, tokenizer.pad_token_id)
+        test_loader = _make_loader(
+            test_dataset, batch_size, shuffle=False, distributed=distributed,
+            collate_fn=collate, **loader_kwargs
         )
     
     return train_loader, val_loader, test_loader, tokenizer
 
+
+def _get_streaming_generation_dataloaders(
+    train_path, dev_path, test_path, tokenizer, batch_size,
+    use_validation_split, pack_sequences, block_size, shuffle_buffer, seed,
+    collate, loader_kwargs
+):
+    holdout_every = 5 if dev_path is None and use_validation_split else 0
+    train_loader_kwargs = dict(loader_kwargs)
+    if 'persistent_workers' in train_loader_kwargs:
+        train_loader_kwargs['persistent_workers'] = False
+    
+    train_dataset = StreamingGenerationDataset(
+        train_path, tokenizer, shuffle_buffer=shuffle_buffer, seed=seed,
+        holdout_every=holdout_every, split='train',
+        block_size=block_size if pack_sequences else None
+    )
+    train_loader = DataLoader(
+        train_dataset, batch_size=batch_size,
+        collate_fn=None if pack_sequences else collate, **train_loader_kwargs
+    )
+    
+    val_loader = None
+    if dev_path is not None:
+        val_dataset = StreamingGenerationDataset(dev_path, tokenizer, shuffle_buffer=0)
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, collate_fn=collate, **loader_kwargs)
+    elif holdout_every:
+        val_dataset = StreamingGenerationDataset(
+            train_path, tokenizer, shuffle_buffer=0,
+            holdout_every=holdout_every, split='val'
+        )
+        val_loader = DataLoader(val_dataset, batch_size=batch_size, collate_fn=collate, **loader_kwargs)
+    
+    test_loader = None
+    if test_path is not None:
+        test_dataset = StreamingGenerationDataset(test_path, tokenizer, shuffle_buffer=0)
+        test_loader = DataLoader(test_dataset, batch_size=batch_size, collate_fn=collate, **loader_kwargs)
+    
+    return train_loader, val_loader, test_loader, tokenizer
@@ -1,62 +1,123 @@
 import torch
 import torch.nn as nn
-import torch.optim as optim
-import wandb
 import argparse
 import os
+import time
+from contextlib import nullcontext
 from tqdm import tqdm
-from model import make_lm_model
-from text_data import get_generation_dataloaders
-from utils import set_seed, save_checkpoint
+from metrics import TrainingMonitor, make_metrics_logger, LOG_BACKENDS
+from model import make_lm_model, set_activation_checkpointing
+from text_data import get_generation_dataloaders, DevicePrefetcher, seek_loader, subset_loader
+from torch.nn.parallel import DistributedDataParallel as DDP
+from utils import (
+    set_seed, setup_distributed, cleanup_distributed, is_main_process, reduce_dict,
+    unwrap_model, accumulation_step, loader_length, gather_rng_states, restore_rng_states,
+    CheckpointManager, find_latest_checkpoint, make_optimizer, make_noam_scheduler, optimizer_state_dict,
+    OPTIMIZER_IMPLS
+)
 from itertools import islice
 
-def train_epoch(model, loader, optimizer, criterion, device, clip=1.0):
+def make_packed_mask(segment_ids):
+    """Causal mask that is block-diagonal over the documents packed in each row."""
+    size = segment_ids.size(1)
+    causal = torch.tril(torch.ones(size, size, dtype=torch.bool, device=segment_ids.device))
+    same_doc = segment_ids.unsqueeze(2) == segment_ids.unsqueeze(1)
+    return (same_doc & causal).unsqueeze(1) # (batch, 1, seq_len, seq_len)
+
+def train_epoch(model, loader, optimizer, criterion, device, monitor, clip=1.0, grad_accum=1,
+                start_batch=0, on_update=None):
+    """
+    Train for one epoch, stepping the optimizer every grad_accum micro-batches.
+    
+    Loss and token counts are accumulated on-device by the monitor, so nothing
+    in the loop waits on the device except the monitor's periodic metric windows.
+    
+    start_batch resumes the epoch after that many batches; on_update is
+    called with the number of batches done after every optimizer step.
+    """
     model.train()
-    epoch_loss = 0
+    # The sampler seeks past batches already trained on; loaders without a
+    # ResumableSampler are fast-forwarded by iterating instead
+    skip = seek_loader(loader, start_batch)
+    num_batches = loader_length(loader)
+    if num_batches is not None and not skip:
+        num_batches += start_batch
+    batches = iter(loader)
+    for _ in range(skip):
+        next(batches, None)
+    optimizer.zero_grad()
+    monitor.start_epoch()
+    # Clip with one multi-tensor norm over all gradients where supported
+    params = [p for p in model.parameters() if p.requires_grad]
+    foreach = True if torch.device(device).type == 'cuda' else None
     
-    for i, batch in enumerate(tqdm(loader, desc="Training")):
-        batch = batch.to(device)
-        
-        # Input: <sos> ... <last_token>
-        # Target: <first_token> ... <eos>
-        
-        input_seq = batch[:, :-1]
-        target_seq = batch[:, 1:]
-        
-        # Causal mask
-        size = input_seq.size(1)
-        mask = torch.triu(torch.ones(size, size), diagonal=1).type_as(input_seq).unsqueeze(0).unsqueeze(0) == 0
-        # Also pad mask?
-        # Standard mask in Transformer handles both causal and padding if we combine them
-        # But here we just use causal mask for simplicity as padding is handled by loss ignore_index
-        # Actually we should mask padding positions too to avoid attention to pads
-        pad_mask = (input_seq != 0).unsqueeze(1).unsqueeze(2)
-        mask = mask & pad_mask
-        
-        optimizer.zero_grad()
-        
-        output = model(input_seq, mask)
-        
-        output_dim = output.shape[-1]
-        output = output.contiguous().view(-1, output_dim)
-        target_seq = target_seq.contiguous().view(-1)
-        
-        loss = criterion(output, target_seq)
-        loss.backward()
-        
-        torch.nn.utils.clip_grad_norm_(model.parameters(), clip)
-        optimizer.step()
-        
-        epoch_loss += loss.item()
-        
-    return epoch_loss / len(loader)
+    # Streaming shards can differ in length across ranks; join() lets DDP
+    # ranks that run out of batches shadow the collectives of the others
+    join = model.join() if isinstance(model, DDP) else nullcontext()
+    with join:
+        progress = tqdm(batches, desc="Training", total=num_batches, initial=start_batch, disable=not is_main_process())
+        for i, batch in enumerate(progress, start=start_batch):
+            monitor.batch_ready()
+            if isinstance(batch, (list, tuple)):
+                # Packed rows: targets are pre-shifted and pads are already 0 in
+                # target_seq, so ignore_index=0 keeps the per-token loss identical
+                input_seq, target_seq, positions, segment_ids = [t.to(device) for t in batch]
+                mask = make_packed_mask(segment_ids)
+            else:
+                batch = batch.to(device)
+                
+                # Input: <sos> ... <last_token>
+                # Target: <first_token> ... <eos>
+                
+                input_seq = batch[:, :-1]
+                target_seq = batch[:, 1:]
+                positions = None
+                
+                # Causal mask
+                size = input_seq.size(1)
+                mask = torch.triu(torch.ones(size, size), diagonal=1).type_as(input_seq).unsqueeze(0).unsqueeze(0) == 0
+                # Also pad mask?
+                # Standard mask in Transformer handles both causal and padding if we combine them
+                # But here we just use causal mask for simplicity as padding is handled by loss ignore_index
+                # Actually we should mask padding positions too to avoid attention to pads
+                pad_mask = (input_seq != 0).unsqueeze(1).unsqueeze(2)
+                mask = mask & pad_mask
+            
+            group_size, is_update = accumulation_step(i, grad_accum, num_batches)
+            # Only all-reduce gradients on the micro-batch that steps the optimizer
+            sync = model.no_sync() if isinstance(model, DDP) and not is_update else nullcontext()
+            
+            with sync:
+                with monitor.phase('forward'):
+                    output = model(input_seq, mask, positions)
+                    
+                    output_dim = output.shape[-1]
+                    output = output.contiguous().view(-1, output_dim)
+                    target_seq = target_seq.contiguous().view(-1)
+                    
+                    loss = criterion(output, target_seq)
+                with monitor.phase('backward'):
+                    (loss / group_size).backward()
+            
+            if is_update:
+                with monitor.phase('optimizer'):
+                    torch.nn.utils.clip_grad_norm_(params, clip, foreach=foreach)
+                    optimizer.step()
+                    optimizer.zero_grad()
+            
+            monitor.step_end(loss, (target_seq != 0).sum(), target_seq.numel())
+            if is_update and on_update is not None:
+                on_update(i + 1)
+    
+    return monitor.epoch_summary()
 
 def evaluate(model, loader, criterion, device):
     model.eval()
     epoch_loss = 0
+    n_batches = 0
     
     with torch.no_grad():
-        for i, batch in enumerate(tqdm(loader, desc="Evaluating")):
+        for i, batch in enumerate(tqdm(loader, desc="Evaluating", disable=not is_main_process())):
             batch = batch.to(device)
             
             input_seq = batch[:, :-1]
@@ -74,9 +135,11 @@ def evaluate(model, loader, criterion, device):
             target_seq = target_seq.contiguous().view(-1)
             
             loss = criterion(output, target_seq)
-            epoch_loss += loss.item()
-            
-    return epoch_loss / len(loader)
+            epoch_loss += loss.detach()
+            n_batches += 1
+    
+    # One host sync for the whole pass
+    return float(epoch_loss) / max(n_batches, 1)
 
 def main():
     parser = argparse.ArgumentParser()
@@ -94,34 +157,145 @@ def main():
     parser.add_argument('--seed', type=int, default=42)
     parser.add_argument('--project_name', type=str, default="transformer-shona-generation")
     parser.add_argument('--run_name', type=str, default="gen-run-1")
+    parser.add_argument('--pack_sequences', action='store_true',
+                        help='Concatenate sentences into fixed-length blocks instead of padding each batch')
+    parser.add_argument('--block_size', type=int, default=128)
+    parser.add_argument('--streaming', action='store_true',
+                        help='Read the corpus lazily instead of loading it into memory')
+    parser.add_argument('--shuffle_buffer', type=int, default=10000)
+    parser.add_argument('--num_workers', type=int, default=0)
+    parser.add_argument('--prefetch_factor', type=int, default=2)
+    parser.add_argument('--persistent_workers', action='store_true')
+    parser.add_argument('--distributed', action='store_true',
+                        help='DistributedDataParallel training; launch with torchrun --nproc_per_node=N')
+    parser.add_argument('--dist_backend', type=str, default=None,
+                        help='torch.distributed backend (default: nccl with CUDA, else gloo)')
+    parser.add_argument('--grad_accum', type=int, default=1,
+                        help='Micro-batches per optimizer step (effective batch = batch_size * grad_accum)')
+    parser.add_argument('--weight_decay', type=float, default=0.0,
+                        help='AdamW weight decay; 0 matches plain Adam (biases and LayerNorm weights are never decayed)')
+    parser.add_argument('--optimizer_impl', type=str, choices=OPTIMIZER_IMPLS, default='auto',
+                        help="AdamW kernels: 'auto' uses fused on CUDA and PyTorch's default elsewhere")
+    parser.add_argument('--zero', action='store_true',
+                        help='With --distributed, shard optimizer state across ranks (ZeroRedundancyOptimizer)')
+    parser.add_argument('--lr_schedule', type=str, choices=['constant', 'noam'], default='constant',
+                        help="'noam': linear warmup to --lr over --warmup_steps, then 1/sqrt(step) decay")
+    parser.add_argument('--warmup_steps', type=int, default=4000, help='Noam warmup, in optimizer steps')
+    parser.add_argument('--checkpoint_activations', action='store_true',
+                        help='Recompute decoder layer activations in backward to save memory')
+    parser.add_argument('--compile', action='store_true', help='torch.compile the model for training')
+    parser.add_argument('--resume', type=str, nargs='?', const='latest', default=None,
+                        help="Resume from a checkpoint path, or this run's latest periodic checkpoint if no path is given")
+    parser.add_argument('--checkpoint_every', type=int, default=0,
+                        help='Write a resumable checkpoint every N optimizer steps and at each epoch end (0 disables)')
+    parser.add_argument('--keep_last', type=int, default=3, help='Periodic checkpoints to keep')
+    parser.add_argument('--log_every', type=int, default=50, help='Steps per logged metrics window')
+    parser.add_argument('--sample_every', type=int, default=10,
+                        help='Time forward/backward/optimizer phases every N steps (0 disables)')
+    parser.add_argument('--log_backends', type=str, nargs='+', choices=LOG_BACKENDS, default=['jsonl', 'wandb-offline'],
+                        help="Metric sinks; 'wandb' logs online, 'wandb-offline' keeps the run local for `wandb sync`")
+    parser.add_argument('--log_dir', type=str, default='logs', help='Directory for JSONL and TensorBoard logs')
+    parser.add_argument('--metrics_file', type=str, default=None, help='JSONL metrics path (default: <log_dir>/<run_name>.metrics.jsonl)')
+    parser.add_argument('--data_cache', type=str, default=None,
+                        help='Pre-tokenized data cache to read (built on first use), shared across runs')
+    parser.add_argument('--prepare_data', action='store_true', help='Only build --data_cache, then exit')
+    parser.add_argument('--split_file', type=str, default=None,
+                        help='Train/validation split indices, created on first use (default: splits/<train file>.json)')
+    parser.add_argument('--bucket_batches', action='store_true',
+                        help='Batch training sentences of similar length together to cut padding')
+    parser.add_argument('--curriculum_epochs', type=int, default=0,
+                        help='Widen the admissible training sentence length from short to all over N epochs (0 disables)')
+    parser.add_argument('--curriculum_start', type=float, default=0.2,
+                        help='Shortest fraction of training sentences admitted in the first epoch')
+    parser.add_argument('--val_every', type=int, default=0,
+                        help='Also validate every N optimizer steps (0: only at the end of each epoch)')
+    parser.add_argument('--val_subset', type=int, default=0,
+                        help='Validate on this many fixed validation examples, with a full pass only when they improve (0: always full)')
     parser.add_argument('--debug', action='store_true')
     args = parser.parse_args()
-
+    
+    rank, world_size, local_rank = 0, 1, 0
+    if args.distributed:
+        rank, world_size, local_rank = setup_distributed(args.dist_backend)
+    
+    # Same seed on every rank so random_split and model init agree
     set_seed(args.seed)
     
     from dotenv import load_dotenv
     load_dotenv(".env.local")
     
-    wandb.init(project=args.project_name, name=args.run_name, config=args)
+    # Metrics are written by a background thread, and only from rank 0
+    backends = list(args.log_backends) if is_main_process() else []
+    if args.metrics_file and 'jsonl' not in backends and is_main_process():
+        backends.append('jsonl')
+    metrics_logger = make_metrics_logger(
+        backends, args.run_name, log_dir=args.log_dir, project=args.project_name,
+        config=vars(args), jsonl_path=args.metrics_file, resume=args.resume is not None
+    )
     
-    device = torch.device('cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu')
-    print(f"Using device: {device}")
+    if args.distributed and torch.cuda.is_available():
+        device = torch.device('cuda', local_rank)
+    elif args.distributed:
+        device = torch.device('cpu')
+    else:
+        device = torch.device('cuda' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu')
+    if is_main_process():
+        print(f"Using device: {device} (world size {world_size})")
     
     # Data
+    split_file = args.split_file or os.path.join('splits', f"{os.path.splitext(os.path.basename(args.train_path))[0]}.json")
     train_loader, val_loader, test_loader, tokenizer = get_generation_dataloaders(
         args.train_path, 
         dev_path=args.dev_path,
         test_path=args.test_path,
         batch_size=args.batch_size,
-        use_validation_split=(args.dev_path is None)
+        use_validation_split=(args.dev_path is None),
+        pack_sequences=args.pack_sequences,
+        block_size=args.block_size,
+        streaming=args.streaming,
+        shuffle_buffer=args.shuffle_buffer,
+        seed=args.seed,
+        num_workers=args.num_workers,
+        prefetch_factor=args.prefetch_factor,
+        persistent_workers=args.persistent_workers,
+        pin_memory=(device.type == 'cuda'),
+        distributed=args.distributed,
+        cache_path=args.data_cache,
+        split_file=split_file,
+        bucket_batches=args.bucket_batches,
+        curriculum_epochs=args.curriculum_epochs,
+        curriculum_start=args.curriculum_start
     )
     
+    if args.prepare_data:
+        print(f"Data cache ready at {args.data_cache}")
+        metrics_logger.close()
+        cleanup_distributed()
+        return
+    
+    # The split is persisted, so the first val_subset examples are a fixed random subset
+    val_subset_loader = subset_loader(val_loader, args.val_subset, args.distributed) if args.val_subset else None
+    if args.val_every and args.streaming and args.distributed:
+        # Streaming shards end at different steps, so mid-epoch evaluation
+        # collectives could pair up with a rank that has already joined
+        print("--val_every is ignored for distributed streaming; validating at epoch end only")
+        args.val_every = 0
+    # Mid-epoch checkpoints gather RNG (and ZeRO optimizer) state across ranks, so they
+    # have the same problem; checkpoints are then written at epoch end only
+    checkpoint_steps = args.checkpoint_every
+    if checkpoint_steps and args.streaming and args.distributed:
+        print("--checkpoint_every is ignored mid-epoch for distributed streaming; checkpointing at epoch end only")
+        checkpoint_steps = 0
+    
     if args.debug:
         print("Debug mode: using small subset of data")
         args.epochs = 2
         train_loader = list(islice(train_loader, 2))
         val_loader = list(islice(val_loader, 2))
     
+    # Overlap batch loading and host-to-device copies with compute
+    train_loader = DevicePrefetcher(train_loader, device)
+    
     vocab_size = len(tokenizer)
     print(f"Vocab Size: {vocab_size}")
     
@@ -131,33 +305,154 @@ def main():
         N=args.n_layers, d_model=args.d_model, h=args.heads, dropout=args.dropout
     ).to(device)
     
-    optimizer = optim.Adam(model.parameters(), lr=args.lr, betas=(0.9, 0.98), eps=1e-9)
+    if args.checkpoint_activations:
+        set_activation_checkpointing(model)
+    if args.compile:
+        # Padded batches vary in length, so avoid recompiling per shape
+        model = torch.compile(model, dynamic=True)
+    if args.distributed:
+        # Wrap last so the training loop can reach DDP's no_sync()/join()
+        model = DDP(model, device_ids=[local_rank] if device.type == 'cuda' else None)
+    
+    optimizer = make_optimizer(
+        model, args.lr, weight_decay=args.weight_decay, impl=args.optimizer_impl,
+        zero=args.zero and args.distributed
+    )
+    scheduler = make_noam_scheduler(optimizer, args.warmup_steps) if args.lr_schedule == 'noam' else None
     criterion = nn.CrossEntropyLoss(ignore_index=0, label_smoothing=args.label_smoothing)
     
-    best_valid_loss = float('inf')
+    monitor = TrainingMonitor(device, [metrics_logger], log_every=args.log_every, sample_every=args.sample_every)
+    
+    best_valid_loss = best_subset_loss = float('inf')
+    start_epoch, start_batch, global_step = 0, 0, 0
+    checkpointer = CheckpointManager("checkpoints", args.run_name, keep_last=args.keep_last)
     
-    for epoch in range(args.epochs):
-        train_loss = train_epoch(model, train_loader, optimizer, criterion, device)
+    resume_path = args.resume
+    if resume_path == 'latest':
+        resume_path = find_latest_checkpoint("checkpoints", args.run_name)
+        if resume_path is None and is_main_process():
+            print(f"No checkpoint found for {args.run_name}, starting from scratch")
+    resume_state = None
+    if resume_path:
+        resume_state = torch.load(resume_path, map_location='cpu', weights_only=False)
+        unwrap_model(model).load_state_dict(resume_state['state_dict'])
+        optimizer.load_state_dict(resume_state['optimizer'])
+        if scheduler is not None and resume_state.get('scheduler') is not None:
+            scheduler.load_state_dict(resume_state['scheduler'])
+        start_epoch, start_batch = resume_state['epoch'], resume_state['batch']
+        global_step = resume_state['global_step']
+        best_valid_loss = resume_state['best_valid_loss']
+        best_subset_loss = resume_state.get('best_subset_loss', float('inf'))
+        if is_main_process():
+            print(f"Resuming from {resume_path} (epoch {start_epoch + 1}, batch {start_batch})")
+    
+    def training_state(epoch, batch):
+        # Everything needed to continue exactly where training stopped.
+        # Call on every rank: a sharded optimizer is gathered onto rank 0
+        return {
+            'epoch': epoch,
+            'batch': batch,
+            'global_step': global_step,
+            'state_dict': unwrap_model(model).state_dict(),
+            'optimizer': optimizer_state_dict(optimizer),
+            'scheduler': scheduler.state_dict() if scheduler is not None else None,
+            'rng': gather_rng_states(),
+            'best_valid_loss': best_valid_loss,
+            'best_subset_loss': best_subset_loss,
+        }
+    
+    def validate():
+        """
+        Scheduled validation. With --val_subset, score the subset first and
+        run the full pass only if the subset loss improved; the best
+        checkpoint is always chosen by full-pass loss. Returns the metrics,
+        with valid_loss only when the full pass ran.
+        """
+        nonlocal best_valid_loss, best_subset_loss
+        results = {}
+        if val_subset_loader is not None:
+            results = reduce_dict({'val_subset_loss': evaluate(model, val_subset_loader, criterion, device)}, device=device)
+            improved = results['val_subset_loss'] < best_subset_loss
+            best_subset_loss = min(best_subset_loss, results['val_subset_loss'])
+            if not improved:
+                return results
+        
         valid_loss = evaluate(model, val_loader, criterion, device)
+        results['valid_loss'] = valid_loss = reduce_dict({'valid_loss': valid_loss}, device=device)['valid_loss']
+        if valid_loss < best_valid_loss:
+            best_valid_loss = valid_loss
+            best_state = {
+                'epoch': epoch + 1,
+                'state_dict': unwrap_model(model).state_dict(),
+                'optimizer': optimizer_state_dict(optimizer),
+                'loss': valid_loss,
+            }
+            if is_main_process():
+                checkpointer.save(best_state, tag="best")
+        return results
+    
+    def on_update(batches_done):
+        nonlocal global_step
+        global_step += 1
+        if scheduler is not None:
+            scheduler.step()
+        if args.val_every and global_step % args.val_every == 0:
+            metrics_logger.write({**validate(), 'optimizer_step': global_step, 'elapsed_sec': time.perf_counter() - train_start})
+            model.train()
+        if checkpoint_steps and global_step % checkpoint_steps == 0:
+            state = training_state(epoch, batches_done)
+            if is_main_process():
+                checkpointer.save(state, step=global_step)
+    
+    # Restore RNG last, after model init and data setup have drawn from it
+    if resume_state is not None:
+        restore_rng_states(resume_state['rng'])
+    
+    train_start = time.perf_counter()
+    for epoch in range(start_epoch, args.epochs):
+        # Streaming datasets and the train (batch) sampler reshuffle per epoch
+        train_sources = ('dataset', 'sampler', 'batch_sampler')
+        for source in (getattr(train_loader.loader, name, None) for name in train_sources):
+            if hasattr(source, 'set_epoch'):
+                source.set_epoch(epoch)
+        
+        train_loss, train_stats = train_epoch(
+            model, train_loader, optimizer, criterion, device, monitor, grad_accum=args.grad_accum,
+            start_batch=start_batch if epoch == start_epoch else 0, on_update=on_update
+        )
+        val_results = validate()
+        
+        # Losses and data wait are averaged over ranks, throughput is summed
+        tokens_per_sec = reduce_dict({'tokens_per_sec': train_stats.pop('tokens_per_sec')}, average=False, device=device)
+        metrics = reduce_dict({'train_loss': train_loss, **train_stats}, device=device)
+        train_loss = metrics.pop('train_loss')
+        train_stats = {**metrics, **tokens_per_sec}
         
-        wandb.log({
+        # Epoch records are also what sweep.py reads to prune trials
+        metrics_logger.write({
             "train_loss": train_loss,
-            "valid_loss": valid_loss,
-            "epoch": epoch
+            **val_results,
+            **train_stats,
+            "lr": optimizer.param_groups[0]['lr'],
+            "max_train_length": getattr(getattr(train_loader.loader, 'batch_sampler', None), 'max_length', None),
+            "elapsed_sec": time.perf_counter() - train_start,
+            "epoch": epoch + 1
         })
         
-        print(f'Epoch: {epoch+1:02} | Train Loss: {train_loss:.3f} | Val. Loss: {valid_loss:.3f}')
+        if is_main_process():
+            val_summary = ' | '.join(f'{name}: {value:.3f}' for name, value in val_results.items())
+            print(f'Epoch: {epoch+1:02} | Train Loss: {train_loss:.3f} | {val_summary} | '
+                  f'Tokens/s: {train_stats["tokens_per_sec"]:.0f} | Data wait: {train_stats["data_wait_ms"]:.1f} ms/step')
         
-        if valid_loss < best_valid_loss:
-            best_valid_loss = valid_loss
-            save_checkpoint({
-                'epoch': epoch + 1,
-                'state_dict': model.state_dict(),
-                'optimizer': optimizer.state_dict(),
-                'loss': valid_loss,
-            }, filename=f"checkpoints/{args.run_name}_best.pth.tar")
-            
-    wandb.finish()
+        if args.checkpoint_every:
+            state = training_state(epoch + 1, 0)
+            if is_main_process():
+                checkpointer.save(state, step=global_step)
+    
+    checkpointer.wait()
+    # Drains the metrics queue and closes every sink
+    monitor.close()
+    cleanup_distributed()
 
 if __name__ == "__main__":
     if not os.path.exists("checkpoints"):
@@ -1,7 +1,11 @@
 import torch
+import torch.distributed as dist
 import numpy as np
 import random
+import glob
+import math
 import os
+import threading
 
 def set_seed(seed=42):
     random.seed(seed)
@@ -12,7 +16,10 @@ def set_seed(seed=42):
     torch.backends.cudnn.benchmark = False
 
 def save_checkpoint(state, filename="checkpoint.pth.tar"):
-    torch.save(state, filename)
+    # Write next to the target and rename, so a crash never leaves a torn file
+    tmp = f"{filename}.tmp"
+    torch.save(state, tmp)
+    os.replace(tmp, filename)
 
 def load_checkpoint(checkpoint, model, optimizer=None):
     model.load_state_dict(checkpoint['state_dict'])
@@ -21,3 +28,240 @@ def load_checkpoint(checkpoint, model, optimizer=None):
 
 def count_parameters(model):
     return sum(p.numel() for p in model.parameters() if p.requires_grad)
+
+def setup_distributed(backend=None):
+    """
+    Initialise torch.distributed from the environment set by torchrun
+    (RANK, WORLD_SIZE, LOCAL_RANK, MASTER_ADDR, MASTER_PORT).
+    
+    Uses NCCL when CUDA is available and gloo otherwise, so several CPU
+    processes on one box work out of the box. Returns (rank, world_size, local_rank).
+    """
+    if backend is None:
+        backend = 'nccl' if torch.cuda.is_available() else 'gloo'
+    dist.init_process_group(backend=backend)
+    local_rank = int(os.environ.get('LOCAL_RANK', 0))
+    if backend == 'nccl':
+        torch.cuda.set_device(local_rank)
+    return dist.get_rank(), dist.get_world_size(), local_rank
+
+def cleanup_distributed():
+    if dist.is_available() and dist.is_initialized():
+        dist.destroy_process_group()
+
+def is_main_process():
+    return not (dist.is_available() and dist.is_initialized()) or dist.get_rank() == 0
+
+def reduce_dict(metrics, average=True, device='cpu'):
+    """All-reduce a dict of scalar metrics across ranks (sum, or mean if average)."""
+    if not (dist.is_available() and dist.is_initialized()) or not metrics:
+        return metrics
+    keys = sorted(metrics)
+    values = torch.tensor([float(metrics[k]) for k in keys], dtype=torch.float64, device=device)
+    dist.all_reduce(values, op=dist.ReduceOp.SUM)
+    if average:
+        values /= dist.get_world_size()
+    return dict(zip(keys, values.tolist()))
+
+def unwrap_model(model):
+    """Return the underlying module of a DistributedDataParallel and/or torch.compile'd model."""
+    while hasattr(model, '_orig_mod') or hasattr(model, 'module'):
+        model = getattr(model, '_orig_mod', None) or model.module
+    return model
+
+def accumulation_step(i, grad_accum, num_batches=None):
+    """
+    Return (group_size, is_update) for micro-batch i when accumulating
+    grad_accum micro-batches per optimizer step.
+    
+    The loss of each micro-batch should be divided by group_size. When
+    num_batches is known, a shorter final group is averaged over its own
+    size and still stepped; otherwise a trailing partial group never updates.
+    """
+    group_start = (i // grad_accum) * grad_accum
+    group_size = grad_accum if num_batches is None else min(grad_accum, num_batches - group_start)
+    return group_size, i + 1 - group_start == group_size
+
+def loader_length(loader):
+    """len(loader), or None for loaders without one (e.g. streaming datasets)."""
+    try:
+        return len(loader)
+    except TypeError:
+        return None
+
+def param_groups(model, weight_decay):
+    """
+    Split trainable parameters into a decayed group (weight matrices and
+    embeddings) and an undecayed one (biases and LayerNorm weights, i.e.
+    everything with fewer than two dimensions).
+    """
+    decay, no_decay = [], []
+    for p in model.parameters():
+        if p.requires_grad:
+            (decay if p.ndim >= 2 else no_decay).append(p)
+    return [
+        {'params': decay, 'weight_decay': weight_decay},
+        {'params': no_decay, 'weight_decay': 0.0},
+    ]
+
+OPTIMIZER_IMPLS = ('auto', 'fused', 'foreach', 'for-loop')
+
+def make_optimizer(model, lr, weight_decay=0.0, betas=(0.9, 0.98), eps=1e-9, impl='auto', zero=False):
+    """
+    AdamW over param_groups(model).
+    
+    impl picks the kernel: 'fused' (one kernel for all parameters; CUDA),
+    'foreach' (multi-tensor ops), 'for-loop' (one parameter at a time), or
+    'auto' for fused on CUDA and PyTorch's default elsewhere. With zero=True
+    the optimizer state is sharded across torch.distributed ranks by
+    ZeroRedundancyOptimizer; save it with optimizer_state_dict().
+    """
+    kwargs = {'lr': lr, 'betas': betas, 'eps': eps}
+    on_cuda = next(model.parameters()).is_cuda
+    if impl == 'fused' or (impl == 'auto' and on_cuda):
+        kwargs['fused'] = True
+    elif impl == 'foreach':
+        kwargs['foreach'] = True
+    elif impl == 'for-loop':
+        kwargs['foreach'] = False
+    groups = param_groups(model, weight_decay)
+    if zero:
+        from torch.distributed.optim import ZeroRedundancyOptimizer
+        return ZeroRedundancyOptimizer(groups, optimizer_class=torch.optim.AdamW, **kwargs)
+    return torch.optim.AdamW(groups, **kwargs)
+
+def optimizer_state_dict(optimizer):
+    """
+    optimizer.state_dict(); a ZeroRedundancyOptimizer is first consolidated
+    onto rank 0. Call it on every rank; sharded optimizers return None on
+    the other ranks.
+    """
+    if hasattr(optimizer, 'consolidate_state_dict'):
+        optimizer.consolidate_state_dict(to=0)
+        return optimizer.state_dict() if is_main_process() else None
+    return optimizer.state_dict()
+
+def make_noam_scheduler(optimizer, warmup_steps=4000):
+    """
+    Noam schedule from "Attention Is All You Need": linear warmup for
+    warmup_steps optimizer steps, then decay with 1/sqrt(step).
+    
+    The original's d_model**-0.5 * warmup_steps**-0.5 scale is folded into
+    the optimizer's lr, which is reached at the end of warmup. Call
+    scheduler.step() after every optimizer step.
+    """
+    def lr_lambda(step):
+        step += 1
+        return min(step / warmup_steps, math.sqrt(warmup_steps / step))
+    return torch.optim.lr_scheduler.LambdaLR(optimizer, lr_lambda)
+
+def get_rng_state():
+    """Capture the python, numpy, torch and CUDA RNG states."""
+    state = {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state['cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+def set_rng_state(state):
+    """Restore RNG states captured by get_rng_state."""
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+def gather_rng_states():
+    """
+    RNG states of every rank, as a list indexed by rank. Each DDP rank draws
+    its own dropout stream, so all of them are needed for an exact resume.
+    Call on every rank.
+    """
+    state = get_rng_state()
+    if not (dist.is_available() and dist.is_initialized()):
+        return [state]
+    states = [None] * dist.get_world_size()
+    dist.all_gather_object(states, state)
+    return states
+
+def restore_rng_states(states):
+    """
+    Restore this rank's state from gather_rng_states. If the world size
+    changed since the checkpoint, ranks reuse the saved states round-robin
+    and the resume is no longer exact.
+    """
+    if isinstance(states, dict):
+        # Checkpoints from before per-rank states hold a single state
+        states = [states]
+    rank = dist.get_rank() if dist.is_available() and dist.is_initialized() else 0
+    set_rng_state(states[rank % len(states)])
+
+def snapshot_state(obj):
+    """Deep-copy a (nested) state dict with every tensor copied to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot_state(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_state(v) for v in obj)
+    return obj
+
+def find_latest_checkpoint(directory, prefix):
+    """Path of the newest periodic checkpoint written by CheckpointManager, or None."""
+    paths = sorted(glob.glob(os.path.join(directory, f"{prefix}_step*.pth.tar")))
+    return paths[-1] if paths else None
+
+class CheckpointManager:
+    """
+    Writes checkpoints from a background thread so training isn't blocked on disk.
+    
+    save() snapshots the state to CPU on the calling thread (so training can
+    keep mutating the live tensors) and hands it to a writer thread, which
+    saves to a temporary file and renames it into place. Periodic checkpoints
+    ("{prefix}_step{N}.pth.tar") are pruned to the newest keep_last; other
+    tags such as "best" are kept. At most one write is in flight: a new save
+    first waits for the previous one, and a failed write is re-raised there.
+    """
+    def __init__(self, directory, prefix, keep_last=3):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.keep_last = keep_last
+        self._thread = None
+        self._error = None
+    
+    def path(self, tag):
+        return os.path.join(self.directory, f"{self.prefix}_{tag}.pth.tar")
+    
+    def save(self, state, step=None, tag=None):
+        """Asynchronously save state as a periodic checkpoint for step, or under tag."""
+        assert (step is None) != (tag is None), "Pass exactly one of step or tag"
+        snapshot = snapshot_state(state)
+        self.wait()
+        path = self.path(f"step{step:08d}" if step is not None else tag)
+        self._thread = threading.Thread(target=self._write, args=(snapshot, path), daemon=True)
+        self._thread.start()
+    
+    def _write(self, snapshot, path):
+        try:
+            save_checkpoint(snapshot, path)
+            self._prune()
+        except Exception as e:
+            self._error = e
+    
+    def _prune(self):
+        paths = sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}_step*.pth.tar")))
+        for path in paths[:max(len(paths) - self.keep_last, 0)]:
+            os.remove(path)
+    
+    def wait(self):
+        """Block until the pending write (if any) is on disk."""
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error